@@ -0,0 +1,54 @@
+import argparse
+import json
+
+# Compara dois resultados de benchmarks.suite e aponta regressões.
+# Uso (a partir de src):
+#   python -m benchmarks.comparar resultados/base.json resultados/novo.json --limiar 10
+# Sai com código 1 se algum método piorou mais que o limiar (em %).
+
+
+def _variacao(antes, depois):
+    if not antes:
+        return 0.0
+    return (depois - antes) / antes * 100
+
+
+def comparar(base, novo, limiar):
+    """Retorna [(nome, modo, métrica, antes, depois, variação %, regressão?)]."""
+    linhas = []
+    for nome, modos in sorted(novo['resultados'].items()):
+        for modo, depois in sorted(modos.items()):
+            antes = base['resultados'].get(nome, {}).get(modo)
+            if antes is None:
+                continue
+            for metrica, maior_e_pior in (('ops_por_segundo', False), ('p50_ms', True), ('p99_ms', True)):
+                variacao = _variacao(antes[metrica], depois[metrica])
+                regressao = variacao > limiar if maior_e_pior else variacao < -limiar
+                linhas.append((nome, modo, metrica, antes[metrica], depois[metrica], variacao, regressao))
+    return linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dois resultados de benchmark")
+    parser.add_argument('base')
+    parser.add_argument('novo')
+    parser.add_argument('--limiar', type=float, default=10, help="variação (%%) considerada regressão")
+    args = parser.parse_args()
+
+    with open(args.base, encoding='utf-8') as arquivo:
+        base = json.load(arquivo)
+    with open(args.novo, encoding='utf-8') as arquivo:
+        novo = json.load(arquivo)
+
+    print(f"base: {base['meta'].get('commit')}  novo: {novo['meta'].get('commit')}")
+    regressoes = 0
+    for nome, modo, metrica, antes, depois, variacao, regressao in comparar(base, novo, args.limiar):
+        marca = '  <-- regressao' if regressao else ''
+        print(f"{nome:45} {modo:11} {metrica:16} {antes:10.2f} -> {depois:10.2f} ({variacao:+6.1f}%){marca}")
+        regressoes += regressao
+    print(f"{regressoes} regressoes acima de {args.limiar}%")
+    return 1 if regressoes else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
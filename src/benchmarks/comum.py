@@ -0,0 +1,42 @@
+import os
+import subprocess
+from contextlib import contextmanager, redirect_stdout
+
+# Funções compartilhadas pelos benchmarks
+
+
+def percentil(valores, p):
+    """Percentil `p` (0-100) de uma lista de valores, pelo método do vizinho mais próximo."""
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p / 100 * len(valores)))]
+
+
+def resumir(latencias, decorrido, erros=0):
+    """Vazão e latências (em ms) de uma rodada de medições."""
+    ordenadas = sorted(latencias)
+    return {
+        'operacoes': len(ordenadas),
+        'erros': erros,
+        'segundos': decorrido,
+        'ops_por_segundo': len(ordenadas) / decorrido if decorrido > 0 else 0.0,
+        'p50_ms': percentil(ordenadas, 50) * 1000,
+        'p99_ms': percentil(ordenadas, 99) * 1000,
+        'max_ms': (ordenadas[-1] if ordenadas else 0.0) * 1000,
+    }
+
+
+@contextmanager
+def silenciar():
+    # Os CRUDs imprimem uma linha por operação; durante a carga isso só atrapalha
+    with open(os.devnull, 'w') as nulo, redirect_stdout(nulo):
+        yield
+
+
+def commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,134 @@
+import argparse
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.comum import percentil, silenciar
+
+# Teste de carga da baixa de estoque (PecaCRUD.consumir_pecas) com vários workers
+# disputando as mesmas peças. Ao final confere que nenhuma baixa foi perdida:
+# estoque inicial - estoque final == soma do que foi registrado em utiliza_peca.
+# Uso (a partir de src): python -m benchmarks.consumo_pecas --workers 16 --duracao 10
+
+
+def _preparar(db, n_pecas, n_ordens, estoque):
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO peca (nome_peca, qt_estoque, valor_uni) "
+            "SELECT 'bench-' || g, %s, 10 FROM generate_series(1, %s) AS g RETURNING cod_peca;",
+            (estoque, n_pecas)
+        )
+        pecas = [linha[0] for linha in cursor.fetchall()]
+        cursor.execute("SELECT id_solicitante FROM solicitante LIMIT 1;")
+        linha = cursor.fetchone()
+        if linha is None:
+            cursor.execute("INSERT INTO solicitante DEFAULT VALUES RETURNING id_solicitante;")
+            linha = cursor.fetchone()
+        cursor.execute(
+            "INSERT INTO ordem_servico (status, data_abertura, id_solicitante) "
+            "SELECT 'bench', CURRENT_DATE, %s FROM generate_series(1, %s) RETURNING id_os;",
+            (linha[0], n_ordens)
+        )
+        ordens = [linha[0] for linha in cursor.fetchall()]
+        conn.commit()
+    return pecas, ordens
+
+
+def _conferir(db, pecas, ordens, estoque):
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COALESCE(SUM(%s - qt_estoque), 0), COUNT(*) FILTER (WHERE qt_estoque < 0) "
+            "FROM peca WHERE cod_peca = ANY(%s);",
+            (estoque, pecas)
+        )
+        baixado, negativos = cursor.fetchone()
+        cursor.execute(
+            "SELECT COALESCE(SUM(quantidade), 0) FROM utiliza_peca WHERE id_os = ANY(%s);",
+            (ordens,)
+        )
+        registrado = cursor.fetchone()[0]
+    return baixado, registrado, negativos
+
+
+def _limpar(db, pecas, ordens):
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM utiliza_peca WHERE id_os = ANY(%s);", (ordens,))
+        cursor.execute("DELETE FROM ordem_servico WHERE id_os = ANY(%s);", (ordens,))
+        cursor.execute("DELETE FROM peca WHERE cod_peca = ANY(%s);", (pecas,))
+        conn.commit()
+
+
+def _worker(crud, pecas, ordens, max_itens, fim, resultados, lock):
+    rnd = random.Random()
+    local = {'ok': 0, 'faltas': 0, 'erros': 0, 'latencias': []}
+    while time.monotonic() < fim:
+        itens = [(rnd.choice(pecas), rnd.randint(1, 3)) for _ in range(rnd.randint(1, max_itens))]
+        inicio = time.perf_counter()
+        resultado = crud.consumir_pecas(rnd.choice(ordens), itens)
+        local['latencias'].append(time.perf_counter() - inicio)
+        if resultado is None:
+            local['erros'] += 1
+        elif resultado['ok']:
+            local['ok'] += 1
+        else:
+            local['faltas'] += 1
+    with lock:
+        for chave in ('ok', 'faltas', 'erros'):
+            resultados[chave] += local[chave]
+        resultados['latencias'].extend(local['latencias'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga concorrente em PecaCRUD.consumir_pecas")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--duracao', type=float, default=10, help="segundos de carga")
+    parser.add_argument('--pecas', type=int, default=20, help="peças disputadas (menos = mais contenção)")
+    parser.add_argument('--ordens', type=int, default=200)
+    parser.add_argument('--itens', type=int, default=5, help="máximo de peças por baixa")
+    parser.add_argument('--estoque', type=int, default=100000, help="estoque inicial de cada peça")
+    args = parser.parse_args()
+
+    # Cada worker precisa de uma conexão própria do pool
+    os.environ.setdefault('DB_POOL_MAX', str(args.workers + 2))
+
+    from oficina.db import Database
+    from oficina.pecas import PecaCRUD
+
+    crud = PecaCRUD()
+    db = crud.db
+    pecas, ordens = _preparar(db, args.pecas, args.ordens, args.estoque)
+    resultados = {'ok': 0, 'faltas': 0, 'erros': 0, 'latencias': []}
+    lock = threading.Lock()
+    try:
+        with silenciar():
+            inicio = time.monotonic()
+            fim = inicio + args.duracao
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                for _ in range(args.workers):
+                    executor.submit(_worker, crud, pecas, ordens, args.itens, fim, resultados, lock)
+            decorrido = time.monotonic() - inicio
+        baixado, registrado, negativos = _conferir(db, pecas, ordens, args.estoque)
+    finally:
+        _limpar(db, pecas, ordens)
+        Database.fechar_pools()
+
+    total = resultados['ok'] + resultados['faltas'] + resultados['erros']
+    latencias = resultados['latencias']
+    print(f"workers={args.workers} pecas={args.pecas} duracao={decorrido:.1f}s")
+    print(f"baixas: {total} ({total / decorrido:.0f}/s) | ok={resultados['ok']} "
+          f"faltas={resultados['faltas']} erros={resultados['erros']}")
+    print(f"latencia p50={percentil(latencias, 50) * 1000:.2f}ms "
+          f"p99={percentil(latencias, 99) * 1000:.2f}ms")
+    consistente = baixado == registrado and negativos == 0
+    print(f"estoque baixado={baixado} registrado em utiliza_peca={registrado} "
+          f"negativos={negativos} -> {'OK' if consistente else 'INCONSISTENTE'}")
+    return 0 if consistente and resultados['erros'] == 0 else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,258 @@
+import argparse
+import time
+from datetime import date, timedelta
+
+from psycopg2 import errors
+
+from oficina.db import Database
+from oficina.particoes import GerenciadorParticoes
+from oficina.relatorios import RelatorioCRUD
+from oficina.setup import SetupDatabase
+
+# Gerador de dados sintéticos da oficina para os benchmarks.
+# Tudo é gerado no próprio servidor com generate_series, em faixas de ids
+# reservadas nas sequences, sem trafegar linhas pela rede. A escala é dada pelo
+# número de clientes; as demais tabelas seguem PROPORCOES.
+# Uso (a partir de src): python -m benchmarks.gerador --clientes 100000
+# Use um banco dedicado: as faixas de ids são reservadas sem coordenação com
+# outros processos que estejam inserindo ao mesmo tempo.
+
+PROPORCOES = {
+    'veiculos': 1.5,      # por cliente
+    'ordens': 3,          # por cliente
+    'execucoes': 1.5,     # por ordem de serviço
+    'mecanicos': 1 / 500,  # por cliente (mínimo 20)
+    'pecas': 1 / 20,      # por cliente (mínimo 500); cada OS usa 2 peças
+}
+
+NOMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Felipe', 'Gabriela', 'Heitor', 'Isabela', 'João',
+         'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sofia', 'Thiago', 'Vitória', 'Yuri']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Ferreira', 'Costa', 'Rodrigues',
+              'Almeida', 'Nascimento', 'Carvalho', 'Araújo', 'Ribeiro', 'Barbosa', 'Cavalcanti']
+RAMOS = ['Transportes', 'Logística', 'Comércio', 'Serviços', 'Distribuidora', 'Locadora']
+RUAS = ['Rua das Flores', 'Av. Boa Viagem', 'Rua do Sol', 'Av. Caxangá', 'Rua da Aurora', 'Rua Imperial']
+ESPECIALIDADES = ['Freio', 'Motor', 'Suspensão', 'Elétrica', 'Funilaria', 'Câmbio', 'Injeção']
+MARCAS = ['Fiat', 'Volkswagen', 'Chevrolet', 'Ford', 'Toyota', 'Honda', 'Hyundai', 'Renault']
+MODELOS = ['Uno', 'Gol', 'Onix', 'Ka', 'Corolla', 'Civic', 'HB20', 'Sandero', 'Argo', 'Polo']
+CORES = ['Prata', 'Preto', 'Branco', 'Vermelho', 'Cinza', 'Azul']
+COMBUSTIVEIS = ['Gasolina', 'Etanol', 'Flex', 'Diesel']
+TIPOS_MOTO = ['Street', 'Trail', 'Scooter', 'Esportiva']
+PECAS = ['Pastilha de Freio', 'Filtro de Óleo', 'Vela', 'Correia Dentada', 'Amortecedor', 'Bateria',
+         'Disco de Freio', 'Embreagem', 'Lâmpada', 'Radiador']
+
+
+def _escolher(valores, expressao):
+    # Sorteio determinístico de um valor fixo a partir de uma expressão inteira de g
+    literais = ', '.join("'" + valor.replace("'", "''") + "'" for valor in valores)
+    return f"(ARRAY[{literais}])[1 + mod({expressao}, {len(valores)})]"
+
+
+FAIXA = "generate_series(%(inicio)s::bigint, %(fim)s::bigint) AS g"
+
+# Ordens abertas nos últimos cinco anos
+DIAS_HISTORICO = 1825
+
+
+def _data_os(expressao):
+    # Data de abertura da g-ésima OS; as tabelas filhas repetem o cálculo para
+    # preencher data_abertura_os (chave de partição) sem consultar ordem_servico
+    return f"(CURRENT_DATE - mod(({expressao}) * 7919, {DIAS_HISTORICO})::int)"
+
+
+# (descrição, tabela cuja quantidade define a faixa de g, comando)
+COMANDOS = [
+    ("solicitantes dos mecanicos", 'mecanico',
+     f"INSERT INTO solicitante (id_solicitante) SELECT %(b_sol_mec)s + g FROM {FAIXA};"),
+    ("mecanicos", 'mecanico', f"""
+        INSERT INTO mecanico (matricula_mec, nome, telefone, especialidade, tipo_mecanico, id_solicitante)
+        SELECT %(b_mec)s + g, {_escolher(NOMES, 'g')} || ' ' || {_escolher(SOBRENOMES, 'g * 7')},
+               '81' || lpad(mod(g * 7919, 1000000000)::text, 9, '0'), {_escolher(ESPECIALIDADES, 'g')},
+               CASE WHEN mod(g, 3) = 0 THEN 'freelancer' ELSE 'efetivo' END, %(b_sol_mec)s + g
+        FROM {FAIXA};"""),
+    ("efetivos", 'mecanico', f"""
+        INSERT INTO efetivo (id_mecanico, salario, registro_clt)
+        SELECT %(b_mec)s + g, 2500 + mod(g * 37, 4000), 'CLT' || (%(b_mec)s + g)
+        FROM {FAIXA} WHERE mod(g, 3) <> 0;"""),
+    ("freelancers", 'mecanico', f"""
+        INSERT INTO freelancer (id_mecanico, hora_servico)
+        SELECT %(b_mec)s + g, 40 + mod(g * 11, 80)
+        FROM {FAIXA} WHERE mod(g, 3) = 0;"""),
+    ("solicitantes dos clientes", 'cliente',
+     f"INSERT INTO solicitante (id_solicitante) SELECT %(b_sol_cli)s + g FROM {FAIXA};"),
+    ("clientes", 'cliente', f"""
+        INSERT INTO cliente (id_cliente, email, telefone, endereco, id_solicitante)
+        SELECT %(b_cli)s + g, 'cliente' || (%(b_cli)s + g) || '@exemplo.com',
+               '81' || lpad(mod(g * 104729, 1000000000)::text, 9, '0'),
+               {_escolher(RUAS, 'g * 3')} || ', ' || (1 + mod(g * 31, 2000)), %(b_sol_cli)s + g
+        FROM {FAIXA};"""),
+    ("pessoas fisicas", 'cliente', f"""
+        INSERT INTO pessoa_fisica (id_cliente, cpf, nome, data_nascimento)
+        SELECT %(b_cli)s + g, lpad((%(b_cli)s + g)::text, 11, '0'),
+               {_escolher(NOMES, 'g')} || ' ' || {_escolher(SOBRENOMES, 'g * 7')} || ' ' || {_escolher(SOBRENOMES, 'g * 13')},
+               DATE '1950-01-01' + mod(g * 37, 20000)::int
+        FROM {FAIXA} WHERE mod(g, 10) <> 0;"""),
+    ("pessoas juridicas", 'cliente', f"""
+        INSERT INTO pessoa_juridica (id_cliente, cnpj, razao_social)
+        SELECT %(b_cli)s + g, lpad((%(b_cli)s + g)::text, 14, '0'),
+               {_escolher(SOBRENOMES, 'g * 7')} || ' ' || {_escolher(RAMOS, 'g')} || ' Ltda'
+        FROM {FAIXA} WHERE mod(g, 10) = 0;"""),
+    ("veiculos", 'veiculo', f"""
+        INSERT INTO veiculo (veiculo_id, marca, cor, modelo, ano, id_cliente)
+        SELECT %(b_vei)s + g, {_escolher(MARCAS, 'g')}, {_escolher(CORES, 'g * 7')},
+               {_escolher(MODELOS, 'g * 3')}, 1995 + mod(g, 30), %(b_cli)s + 1 + mod(g - 1, %(n_cliente)s)
+        FROM {FAIXA};"""),
+    ("carros", 'veiculo', f"""
+        INSERT INTO carro (veiculo_id, numero_portas, tipo_combustivel, capacidade_passageiros)
+        SELECT %(b_vei)s + g, CASE WHEN mod(g, 3) = 0 THEN 2 ELSE 4 END, {_escolher(COMBUSTIVEIS, 'g')},
+               CASE WHEN mod(g, 7) = 0 THEN 7 ELSE 5 END
+        FROM {FAIXA} WHERE mod(g, 5) <> 0;"""),
+    ("motos", 'veiculo', f"""
+        INSERT INTO moto (veiculo_id, cilindrada, tipo_moto)
+        SELECT %(b_vei)s + g, (ARRAY[125, 150, 160, 250, 300, 600, 1000])[1 + mod(g, 7)],
+               {_escolher(TIPOS_MOTO, 'g')}
+        FROM {FAIXA} WHERE mod(g, 5) = 0;"""),
+    ("pecas", 'peca', f"""
+        INSERT INTO peca (cod_peca, nome_peca, qt_estoque, valor_uni)
+        SELECT %(b_peca)s + g, {_escolher(PECAS, 'g')} || ' ' || {_escolher(MARCAS, 'g * 3')} || ' ' || g,
+               mod(g * 37, 500), 5 + mod(g * 53, 2000) / 4.0
+        FROM {FAIXA};"""),
+    # Poucos clientes concentram a maior parte das ordens (distribuição enviesada),
+    # e uma em cada dez é aberta por um mecânico
+    ("ordens de servico", 'ordem_servico', f"""
+        INSERT INTO ordem_servico (id_os, descricao, data_abertura, status, id_solicitante)
+        SELECT %(b_os)s + g, 'Revisao ' || {_escolher(ESPECIALIDADES, 'g * 3')}, {_data_os('g')},
+               CASE WHEN mod(g, 20) < 14 THEN 'Concluida' WHEN mod(g, 20) < 17 THEN 'Em andamento'
+                    WHEN mod(g, 20) < 19 THEN 'Aberta' ELSE 'Cancelada' END,
+               CASE WHEN mod(g, 10) = 0 THEN %(b_sol_mec)s + 1 + mod(g, %(n_mecanico)s)
+                    ELSE %(b_sol_cli)s + 1 + floor(%(n_cliente)s * power(mod(g * 7919, 1000003) / 1000003.0, 3))::bigint
+               END
+        FROM {FAIXA};"""),
+    ("servicos", 'ordem_servico', f"""
+        INSERT INTO servico (id_servico, tempo_estimado, valor_padrao, cod_os, data_abertura_os)
+        SELECT %(b_srv)s + g, 30 + mod(g * 13, 180), 50 + mod(g * 29, 950), %(b_os)s + g, {_data_os('g')}
+        FROM {FAIXA};"""),
+    ("execucoes de servico", 'execucao_servico', f"""
+        INSERT INTO execucao_servico (id_execucao, id_os, data_abertura_os, id_mecanico, id_servico, tempo_gasto)
+        SELECT %(b_exec)s + g, %(b_os)s + 1 + mod(g - 1, %(n_ordem_servico)s),
+               {_data_os('1 + mod(g - 1, %(n_ordem_servico)s)')},
+               %(b_mec)s + 1 + mod(g * 31, %(n_mecanico)s), %(b_srv)s + 1 + mod(g - 1, %(n_ordem_servico)s),
+               CASE WHEN mod(g, 10) = 0 THEN NULL ELSE make_interval(mins => (15 + mod(g * 17, 240))::int) END
+        FROM {FAIXA};"""),
+    ("pecas utilizadas", 'ordem_servico', f"""
+        INSERT INTO utiliza_peca (id_os, data_abertura_os, id_peca, quantidade)
+        SELECT %(b_os)s + g, {_data_os('g')}, %(b_peca)s + 1 + mod(g * 7 + j * (%(n_peca)s / 2), %(n_peca)s), 1 + mod(g + j, 4)
+        FROM {FAIXA} CROSS JOIN generate_series(0, 1) AS j;"""),
+]
+
+# Tabelas com SERIAL cujas faixas são reservadas: (tabela, coluna, parâmetro da base)
+SEQUENCIAS = [
+    ('mecanico', 'matricula_mec', 'b_mec'),
+    ('cliente', 'id_cliente', 'b_cli'),
+    ('veiculo', 'veiculo_id', 'b_vei'),
+    ('peca', 'cod_peca', 'b_peca'),
+    ('ordem_servico', 'id_os', 'b_os'),
+    ('servico', 'id_servico', 'b_srv'),
+    ('execucao_servico', 'id_execucao', 'b_exec'),
+]
+
+# As particionadas são esvaziadas pela tabela pai, com todas as partições
+TABELAS = ['utiliza_peca', 'execucao_servico', 'servico', 'ordem_servico', 'peca', 'moto', 'carro',
+           'veiculo', 'pessoa_juridica', 'pessoa_fisica', 'cliente', 'freelancer', 'efetivo',
+           'mecanico', 'solicitante', 'resumo_os_status', 'resumo_mecanico', 'resumo_solicitante_os']
+
+
+def quantidades(clientes):
+    ordens = int(clientes * PROPORCOES['ordens'])
+    return {
+        'cliente': clientes,
+        'mecanico': max(20, int(clientes * PROPORCOES['mecanicos'])),
+        'veiculo': int(clientes * PROPORCOES['veiculos']),
+        'peca': max(500, int(clientes * PROPORCOES['pecas'])),
+        'ordem_servico': ordens,
+        'execucao_servico': int(ordens * PROPORCOES['execucoes']),
+    }
+
+
+def _reservar_faixa(cursor, tabela, coluna, quantidade):
+    # Avança a sequence de uma vez; os ids base + 1 .. base + quantidade ficam livres
+    cursor.execute(
+        "SELECT setval(pg_get_serial_sequence(%s, %s), "
+        "nextval(pg_get_serial_sequence(%s, %s)) + %s - 1);",
+        (tabela, coluna, tabela, coluna, quantidade)
+    )
+    return cursor.fetchone()[0] - quantidade
+
+
+def gerar(clientes, lote=500000, limpar=False):
+    """Popula o banco com `clientes` clientes e as demais tabelas proporcionais."""
+    SetupDatabase().criar_tabelas()
+    # Partições para todo o histórico gerado; sem elas as ordens iriam para a partição padrão
+    hoje = date.today()
+    GerenciadorParticoes().criar_particoes(hoje - timedelta(days=DIAS_HISTORICO), hoje + timedelta(days=1))
+    n = quantidades(clientes)
+    db = Database()
+    inicio_total = time.monotonic()
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SET synchronous_commit = off;")
+        if limpar:
+            cursor.execute(f"TRUNCATE {', '.join(TABELAS)} RESTART IDENTITY;")
+            conn.commit()
+
+        # Sem triggers (e sem checagem de FK) a carga é bem mais rápida; exige superusuário.
+        # Os resumos dos relatórios são reconstruídos no fim.
+        try:
+            cursor.execute("SET session_replication_role = replica;")
+            sem_triggers = True
+        except errors.InsufficientPrivilege:
+            conn.rollback()
+            cursor.execute("SET synchronous_commit = off;")
+            sem_triggers = False
+            print("Sem permissao para desligar triggers; a carga vai manter os resumos incrementalmente")
+
+        params = {f'n_{tabela}': quantidade for tabela, quantidade in n.items()}
+        for tabela, coluna, base in SEQUENCIAS:
+            params[base] = _reservar_faixa(cursor, tabela, coluna, n[tabela])
+        params['b_sol_mec'] = _reservar_faixa(cursor, 'solicitante', 'id_solicitante', n['mecanico'])
+        params['b_sol_cli'] = _reservar_faixa(cursor, 'solicitante', 'id_solicitante', n['cliente'])
+        conn.commit()
+
+        try:
+            for descricao, tabela, comando in COMANDOS:
+                total = n[tabela]
+                inicio = time.monotonic()
+                for faixa_inicio in range(1, total + 1, lote):
+                    params['inicio'] = faixa_inicio
+                    params['fim'] = min(faixa_inicio + lote - 1, total)
+                    cursor.execute(comando, params)
+                    conn.commit()
+                print(f"{descricao}: {total} em {time.monotonic() - inicio:.1f}s")
+        except Exception:
+            # A sessão está com triggers desligados; não pode voltar ao pool assim
+            conn.close()
+            raise
+
+        cursor.execute("RESET ALL;")
+        conn.commit()
+        conn.autocommit = True
+        cursor.execute("ANALYZE;")
+
+    if sem_triggers:
+        RelatorioCRUD().reconstruir_resumos()
+    print(f"Carga concluida em {time.monotonic() - inicio_total:.1f}s")
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos da oficina")
+    parser.add_argument('--clientes', type=int, default=10000, help="escala da carga (10 mil a 10 milhões)")
+    parser.add_argument('--lote', type=int, default=500000, help="linhas por comando/transação")
+    parser.add_argument('--limpar', action='store_true', help="esvazia as tabelas antes de gerar")
+    args = parser.parse_args()
+    gerar(args.clientes, args.lote, args.limpar)
+    Database.fechar_pools()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,284 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from benchmarks.comum import commit_atual, resumir, silenciar
+from oficina.clientes import ClienteCRUD
+from oficina.db import Database
+from oficina.mecanicos import MecanicoCRUD
+from oficina.ordens_servico import OrdemServicoCRUD
+from oficina.pecas import PecaCRUD
+from oficina.relatorios import RelatorioCRUD
+from oficina.replicas import estado as estado_replicas
+from oficina.sessao import Sessao
+from oficina.veiculos import VeiculoCRUD
+
+# Mede vazão e latência (p50/p99) de cada método público dos CRUDs, primeiro
+# com uma thread e depois com N workers concorrentes, sobre os dados gerados por
+# benchmarks.gerador. O resultado vai para um JSON comparável entre commits
+# (ver benchmarks.comparar).
+# Uso (a partir de src):
+#   python -m benchmarks.gerador --clientes 100000
+#   python -m benchmarks.suite --workers 16 --saida resultados/$(git rev-parse --short HEAD).json
+
+STATUS = ['Aberta', 'Em andamento', 'Concluida', 'Cancelada']
+# Termos típicos do balcão: trechos de nome, prefixos de documento e telefone
+BUSCAS_CLIENTE = ['silva', 'ana souza', 'transportes', 'gabriel', '000001', '81 9', '00000000012']
+BUSCAS_PECA = ['freio', 'pastilha', 'filtro oleo', 'correia', 'bateria honda']
+
+
+class Contexto:
+    """Faixas de ids existentes no banco, para sortear argumentos realistas."""
+
+    def __init__(self, db):
+        self.faixas = {}
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+            for nome, tabela, coluna in [('cliente', 'cliente', 'id_cliente'), ('os', 'ordem_servico', 'id_os'),
+                                         ('peca', 'peca', 'cod_peca'), ('solicitante', 'solicitante', 'id_solicitante')]:
+                cursor.execute(f"SELECT MIN({coluna}), MAX({coluna}) FROM {tabela};")
+                minimo, maximo = cursor.fetchone()
+                if minimo is None:
+                    raise RuntimeError(f"Tabela {tabela} vazia; rode antes: python -m benchmarks.gerador")
+                self.faixas[nome] = (minimo, maximo)
+            cursor.execute("SELECT COUNT(*) FROM cliente;")
+            self.clientes = cursor.fetchone()[0]
+            cursor.execute("SHOW server_version;")
+            self.versao_servidor = cursor.fetchone()[0]
+
+    def id(self, rnd, nome):
+        return rnd.randint(*self.faixas[nome])
+
+
+def _documento(rnd, digitos):
+    # Prefixo 8 evita colisão com os documentos do gerador (ids com zeros à esquerda)
+    return '8' + ''.join(rnd.choices('0123456789', k=digitos - 1))
+
+
+def _cliente_pf(rnd):
+    return dict(nome=f"Bench {rnd.randrange(10**6)}", cpf=_documento(rnd, 11), data_nascimento='1990-01-01',
+                email='bench@exemplo.com', telefone='81900000000', endereco='Rua do Benchmark, 1')
+
+
+def _cliente_pj(rnd):
+    return dict(razao_social=f"Bench {rnd.randrange(10**6)} Ltda", cnpj=_documento(rnd, 14),
+                email='bench@exemplo.com', telefone='81900000000', endereco='Rua do Benchmark, 1')
+
+
+def _efetivo(rnd):
+    return dict(nome='Bench', telefone='81900000000', especialidade='Motor', salario=3000, registro_clt='CLTBENCH')
+
+
+def _freelancer(rnd):
+    return dict(nome='Bench', telefone='81900000000', especialidade='Freio', hora_servico=60)
+
+
+def _carro(ctx, rnd):
+    return dict(marca='Fiat', cor='Prata', modelo='Uno', ano=2010, id_cliente=ctx.id(rnd, 'cliente'),
+                numero_portas=4, tipo_combustivel='Flex', capacidade_passageiros=5)
+
+
+def _moto(ctx, rnd):
+    return dict(marca='Honda', cor='Preto', modelo='CG', ano=2018, id_cliente=ctx.id(rnd, 'cliente'),
+                cilindrada=160, tipo_moto='Street')
+
+
+def _atendimento(crud, ctx, rnd):
+    # Fluxo do balcão (cliente, carro, OS e peças) numa única sessão/transação
+    with Sessao(crud.db):
+        id_cliente = crud.inserir_cliente_pf(**_cliente_pf(rnd))
+        VeiculoCRUD().inserir_carro(**dict(_carro(ctx, rnd), id_cliente=id_cliente))
+        id_os = OrdemServicoCRUD().criar_ordem_servico('Benchmark', ctx.id(rnd, 'solicitante'), date.today())
+        PecaCRUD().consumir_pecas(id_os, [(ctx.id(rnd, 'peca'), 1)])
+    return id_os
+
+
+def _consumir(gerador, limite=1000):
+    # Métodos iterar_* devolvem geradores; mede o custo de trazer as primeiras linhas
+    return sum(1 for _ in itertools.islice(gerador, limite))
+
+
+# nome -> (função(crud, ctx, rnd), classe, pesado). Casos pesados (varrem ou travam
+# tabelas inteiras) só rodam com --pesados.
+def _ordens_com_buffer():
+    # Mede o enfileiramento; os lotes são gravados na thread da fila (e no encerramento)
+    crud = OrdemServicoCRUD()
+    crud.ativar_buffer_status(max_itens=500, intervalo=0.5)
+    return crud
+
+
+CASOS = {
+    'ClienteCRUD.inserir_cliente_pf': (lambda c, ctx, r: c.inserir_cliente_pf(**_cliente_pf(r)), ClienteCRUD, False),
+    'ClienteCRUD.inserir_cliente_pj': (lambda c, ctx, r: c.inserir_cliente_pj(**_cliente_pj(r)), ClienteCRUD, False),
+    'ClienteCRUD.inserir_cliente_pf_lote': (
+        lambda c, ctx, r: c.inserir_cliente_pf_lote([_cliente_pf(r) for _ in range(100)]), ClienteCRUD, False),
+    'ClienteCRUD.inserir_cliente_pj_lote': (
+        lambda c, ctx, r: c.inserir_cliente_pj_lote([_cliente_pj(r) for _ in range(100)]), ClienteCRUD, False),
+    'ClienteCRUD.listar_clientes': (lambda c, ctx, r: c.listar_clientes(limite=50), ClienteCRUD, False),
+    'ClienteCRUD.iterar_clientes': (lambda c, ctx, r: _consumir(c.iterar_clientes()), ClienteCRUD, False),
+    'ClienteCRUD.buscar_clientes': (lambda c, ctx, r: c.buscar_clientes(r.choice(BUSCAS_CLIENTE)), ClienteCRUD, False),
+    'ClienteCRUD.buscar_cliente_por_id': (
+        lambda c, ctx, r: c.buscar_cliente_por_id(ctx.id(r, 'cliente')), ClienteCRUD, False),
+    'ClienteCRUD.buscar_cliente_completo': (
+        lambda c, ctx, r: c.buscar_cliente_completo(ctx.id(r, 'cliente')), ClienteCRUD, False),
+    'ClienteCRUD.buscar_clientes_completos': (
+        lambda c, ctx, r: c.buscar_clientes_completos([ctx.id(r, 'cliente') for _ in range(20)]), ClienteCRUD, False),
+    'MecanicoCRUD.inserir_efetivo': (lambda c, ctx, r: c.inserir_efetivo(**_efetivo(r)), MecanicoCRUD, False),
+    'MecanicoCRUD.inserir_freelancer': (lambda c, ctx, r: c.inserir_freelancer(**_freelancer(r)), MecanicoCRUD, False),
+    'MecanicoCRUD.inserir_efetivo_lote': (
+        lambda c, ctx, r: c.inserir_efetivo_lote([_efetivo(r) for _ in range(100)]), MecanicoCRUD, False),
+    'MecanicoCRUD.inserir_freelancer_lote': (
+        lambda c, ctx, r: c.inserir_freelancer_lote([_freelancer(r) for _ in range(100)]), MecanicoCRUD, False),
+    'MecanicoCRUD.listar_mecanicos': (lambda c, ctx, r: c.listar_mecanicos(), MecanicoCRUD, False),
+    'VeiculoCRUD.inserir_carro': (lambda c, ctx, r: c.inserir_carro(**_carro(ctx, r)), VeiculoCRUD, False),
+    'VeiculoCRUD.inserir_moto': (lambda c, ctx, r: c.inserir_moto(**_moto(ctx, r)), VeiculoCRUD, False),
+    'VeiculoCRUD.inserir_carro_lote': (
+        lambda c, ctx, r: c.inserir_carro_lote([_carro(ctx, r) for _ in range(100)]), VeiculoCRUD, False),
+    'VeiculoCRUD.inserir_moto_lote': (
+        lambda c, ctx, r: c.inserir_moto_lote([_moto(ctx, r) for _ in range(100)]), VeiculoCRUD, False),
+    'VeiculoCRUD.listar_veiculos_cliente': (
+        lambda c, ctx, r: c.listar_veiculos_cliente(ctx.id(r, 'cliente')), VeiculoCRUD, False),
+    'OrdemServicoCRUD.criar_ordem_servico': (
+        lambda c, ctx, r: c.criar_ordem_servico('Benchmark', ctx.id(r, 'solicitante'), date.today()),
+        OrdemServicoCRUD, False),
+    'OrdemServicoCRUD.listar_ordens_servico': (
+        lambda c, ctx, r: c.listar_ordens_servico(status=r.choice(STATUS), limite=50), OrdemServicoCRUD, False),
+    'OrdemServicoCRUD.listar_ordens_servico_mes': (
+        lambda c, ctx, r: c.listar_ordens_servico(limite=50, data_inicio=date.today().replace(day=1)),
+        OrdemServicoCRUD, False),
+    'OrdemServicoCRUD.iterar_ordens_servico': (
+        lambda c, ctx, r: _consumir(c.iterar_ordens_servico()), OrdemServicoCRUD, False),
+    'OrdemServicoCRUD.atualizar_status_os': (
+        lambda c, ctx, r: c.atualizar_status_os(ctx.id(r, 'os'), r.choice(STATUS)), OrdemServicoCRUD, False),
+    'OrdemServicoCRUD.atualizar_status_os_buffer': (
+        lambda c, ctx, r: c.atualizar_status_os(ctx.id(r, 'os'), r.choice(STATUS)), _ordens_com_buffer, False),
+    'PecaCRUD.inserir_peca': (lambda c, ctx, r: c.inserir_peca('Peca benchmark', 100, 9.9), PecaCRUD, False),
+    'PecaCRUD.listar_estoque': (lambda c, ctx, r: c.listar_estoque(limite=50), PecaCRUD, False),
+    'PecaCRUD.listar_estoque_baixo': (lambda c, ctx, r: c.listar_estoque(estoque_baixo=10, limite=50), PecaCRUD, False),
+    'PecaCRUD.buscar_pecas': (lambda c, ctx, r: c.buscar_pecas(r.choice(BUSCAS_PECA)), PecaCRUD, False),
+    'PecaCRUD.iterar_estoque': (lambda c, ctx, r: _consumir(c.iterar_estoque()), PecaCRUD, False),
+    'PecaCRUD.atualizar_estoque': (
+        lambda c, ctx, r: c.atualizar_estoque(ctx.id(r, 'peca'), r.randint(0, 500)), PecaCRUD, False),
+    'PecaCRUD.consumir_pecas': (
+        lambda c, ctx, r: c.consumir_pecas(ctx.id(r, 'os'), [(ctx.id(r, 'peca'), 1) for _ in range(3)]),
+        PecaCRUD, False),
+    'Sessao.atendimento': (_atendimento, ClienteCRUD, False),
+    'RelatorioCRUD.os_por_status': (lambda c, ctx, r: c.os_por_status(), RelatorioCRUD, False),
+    'RelatorioCRUD.os_por_status_mes': (
+        lambda c, ctx, r: c.os_por_status(data_inicio=date.today().replace(day=1)), RelatorioCRUD, False),
+    'RelatorioCRUD.servicos_por_mecanico': (lambda c, ctx, r: c.servicos_por_mecanico(), RelatorioCRUD, False),
+    'RelatorioCRUD.clientes_mais_ativos': (lambda c, ctx, r: c.clientes_mais_ativos(10), RelatorioCRUD, False),
+    'RelatorioCRUD.dashboard': (lambda c, ctx, r: c.dashboard(), RelatorioCRUD, False),
+    'RelatorioCRUD.verificar_resumos': (lambda c, ctx, r: c.verificar_resumos(), RelatorioCRUD, True),
+    'RelatorioCRUD.reconstruir_resumos': (lambda c, ctx, r: c.reconstruir_resumos(), RelatorioCRUD, True),
+}
+
+
+def _rodar(funcao, crud, ctx, fim, max_operacoes, semente):
+    rnd = random.Random(semente)
+    latencias = []
+    erros = 0
+    while time.monotonic() < fim and len(latencias) + erros < max_operacoes:
+        inicio = time.perf_counter()
+        try:
+            resultado = funcao(crud, ctx, rnd)
+            ok = resultado is not None and resultado is not False
+        except Exception:
+            ok = False
+        if ok:
+            latencias.append(time.perf_counter() - inicio)
+        else:
+            erros += 1
+    return latencias, erros
+
+
+def medir(funcao, crud, ctx, workers, duracao, max_operacoes):
+    """Roda `funcao` em `workers` threads por até `duracao` segundos (ou `max_operacoes` por thread)."""
+    latencias = []
+    erros = 0
+    lock = threading.Lock()
+    inicio = time.monotonic()
+    fim = inicio + duracao
+
+    def worker(semente):
+        nonlocal erros
+        resultado, falhas = _rodar(funcao, crud, ctx, fim, max_operacoes, semente)
+        with lock:
+            latencias.extend(resultado)
+            erros += falhas
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(worker, range(workers)))
+    return resumir(latencias, time.monotonic() - inicio, erros)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos métodos públicos dos CRUDs")
+    parser.add_argument('--workers', type=int, default=8, help="threads da rodada concorrente (0 = só serial)")
+    parser.add_argument('--duracao', type=float, default=5, help="segundos por método e rodada")
+    parser.add_argument('--max-operacoes', type=int, default=1000, help="limite de chamadas por thread")
+    parser.add_argument('--filtro', default='', help="só métodos cujo nome contém este texto")
+    parser.add_argument('--pesados', action='store_true', help="inclui verificar/reconstruir resumos")
+    parser.add_argument('--saida', default='resultado_benchmark.json')
+    args = parser.parse_args()
+
+    # Cada worker precisa de uma conexão própria do pool
+    os.environ.setdefault('DB_POOL_MAX', str(max(args.workers, 1) + 2))
+
+    db = Database()
+    ctx = Contexto(db)
+    resultados = {}
+    rotas = {}
+    for nome, (funcao, classe, pesado) in CASOS.items():
+        if args.filtro not in nome or (pesado and not args.pesados):
+            continue
+        crud = classe()
+        estado_replicas.limpar()
+        with silenciar():
+            _rodar(funcao, crud, ctx, time.monotonic() + args.duracao, 1, 0)  # aquecimento
+            resultados[nome] = {'serial': medir(funcao, crud, ctx, 1, args.duracao, args.max_operacoes)}
+            if args.workers > 0:
+                resultados[nome]['concorrente'] = medir(funcao, crud, ctx, args.workers, args.duracao,
+                                                        args.max_operacoes)
+        if db.replicas:
+            # Quanto de cada método foi atendido pelas réplicas e quanto ficou no primário
+            estatisticas = db.estatisticas_rotas()
+            rotas[nome] = {'conexoes': estatisticas['rotas'],
+                           'desvios_para_primario': estatisticas['desvios_para_primario']}
+        for modo, medida in resultados[nome].items():
+            print(f"{nome:45} {modo:11} {medida['ops_por_segundo']:9.1f} ops/s  "
+                  f"p50={medida['p50_ms']:8.2f}ms  p99={medida['p99_ms']:8.2f}ms  erros={medida['erros']}")
+
+    saida = {
+        'meta': {
+            'commit': commit_atual(),
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'clientes': ctx.clientes,
+            'workers': args.workers,
+            'duracao': args.duracao,
+            'servidor': ctx.versao_servidor,
+            'replicas': list(db.replicas),
+            'python': platform.python_version(),
+        },
+        'resultados': resultados,
+        'rotas': rotas,
+    }
+    pasta = os.path.dirname(args.saida)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(saida, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.saida}")
+    Database.fechar_pools()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,162 @@
+import argparse
+import sys
+from contextlib import redirect_stdout
+
+from oficina.db import Database
+from oficina.migracoes import MIGRACOES
+from oficina.particoes import MODOS_ARQUIVAMENTO, GerenciadorParticoes
+from oficina.relatorios import RelatorioCRUD
+from oficina.setup import SetupDatabase
+from oficina.transferencia import TransferenciaCSV
+
+# Linha de comando para as rotinas administrativas da oficina
+# Exemplos:
+#   python cli.py importar pecas catalogo_fornecedor.csv --chave nome_peca
+#   python cli.py exportar ordens ordens.csv
+#   python cli.py migrar --status
+#   python cli.py resumos verificar
+#   python cli.py particoes criar --meses 3
+#   python cli.py particoes arquivar --meses 24 --modo desanexar --status-fechados Concluida Cancelada
+#   python cli.py replicas
+
+IMPORTADORES = {
+    'pecas': 'importar_pecas',
+    'veiculos': 'importar_veiculos',
+    'ordens': 'importar_ordens_servico',
+}
+
+EXPORTADORES = {
+    'pecas': 'exportar_pecas',
+    'veiculos': 'exportar_veiculos',
+    'ordens': 'exportar_ordens_servico',
+}
+
+
+def importar(args):
+    transferencia = TransferenciaCSV()
+    if args.entidade == 'pecas':
+        resultado = transferencia.importar_pecas(args.arquivo, chave=args.chave)
+    else:
+        resultado = getattr(transferencia, IMPORTADORES[args.entidade])(args.arquivo)
+    return 0 if resultado is not None else 1
+
+
+def exportar(args):
+    transferencia = TransferenciaCSV()
+    if args.arquivo == '-':
+        # As mensagens vão para stderr para não misturar com o CSV
+        saida = sys.stdout
+        with redirect_stdout(sys.stderr):
+            resultado = getattr(transferencia, EXPORTADORES[args.entidade])(saida)
+    else:
+        resultado = getattr(transferencia, EXPORTADORES[args.entidade])(args.arquivo)
+    return 0 if resultado is not None else 1
+
+
+def migrar(args):
+    setup = SetupDatabase()
+    if args.status:
+        with setup.db.get_connection() as conn:
+            versao = setup.versao_atual(conn)
+        print(f"Versao do schema: {versao} (ultima disponivel: {MIGRACOES[-1].versao})")
+        for migracao in MIGRACOES:
+            marca = 'x' if migracao.versao <= versao else ' '
+            print(f"  [{marca}] {migracao.versao:>3} {migracao.descricao}")
+        return 0
+    return 0 if setup.migrar(ate_versao=args.ate) is not None else 1
+
+
+def resumos(args):
+    relatorios = RelatorioCRUD()
+    if args.acao == 'reconstruir':
+        return 0 if relatorios.reconstruir_resumos() else 1
+    divergencias = relatorios.verificar_resumos()
+    if divergencias is None:
+        return 1
+    for relatorio, linhas in divergencias.items():
+        for chave, resumo, bruto in linhas:
+            print(f"  {relatorio} [{chave}]: resumo={resumo} dados={bruto}")
+    return 1 if any(divergencias.values()) else 0
+
+
+def particoes(args):
+    gerenciador = GerenciadorParticoes()
+    if args.acao == 'criar':
+        return 0 if gerenciador.criar_particoes_futuras(3 if args.meses is None else args.meses) is not None else 1
+    if args.acao == 'arquivar':
+        resultado = gerenciador.arquivar(24 if args.meses is None else args.meses, args.modo,
+                                         args.status_fechados)
+        if resultado is None:
+            return 1
+        for mes, motivo in resultado['ignoradas']:
+            print(f"  {mes:%Y-%m}: {motivo}")
+        return 0
+    resultado = gerenciador.listar_particoes()
+    if resultado is None:
+        return 1
+    for nome, mes, linhas, compactada in resultado['data']:
+        print(f"  {nome:32} {linhas:>12} linhas{'  (compactada)' if compactada else ''}")
+    return 0
+
+
+def replicas(args):
+    db = Database()
+    if not db.replicas:
+        print("Nenhuma replica configurada (DB_REPLICAS)")
+        return 0
+    falhas = 0
+    for nome in db.replicas:
+        try:
+            atraso = db.medir_atraso(nome)
+        except Exception as e:
+            falhas += 1
+            print(f"  {nome:32} indisponivel: {str(e).strip()}")
+            continue
+        situacao = 'ok' if atraso <= db.atraso_max else f"atrasada (limite {db.atraso_max:g}s)"
+        print(f"  {nome:32} atraso {atraso:.3f}s  {situacao}")
+    return 1 if falhas else 0
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Rotinas administrativas da oficina")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p = sub.add_parser('importar', help="Importa um CSV via COPY")
+    p.add_argument('entidade', choices=sorted(IMPORTADORES))
+    p.add_argument('arquivo')
+    p.add_argument('--chave', choices=['cod_peca', 'nome_peca'], default='cod_peca',
+                   help="Coluna usada para casar peças existentes (apenas para pecas)")
+    p.set_defaults(func=importar)
+
+    p = sub.add_parser('exportar', help="Exporta uma tabela para CSV via COPY ('-' para stdout)")
+    p.add_argument('entidade', choices=sorted(EXPORTADORES))
+    p.add_argument('arquivo')
+    p.set_defaults(func=exportar)
+
+    p = sub.add_parser('migrar', help="Aplica as migrações de schema pendentes")
+    p.add_argument('--ate', type=int, default=None, help="Versão alvo (padrão: a mais recente)")
+    p.add_argument('--status', action='store_true', help="Apenas mostra as migrações aplicadas")
+    p.set_defaults(func=migrar)
+
+    p = sub.add_parser('resumos', help="Verifica ou reconstrói as tabelas de resumo dos relatórios")
+    p.add_argument('acao', choices=['verificar', 'reconstruir'])
+    p.set_defaults(func=resumos)
+
+    p = sub.add_parser('particoes', help="Cria partições futuras ou arquiva meses antigos das ordens de serviço")
+    p.add_argument('acao', choices=['listar', 'criar', 'arquivar'])
+    p.add_argument('--meses', type=int, default=None,
+                   help="criar: meses à frente (padrão 3); arquivar: idade mínima em meses (padrão 24)")
+    p.add_argument('--modo', choices=MODOS_ARQUIVAMENTO, default='desanexar', help="Apenas para arquivar")
+    p.add_argument('--status-fechados', nargs='+', default=['Concluida', 'Cancelada'],
+                   help="Apenas para arquivar: status de ordem considerados fechados (padrão Concluida Cancelada)")
+    p.set_defaults(func=particoes)
+
+    p = sub.add_parser('replicas', help="Mede o atraso de replicação das réplicas de leitura configuradas")
+    p.set_defaults(func=replicas)
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = criar_parser().parse_args()
+    sys.exit(args.func(args))
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from .db import Database
+from .ouvinte import obter_ouvinte
+from .pecas import PecaCRUD
+
+# Alertas de estoque empurrados pelo banco, sem consultar listar_estoque em laço.
+# O trigger da migração 6 registra em alerta_estoque e avisa no canal estoque_baixo
+# quando qt_estoque de uma peça cruza o estoque_minimo: tipo 'baixo' ao chegar no
+# mínimo, 'reposto' ao voltar acima. Os eventos chegam como dicts com id_alerta,
+# cod_peca, nome_peca, tipo, qt_estoque, estoque_minimo, criado_em e recuperado.
+#
+#   alertas = AlertasEstoque(debounce=30)
+#   alertas.registrar(lambda evento: print(evento['nome_peca'], evento['tipo']))
+#   alertas.iniciar()
+#   # ou, num serviço asyncio:  async for evento in alertas.eventos(): ...
+#
+# Debounce: depois de entregar um evento de uma peça, os seguintes dela nos próximos
+# `debounce` segundos ficam retidos; no fim da janela só o estado mais recente é
+# entregue, e apenas se mudou (estoque oscilando em torno do mínimo gera um aviso).
+# Reconexão: a cada (re)conexão do ouvinte, os alertas registrados depois do último
+# id recebido são relidos de alerta_estoque; `desde_id` retoma de um id guardado
+# por quem consome (sem ele, começa pelos alertas novos).
+
+CANAL_ESTOQUE = 'estoque_baixo'
+
+
+class AlertasEstoque:
+    QUERY_ULTIMO_ID = "SELECT COALESCE(MAX(id_alerta), 0) FROM alerta_estoque;"
+    # Transações concorrentes podem confirmar fora da ordem dos ids: a recuperação
+    # relê essa margem antes do último id recebido (os repetidos são descartados)
+    MARGEM_RECUPERACAO = 1000
+    MAX_VISTOS = 10000
+    LOTE_RECUPERACAO = 1000
+
+    def __init__(self, debounce=30.0, desde_id=None, db=None):
+        if debounce < 0:
+            raise ValueError("debounce não pode ser negativo: %s" % debounce)
+        self.db = db or Database()
+        self.debounce = debounce
+        self._pecas = PecaCRUD()
+        self._pecas.db = self.db
+        self._callbacks = []
+        self._cond = threading.Condition()
+        self._ultimo_id = desde_id
+        self._conectou = False
+        self._vistos = set()
+        self._ordem_vistos = deque()
+        self._entregues = {}  # cod_peca -> (tipo, instante) do último evento entregue
+        self._retidos = {}  # cod_peca -> evento mais recente segurado pelo debounce
+        self._ativo = False
+        self._thread = None
+        self._ouvinte = obter_ouvinte(self.db.params)
+
+    @property
+    def ultimo_id(self):
+        """Último id_alerta recebido; guarde-o para retomar com `desde_id`."""
+        with self._cond:
+            return self._ultimo_id
+
+    def registrar(self, callback):
+        """`callback(evento)` é chamado a cada alerta entregue (na thread do ouvinte ou do debounce)."""
+        with self._cond:
+            self._callbacks.append(callback)
+
+    def remover(self, callback):
+        with self._cond:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def iniciar(self):
+        with self._cond:
+            if self._ativo:
+                return
+            self._ativo = True
+            self._thread = threading.Thread(target=self._rodar, name="oficina-alertas-estoque", daemon=True)
+            self._thread.start()
+        self._ouvinte.registrar(CANAL_ESTOQUE, self._ao_notificar)
+        self._ouvinte.ao_conectar(self._recuperar)
+        self._ouvinte.iniciar()
+
+    def parar(self):
+        """Para de receber alertas; os retidos pelo debounce que mudaram de estado ainda são entregues."""
+        self._ouvinte.remover(CANAL_ESTOQUE, self._ao_notificar)
+        self._ouvinte.remover_ao_conectar(self._recuperar)
+        with self._cond:
+            if not self._ativo:
+                return
+            self._ativo = False
+            thread, self._thread = self._thread, None
+            self._cond.notify_all()
+        thread.join()
+        with self._cond:
+            pendentes = self._vencidos(float('inf'))[0]
+        for evento in pendentes:
+            self._entregar(evento)
+
+    async def eventos(self, max_fila=1000):
+        """Iterador assíncrono dos alertas; inicia a escuta se preciso.
+
+        Com a fila cheia (consumidor lento), o evento mais antigo é descartado.
+        """
+        loop = asyncio.get_running_loop()
+        fila = asyncio.Queue(max_fila)
+
+        def colocar(evento):
+            if fila.full():
+                fila.get_nowait()
+            fila.put_nowait(evento)
+
+        def repassar(evento):
+            loop.call_soon_threadsafe(colocar, evento)
+
+        self.registrar(repassar)
+        self.iniciar()
+        try:
+            while True:
+                yield await fila.get()
+        finally:
+            self.remover(repassar)
+
+    def _ao_notificar(self, payload):
+        evento = json.loads(payload)
+        evento['criado_em'] = datetime.fromisoformat(evento['criado_em'])
+        evento['recuperado'] = False
+        self._receber(evento)
+
+    def _recuperar(self):
+        # Roda na thread do ouvinte logo após o LISTEN, antes das notificações novas
+        with self._cond:
+            ultimo = self._ultimo_id
+            margem = self.MARGEM_RECUPERACAO if self._conectou else 0
+        if ultimo is None:
+            resultado = self._pecas.execute_query(self.QUERY_ULTIMO_ID)
+            if resultado is not None:
+                with self._cond:
+                    if self._ultimo_id is None:
+                        self._ultimo_id = resultado['data'][0][0]
+                    self._conectou = True
+            return
+        apos = max(0, ultimo - margem)
+        while True:
+            resultado = self._pecas.listar_alertas_estoque(apos, self.LOTE_RECUPERACAO)
+            if resultado is None:
+                return
+            for linha in resultado['data']:
+                evento = dict(zip(resultado['columns'], linha))
+                evento['recuperado'] = True
+                self._receber(evento)
+            if len(resultado['data']) < self.LOTE_RECUPERACAO:
+                break
+            apos = resultado['data'][-1][0]
+        with self._cond:
+            self._conectou = True
+
+    def _receber(self, evento):
+        with self._cond:
+            id_alerta = evento['id_alerta']
+            if id_alerta in self._vistos:
+                return
+            self._vistos.add(id_alerta)
+            self._ordem_vistos.append(id_alerta)
+            if len(self._ordem_vistos) > self.MAX_VISTOS:
+                self._vistos.discard(self._ordem_vistos.popleft())
+            if self._ultimo_id is None or id_alerta > self._ultimo_id:
+                self._ultimo_id = id_alerta
+            cod_peca = evento['cod_peca']
+            agora = time.monotonic()
+            anterior = self._entregues.get(cod_peca)
+            if self.debounce > 0 and (cod_peca in self._retidos
+                                      or (anterior is not None and agora - anterior[1] < self.debounce)):
+                self._retidos[cod_peca] = evento
+                self._cond.notify()
+                return
+            self._entregues[cod_peca] = (evento['tipo'], agora)
+        self._entregar(evento)
+
+    def _vencidos(self, agora):
+        # Chamado com o lock adquirido: (eventos a entregar, segundos até o próximo prazo)
+        entregar, espera = [], None
+        for cod_peca, evento in list(self._retidos.items()):
+            tipo_entregue, instante = self._entregues[cod_peca]
+            restante = instante + self.debounce - agora
+            if restante > 0:
+                espera = restante if espera is None else min(espera, restante)
+                continue
+            del self._retidos[cod_peca]
+            if evento['tipo'] != tipo_entregue:
+                self._entregues[cod_peca] = (evento['tipo'], agora)
+                entregar.append(evento)
+        return entregar, espera
+
+    def _rodar(self):
+        while True:
+            with self._cond:
+                if not self._ativo:
+                    return
+                entregar, espera = self._vencidos(time.monotonic())
+                if not entregar:
+                    self._cond.wait(espera)
+                    continue
+            for evento in entregar:
+                self._entregar(evento)
+
+    def _entregar(self, evento):
+        with self._cond:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback(evento)
+            except Exception as e:
+                print(f"Erro no callback de alerta de estoque: {e}")
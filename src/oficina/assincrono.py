@@ -0,0 +1,399 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+
+try:
+    import asyncpg
+    ERROS_BANCO = (asyncpg.PostgresError, asyncpg.InterfaceError, OSError)
+except ImportError:  # dependência opcional, necessária apenas para a camada assíncrona
+    asyncpg = None
+    ERROS_BANCO = (OSError,)
+
+from .base import BaseCRUD
+from .cache import CANAL_INVALIDACAO, NOTIFY_ATIVO, cache_entidades, iniciar_ouvinte_cache
+from .clientes import ClienteCRUD
+from .db import Database
+from .instrumentacao import registrar_consulta_async, registrar_espera
+from .mecanicos import MecanicoCRUD
+from .ordens_servico import OrdemServicoCRUD
+from .particoes import GerenciadorParticoes, marcar_mes_garantido, mes_a_garantir
+from .pecas import PecaCRUD
+from .preparados import converter_placeholders
+from .relatorios import RelatorioCRUD
+from .veiculos import VeiculoCRUD
+
+# Versões assíncronas (asyncpg) dos CRUDs, para serviços asyncio.
+# As consultas são as mesmas das classes síncronas; apenas os placeholders
+# %s são convertidos para $1, $2, ... Exemplo de consultas independentes
+# rodando em paralelo no mesmo event loop:
+#
+#     cliente, veiculos = await asyncio.gather(
+#         AsyncClienteCRUD().buscar_cliente_por_id(7),
+#         AsyncVeiculoCRUD().listar_veiculos_cliente(7),
+#     )
+
+
+def _data(valor):
+    # asyncpg exige objetos date; as classes síncronas aceitam 'AAAA-MM-DD'
+    return date.fromisoformat(valor) if isinstance(valor, str) else valor
+
+
+def _linhas_afetadas(status):
+    # Status do comando, ex.: 'UPDATE 3'
+    try:
+        return int(status.split()[-1])
+    except (ValueError, IndexError, AttributeError):
+        return 0
+
+
+async def _instrumentar_conexao(conn):
+    # Cada comando da conexão passa pela instrumentação (asyncpg >= 0.29)
+    if hasattr(conn, 'add_query_logger'):
+        conn.add_query_logger(registrar_consulta_async)
+
+
+# Pool assíncrono próprio, um por event loop e conjunto de parâmetros
+class AsyncDatabase:
+    _pools = {}
+
+    def __init__(self):
+        self.params = Database().params
+        if asyncpg is None:
+            raise ImportError("A camada assíncrona requer o pacote asyncpg (pip install asyncpg)")
+
+    async def pool(self):
+        loop = asyncio.get_running_loop()
+        chave = (id(loop),) + tuple(sorted((k, str(v)) for k, v in self.params.items()))
+        tarefa = AsyncDatabase._pools.get(chave)
+        if tarefa is None:
+            # Guarda a tarefa de criação para que corrotinas concorrentes compartilhem o mesmo pool
+            tarefa = AsyncDatabase._pools[chave] = asyncio.ensure_future(asyncpg.create_pool(
+                host=self.params['host'],
+                port=int(self.params['port']),
+                database=self.params['database'],
+                user=self.params['user'],
+                password=self.params['password'],
+                min_size=int(os.getenv('DB_POOL_MIN', 1)),
+                max_size=int(os.getenv('DB_POOL_MAX', 10)),
+                max_inactive_connection_lifetime=float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)),
+                init=_instrumentar_conexao,
+            ))
+        try:
+            return await asyncio.shield(tarefa)
+        except Exception:
+            AsyncDatabase._pools.pop(chave, None)
+            raise
+
+    @asynccontextmanager
+    async def get_connection(self):
+        pool = await self.pool()
+        inicio = time.monotonic()
+        async with pool.acquire(timeout=float(os.getenv('DB_POOL_TIMEOUT', 30))) as conn:
+            registrar_espera(time.monotonic() - inicio)
+            yield conn
+
+    @classmethod
+    async def fechar_pools(cls):
+        loop = asyncio.get_running_loop()
+        for chave in [c for c in cls._pools if c[0] == id(loop)]:
+            pool = await cls._pools.pop(chave)
+            await pool.close()
+
+
+class AsyncBaseCRUD:
+    INSERT_SOLICITANTE = BaseCRUD.INSERT_SOLICITANTE
+    _codificar_token = BaseCRUD._codificar_token
+    _decodificar_token = BaseCRUD._decodificar_token
+    _filtro_periodo = BaseCRUD._filtro_periodo
+
+    def __init__(self):
+        self.db = AsyncDatabase()
+
+    async def execute_query(self, query, params=None, fetch=True):
+        sql = converter_placeholders(query)
+        args = tuple(params or ())
+        try:
+            async with self.db.get_connection() as conn:
+                if not fetch:
+                    return _linhas_afetadas(await conn.execute(sql, *args))
+                stmt = await conn.prepare(sql)
+                columns = [atributo.name for atributo in stmt.get_attributes()]
+                results = await stmt.fetch(*args)
+                if columns:
+                    return {'columns': columns, 'data': [tuple(row) for row in results]}
+        except ERROS_BANCO as e:
+            print(f"Erro ao executar query: {e}")
+            return None
+
+    async def stream_query(self, query, params=None, itersize=2000):
+        """Gerador assíncrono das linhas de `query`, buscando `itersize` por vez."""
+        sql = converter_placeholders(query)
+        try:
+            async with self.db.get_connection() as conn:
+                async with conn.transaction():
+                    async for row in conn.cursor(sql, *(params or ()), prefetch=itersize):
+                        yield tuple(row)
+        except ERROS_BANCO as e:
+            print(f"Erro ao executar query em streaming: {e}")
+
+    async def _executar_pagina(self, query, params, limite, tipo, chave):
+        resultado = await self.execute_query(query, params)
+        if resultado is None:
+            return None
+        proximo = None
+        if len(resultado['data']) > limite:
+            resultado['data'] = resultado['data'][:limite]
+            proximo = self._codificar_token(tipo, chave(resultado['data'][-1]))
+        resultado['proximo'] = proximo
+        return resultado
+
+    async def _em_cache(self, namespace, id_, carregar):
+        if NOTIFY_ATIVO:
+            iniciar_ouvinte_cache(self.db)
+        return await cache_entidades.obter_async(namespace, id_, carregar)
+
+    async def _notificar_cache(self, conn, namespace, ids):
+        if NOTIFY_ATIVO and ids:
+            await conn.execute(
+                "SELECT pg_notify($1, $2 || ':' || id) FROM unnest($3::text[]) AS id;",
+                CANAL_INVALIDACAO, namespace, [str(id_) for id_ in ids]
+            )
+
+    def _invalidar_cache(self, namespace, ids):
+        cache_entidades.invalidar(namespace, ids)
+
+
+class AsyncClienteCRUD(AsyncBaseCRUD):
+    _query_listar = ClienteCRUD._query_listar
+
+    async def _inserir_cliente(self, dados_cliente, insert_subtipo, dados_subtipo):
+        async with self.db.get_connection() as conn:
+            async with conn.transaction():
+                id_solicitante = await conn.fetchval(converter_placeholders(self.INSERT_SOLICITANTE))
+                id_cliente = await conn.fetchval(
+                    converter_placeholders(ClienteCRUD.INSERT_CLIENTE), *dados_cliente, id_solicitante)
+                await conn.execute(converter_placeholders(insert_subtipo), id_cliente, *dados_subtipo)
+                await self._notificar_cache(conn, 'cliente', [id_cliente])
+        self._invalidar_cache('cliente', [id_cliente])
+        return id_cliente
+
+    async def inserir_cliente_pf(self, nome, cpf, data_nascimento, email, telefone, endereco):
+        try:
+            id_cliente = await self._inserir_cliente(
+                (email, telefone, endereco), ClienteCRUD.INSERT_PF, (cpf, nome, _data(data_nascimento)))
+            print(f"Cliente PF '{nome}' inserido com sucesso! ID: {id_cliente}")
+            return id_cliente
+        except Exception as e:
+            print(f"Erro ao inserir cliente PF: {e}")
+            return None
+
+    async def inserir_cliente_pj(self, razao_social, cnpj, email, telefone, endereco):
+        try:
+            id_cliente = await self._inserir_cliente(
+                (email, telefone, endereco), ClienteCRUD.INSERT_PJ, (cnpj, razao_social))
+            print(f"Cliente PJ '{razao_social}' inserido com sucesso! ID: {id_cliente}")
+            return id_cliente
+        except Exception as e:
+            print(f"Erro ao inserir cliente PJ: {e}")
+            return None
+
+    async def listar_clientes(self, limite=None, token=None):
+        if limite is None and token is None:
+            query, params = self._query_listar()
+            return await self.execute_query(query, params)
+        limite = limite or 50
+        apos_id = self._decodificar_token('clientes', token, 1)[0] if token else None
+        query, params = self._query_listar(apos_id, limite + 1)
+        return await self._executar_pagina(query, params, limite, 'clientes', lambda row: (row[0],))
+
+    def iterar_clientes(self, itersize=2000):
+        query, params = self._query_listar()
+        return self.stream_query(query, params, itersize=itersize)
+
+    async def buscar_cliente_por_id(self, id_cliente):
+        return await self._em_cache('cliente', id_cliente,
+                                    lambda: self.execute_query(ClienteCRUD.QUERY_BUSCAR_POR_ID, (id_cliente,)))
+
+
+class AsyncMecanicoCRUD(AsyncBaseCRUD):
+    async def _inserir_mecanico(self, nome, telefone, especialidade, tipo, insert_subtipo, dados_subtipo):
+        async with self.db.get_connection() as conn:
+            async with conn.transaction():
+                id_solicitante = await conn.fetchval(converter_placeholders(self.INSERT_SOLICITANTE))
+                matricula = await conn.fetchval(converter_placeholders(MecanicoCRUD.INSERT_MECANICO),
+                                                nome, telefone, especialidade, tipo, id_solicitante)
+                await conn.execute(converter_placeholders(insert_subtipo), matricula, *dados_subtipo)
+        return matricula
+
+    async def inserir_efetivo(self, nome, telefone, especialidade, salario, registro_clt):
+        try:
+            matricula = await self._inserir_mecanico(nome, telefone, especialidade, 'efetivo',
+                                                     MecanicoCRUD.INSERT_EFETIVO, (salario, registro_clt))
+            print(f"Mecanico efetivo '{nome}' inserido com sucesso!")
+            return matricula
+        except Exception as e:
+            print(f"Erro ao inserir efetivo: {e}")
+            return None
+
+    async def inserir_freelancer(self, nome, telefone, especialidade, hora_servico):
+        try:
+            matricula = await self._inserir_mecanico(nome, telefone, especialidade, 'freelancer',
+                                                     MecanicoCRUD.INSERT_FREELANCER, (hora_servico,))
+            print(f"Mecanico freelancer '{nome}' inserido com sucesso!")
+            return matricula
+        except Exception as e:
+            print(f"Erro ao inserir freelancer: {e}")
+            return None
+
+    async def listar_mecanicos(self):
+        return await self.execute_query(MecanicoCRUD.QUERY_LISTAR)
+
+
+class AsyncVeiculoCRUD(AsyncBaseCRUD):
+    async def _inserir_veiculo(self, dados_veiculo, id_cliente, insert_subtipo, dados_subtipo):
+        async with self.db.get_connection() as conn:
+            async with conn.transaction():
+                veiculo_id = await conn.fetchval(converter_placeholders(VeiculoCRUD.INSERT_VEICULO),
+                                                 *dados_veiculo, id_cliente)
+                await conn.execute(converter_placeholders(insert_subtipo), veiculo_id, *dados_subtipo)
+                await self._notificar_cache(conn, 'veiculos_cliente', [id_cliente])
+        self._invalidar_cache('veiculos_cliente', [id_cliente])
+        return veiculo_id
+
+    async def inserir_carro(self, marca, cor, modelo, ano, id_cliente, numero_portas, tipo_combustivel, capacidade_passageiros):
+        try:
+            return await self._inserir_veiculo((marca, cor, modelo, ano), id_cliente, VeiculoCRUD.INSERT_CARRO,
+                                               (numero_portas, tipo_combustivel, capacidade_passageiros))
+        except Exception as e:
+            print(f"Erro ao inserir carro: {e}")
+            return None
+
+    async def inserir_moto(self, marca, cor, modelo, ano, id_cliente, cilindrada, tipo_moto):
+        try:
+            return await self._inserir_veiculo((marca, cor, modelo, ano), id_cliente, VeiculoCRUD.INSERT_MOTO,
+                                               (cilindrada, tipo_moto))
+        except Exception as e:
+            print(f"Erro ao inserir moto: {e}")
+            return None
+
+    async def listar_veiculos_cliente(self, id_cliente):
+        return await self._em_cache('veiculos_cliente', id_cliente,
+                                    lambda: self.execute_query(VeiculoCRUD.QUERY_LISTAR_CLIENTE, (id_cliente,)))
+
+
+class AsyncOrdemServicoCRUD(AsyncBaseCRUD):
+    _query_listar = OrdemServicoCRUD._query_listar
+
+    async def criar_ordem_servico(self, descricao, id_solicitante, data_abertura=None, status='Aberta'):
+        if data_abertura is None:
+            data_abertura = date.today()
+        try:
+            await self._garantir_mes(_data(data_abertura))
+            async with self.db.get_connection() as conn:
+                id_os = await conn.fetchval(converter_placeholders(OrdemServicoCRUD.INSERT_OS),
+                                            descricao, _data(data_abertura), status, id_solicitante)
+            print(f"Ordem de serviço criada com sucesso! ID: {id_os}")
+            return id_os
+        except Exception as e:
+            print(f"Erro ao criar OS: {e}")
+            return None
+
+    async def _garantir_mes(self, data_abertura):
+        # Mesmo cuidado de GerenciadorParticoes.garantir_mes, numa transação própria
+        mes = mes_a_garantir(data_abertura)
+        if mes is None:
+            return
+        try:
+            async with self.db.get_connection() as conn:
+                async with conn.transaction():
+                    await conn.execute(GerenciadorParticoes.GARANTIR_MES[0])
+                    await conn.execute(converter_placeholders(GerenciadorParticoes.GARANTIR_MES[1]),
+                                       mes, mes)
+        except ERROS_BANCO as e:
+            print(f"Erro ao garantir particoes de {mes:%Y-%m}: {e}")
+            return
+        marcar_mes_garantido(mes)
+
+    async def listar_ordens_servico(self, status=None, limite=None, token=None, data_inicio=None, data_fim=None):
+        data_inicio, data_fim = _data(data_inicio), _data(data_fim)
+        if limite is None and token is None:
+            query, params = self._query_listar(status, data_inicio=data_inicio, data_fim=data_fim)
+            return await self.execute_query(query, params)
+        limite = limite or 50
+        apos_id = self._decodificar_token('ordens', token, 1)[0] if token else None
+        query, params = self._query_listar(status, apos_id, limite + 1, data_inicio, data_fim)
+        return await self._executar_pagina(query, params, limite, 'ordens', lambda row: (row[0],))
+
+    def iterar_ordens_servico(self, status=None, itersize=2000, data_inicio=None, data_fim=None):
+        query, params = self._query_listar(status, data_inicio=_data(data_inicio), data_fim=_data(data_fim))
+        return self.stream_query(query, params, itersize=itersize)
+
+    async def atualizar_status_os(self, id_os, novo_status, data_abertura=None):
+        if data_abertura is None:
+            result = await self.execute_query(OrdemServicoCRUD.UPDATE_STATUS, (novo_status, id_os), fetch=False)
+        else:
+            result = await self.execute_query(OrdemServicoCRUD.UPDATE_STATUS_DATA,
+                                              (novo_status, id_os, _data(data_abertura)), fetch=False)
+        if result:
+            print(f"Status da OS {id_os} atualizado para '{novo_status}'")
+        return result
+
+
+class AsyncPecaCRUD(AsyncBaseCRUD):
+    _query_estoque = PecaCRUD._query_estoque
+    _query_pagina_estoque = PecaCRUD._query_pagina_estoque
+
+    async def inserir_peca(self, nome_peca, qt_estoque, valor_uni):
+        try:
+            async with self.db.get_connection() as conn:
+                cod_peca = await conn.fetchval(converter_placeholders(PecaCRUD.INSERT_PECA),
+                                               nome_peca, qt_estoque, valor_uni)
+            print(f"Peca '{nome_peca}' inserida com sucesso!")
+            return cod_peca
+        except Exception as e:
+            print(f"Erro ao inserir peca: {e}")
+            return None
+
+    async def listar_estoque(self, estoque_baixo=None, limite=None, token=None):
+        if limite is None and token is None:
+            query, params = self._query_estoque(estoque_baixo)
+            return await self.execute_query(query, params)
+        limite = limite or 50
+        apos = self._decodificar_token('estoque', token, 2) if token else None
+        query, params = self._query_pagina_estoque(estoque_baixo, apos, limite + 1)
+        return await self._executar_pagina(query, params, limite, 'estoque', lambda row: (row[1], row[0]))
+
+    def iterar_estoque(self, estoque_baixo=None, itersize=2000):
+        query, params = self._query_estoque(estoque_baixo)
+        return self.stream_query(query, params, itersize=itersize)
+
+    async def atualizar_estoque(self, cod_peca, nova_quantidade):
+        result = await self.execute_query(PecaCRUD.UPDATE_ESTOQUE, (nova_quantidade, cod_peca), fetch=False)
+        if result:
+            print(f"Estoque da peca {cod_peca} atualizado para {nova_quantidade}")
+        return result
+
+
+class AsyncRelatorioCRUD(AsyncBaseCRUD):
+    QUERY_OS_POR_STATUS = RelatorioCRUD.QUERY_OS_POR_STATUS
+    QUERY_OS_POR_STATUS_PERIODO = RelatorioCRUD.QUERY_OS_POR_STATUS_PERIODO
+    QUERY_SERVICOS_POR_MECANICO = RelatorioCRUD.QUERY_SERVICOS_POR_MECANICO
+    QUERY_SERVICOS_POR_MECANICO_PERIODO = RelatorioCRUD.QUERY_SERVICOS_POR_MECANICO_PERIODO
+    QUERY_CLIENTES_MAIS_ATIVOS = RelatorioCRUD.QUERY_CLIENTES_MAIS_ATIVOS
+    QUERY_CLIENTES_MAIS_ATIVOS_PERIODO = RelatorioCRUD.QUERY_CLIENTES_MAIS_ATIVOS_PERIODO
+    _query_periodo = RelatorioCRUD._query_periodo
+    _query_os_por_status = RelatorioCRUD._query_os_por_status
+    _query_servicos_por_mecanico = RelatorioCRUD._query_servicos_por_mecanico
+    _query_clientes_mais_ativos = RelatorioCRUD._query_clientes_mais_ativos
+
+    async def os_por_status(self, data_inicio=None, data_fim=None):
+        return await self.execute_query(*self._query_os_por_status(_data(data_inicio), _data(data_fim)))
+
+    async def servicos_por_mecanico(self, data_inicio=None, data_fim=None):
+        return await self.execute_query(*self._query_servicos_por_mecanico(_data(data_inicio), _data(data_fim)))
+
+    async def clientes_mais_ativos(self, limite=10, data_inicio=None, data_fim=None):
+        return await self.execute_query(
+            *self._query_clientes_mais_ativos(limite, _data(data_inicio), _data(data_fim)))
@@ -1,8 +1,19 @@
-from .db import Database
+import base64
+import json
+import uuid
+
+from . import colunar
+from .cache import NOTIFY_ATIVO, cache_entidades, iniciar_ouvinte_cache, notificar_invalidacao
+from .db import Database, sessao_atual
+from .preparados import executar
+from .replicas import em_leitura
 from psycopg2 import Error
+from psycopg2.extras import execute_values
 
 # Define um método para ser reutilizadob nos outros códigos
 class BaseCRUD:
+    INSERT_SOLICITANTE = "INSERT INTO solicitante DEFAULT VALUES RETURNING id_solicitante;"
+
     def __init__(self):
         self.db = Database()
 
@@ -10,14 +21,194 @@ class BaseCRUD:
         try:
             with self.db.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(query, params)
-                if fetch and cursor.description:
-                    columns = [desc[0] for desc in cursor.description]
-                    results = cursor.fetchall()
-                    return {'columns': columns, 'data': results}
-                elif not fetch:
-                    conn.commit()
-                    return cursor.rowcount
+                if fetch:
+                    return self._consultar(cursor, query, params)
+                self._executar(cursor, query, params)
+                conn.commit()
+                return cursor.rowcount
         except Error as e:
             print(f"Erro ao executar query: {e}")
             return None
+
+    def _consultar(self, cursor, query, params=None):
+        # Executa num cursor já aberto (ex.: numa transação com snapshot) e monta o resultado
+        self._executar(cursor, query, params)
+        if not cursor.description:
+            return None
+        columns = [desc[0] for desc in cursor.description]
+        return {'columns': columns, 'data': cursor.fetchall()}
+
+    def execute_query_colunar(self, query, params=None, formato='numpy'):
+        """Como execute_query, mas com um array NumPy por coluna (ou pyarrow.Table com formato='arrow')."""
+        try:
+            with self.db.get_connection() as conn:
+                return colunar.consultar(conn.cursor(), query, params, formato)
+        except Error as e:
+            print(f"Erro ao executar query colunar: {e}")
+            return None
+
+    def _executar(self, cursor, query, params=None):
+        # Ponto único de execução das consultas fixas; reaproveita prepared statements
+        return executar(cursor, query, params)
+
+    def stream_query(self, query, params=None, itersize=2000):
+        """Gera as linhas de `query` sob demanda, sem carregar o resultado inteiro.
+
+        Usa um cursor nomeado (server-side) que busca `itersize` linhas por vez;
+        a conexão fica em uso até o gerador ser consumido ou fechado.
+        """
+        # O gerador só abre a conexão na primeira iteração, quando o método
+        # @rota_leitura que o criou já retornou: a rota é decidida agora
+        rota = self.db.escolher_rota() if em_leitura() else None
+        return self._stream_query(query, params, itersize, rota)
+
+    def _stream_query(self, query, params, itersize, rota):
+        try:
+            with self.db.get_connection(rota=rota) as conn:
+                cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+                cursor.itersize = itersize
+                try:
+                    cursor.execute(query, params)
+                    for row in cursor:
+                        yield row
+                finally:
+                    if not cursor.closed and not conn.closed:
+                        try:
+                            cursor.close()
+                        except Error:
+                            pass
+        except Error as e:
+            print(f"Erro ao executar query em streaming: {e}")
+
+    def _em_cache(self, namespace, id_, carregar):
+        # Leitura via cache de entidades (read-through); numa sessão lê do banco para
+        # enxergar as próprias escritas ainda não confirmadas
+        if sessao_atual() is not None:
+            return carregar()
+        if NOTIFY_ATIVO:
+            iniciar_ouvinte_cache(self.db)
+        return cache_entidades.obter(namespace, id_, carregar)
+
+    def _notificar_cache(self, cursor, namespace, ids):
+        # Dentro da transação da escrita: avisa os outros processos no commit
+        notificar_invalidacao(cursor, namespace, ids)
+
+    def _invalidar_cache(self, namespace, ids):
+        # Depois do commit: descarta as entradas locais afetadas (numa sessão, quando ela confirmar)
+        sessao = sessao_atual()
+        if sessao is not None:
+            ids = list(ids)
+            sessao.apos_commit(lambda: cache_entidades.invalidar(namespace, ids))
+            return
+        cache_entidades.invalidar(namespace, ids)
+
+    def _filtro_periodo(self, coluna, data_inicio=None, data_fim=None):
+        # Intervalo [data_inicio, data_fim) sobre a chave de partição: o planner só
+        # lê as partições dos meses pedidos (também em prepared statements, na execução)
+        condicoes, params = [], []
+        if data_inicio is not None:
+            condicoes.append(f"{coluna} >= %s")
+            params.append(data_inicio)
+        if data_fim is not None:
+            condicoes.append(f"{coluna} < %s")
+            params.append(data_fim)
+        return condicoes, params
+
+    def _codificar_token(self, tipo, chave):
+        # Token opaco de continuação: a chave da última linha da página
+        bruto = json.dumps({'t': tipo, 'k': list(chave)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+    def _decodificar_token(self, tipo, token, tamanho):
+        # `tamanho`: quantos valores a chave do keyset desse tipo tem
+        try:
+            bruto = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            conteudo = json.loads(bruto)
+            chave = conteudo['k']
+            if conteudo['t'] != tipo or not isinstance(chave, list) or len(chave) != tamanho:
+                raise ValueError
+            if not all(valor is None or isinstance(valor, (str, int, float)) for valor in chave):
+                raise ValueError
+            return chave
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"Token de paginação inválido: {token!r}")
+
+    def _executar_pagina(self, query, params, limite, tipo, chave):
+        """Executa uma página (query com LIMIT limite + 1) e monta o token da próxima.
+
+        `chave(linha)` extrai da última linha os valores usados no próximo keyset.
+        """
+        resultado = self.execute_query(query, params)
+        if resultado is None:
+            return None
+        proximo = None
+        if len(resultado['data']) > limite:
+            resultado['data'] = resultado['data'][:limite]
+            proximo = self._codificar_token(tipo, chave(resultado['data'][-1]))
+        resultado['proximo'] = proximo
+        return resultado
+
+    def _reservar_ids(self, cursor, tabela, coluna, quantidade):
+        # Reserva ids da sequence do SERIAL de uma vez, na ordem de entrada
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s);",
+            (tabela, coluna, quantidade)
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def _inserir_multiplos(self, cursor, query, linhas):
+        execute_values(cursor, query, linhas, page_size=max(len(linhas), 1))
+
+    def _executar_lote(self, registros, campos, inserir, descricao, apos_inserir=None):
+        """Insere registros (dicts com as chaves de `campos`) numa única transação.
+
+        `inserir(cursor, linhas)` recebe tuplas na ordem de `campos` e devolve os ids
+        na mesma ordem. Se o lote falhar no banco, cada linha é refeita em seu próprio
+        savepoint para que apenas as linhas com problema sejam rejeitadas.
+        `apos_inserir(cursor, linhas, ids)`, se informado, roda antes do commit com as
+        linhas efetivamente inseridas (por exemplo, para notificar invalidações de cache).
+        Retorna {'ids': [...], 'erros': [(indice, mensagem), ...]}, com None nos ids
+        das linhas rejeitadas.
+        """
+        registros = list(registros)
+        resultado = {'ids': [None] * len(registros), 'erros': []}
+        validos = []
+        for i, registro in enumerate(registros):
+            try:
+                validos.append((i, tuple(registro[campo] for campo in campos)))
+            except (KeyError, TypeError) as e:
+                resultado['erros'].append((i, f"Campo obrigatório ausente: {e}"))
+        if not validos:
+            return resultado
+
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SAVEPOINT lote;")
+                try:
+                    ids = inserir(cursor, [linha for _, linha in validos])
+                    for (i, _), id_gerado in zip(validos, ids):
+                        resultado['ids'][i] = id_gerado
+                except Error:
+                    cursor.execute("ROLLBACK TO SAVEPOINT lote;")
+                    for i, linha in validos:
+                        cursor.execute("SAVEPOINT linha;")
+                        try:
+                            resultado['ids'][i] = inserir(cursor, [linha])[0]
+                            cursor.execute("RELEASE SAVEPOINT linha;")
+                        except Error as e:
+                            cursor.execute("ROLLBACK TO SAVEPOINT linha;")
+                            resultado['erros'].append((i, str(e).strip()))
+                if apos_inserir is not None:
+                    inseridos = [(linha, resultado['ids'][i]) for i, linha in validos
+                                 if resultado['ids'][i] is not None]
+                    apos_inserir(cursor, [linha for linha, _ in inseridos], [id_ for _, id_ in inseridos])
+                conn.commit()
+        except Exception as e:
+            print(f"Erro ao inserir lote de {descricao}: {e}")
+            return None
+
+        resultado['erros'].sort()
+        inseridos = len(registros) - len(resultado['erros'])
+        print(f"Lote de {descricao}: {inseridos} inseridos, {len(resultado['erros'])} com erro")
+        return resultado
@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .ouvinte import obter_ouvinte
+
+CANAL_INVALIDACAO = 'oficina_cache'
+
+
+# Cache em memória (LRU + TTL) para consultas repetidas de entidades.
+# Chaves são (namespace, id); escritas feitas pelos CRUDs invalidam as chaves afetadas.
+class CacheLRU:
+    def __init__(self, max_itens=10000, ttl=60):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._dados = OrderedDict()  # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+        # Incrementada a cada invalidação: cargas iniciadas antes dela não são guardadas
+        self._versao = 0
+        self._stats = {'hits': 0, 'misses': 0, 'expirados': 0, 'removidos_lru': 0, 'invalidacoes': 0}
+
+    @property
+    def ativo(self):
+        return self.ttl > 0 and self.max_itens > 0
+
+    def _copiar(self, valor):
+        # Resultados no formato {'columns': [...], 'data': [...]}; o chamador recebe listas próprias
+        if isinstance(valor, dict):
+            return {k: list(v) if isinstance(v, list) else v for k, v in valor.items()}
+        return valor
+
+    def _consultar(self, chave):
+        # Retorna (True, valor) num acerto ou (False, versão atual) numa falta
+        agora = time.monotonic()
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is not None:
+                if item[0] > agora:
+                    self._dados.move_to_end(chave)
+                    self._stats['hits'] += 1
+                    return True, self._copiar(item[1])
+                del self._dados[chave]
+                self._stats['expirados'] += 1
+            self._stats['misses'] += 1
+            return False, self._versao
+
+    def _guardar(self, chave, valor, versao):
+        with self._lock:
+            if versao == self._versao:
+                self._dados[chave] = (time.monotonic() + self.ttl, valor)
+                self._dados.move_to_end(chave)
+                while len(self._dados) > self.max_itens:
+                    self._dados.popitem(last=False)
+                    self._stats['removidos_lru'] += 1
+        return self._copiar(valor)
+
+    def obter(self, namespace, id_, carregar):
+        """Retorna o valor em cache ou chama `carregar()` e guarda o resultado (se não for None)."""
+        if not self.ativo:
+            return carregar()
+        chave = (namespace, str(id_))
+        achou, item = self._consultar(chave)
+        if achou:
+            return item
+        valor = carregar()
+        return None if valor is None else self._guardar(chave, valor, item)
+
+    async def obter_async(self, namespace, id_, carregar):
+        """Como obter(), mas `carregar()` é uma corrotina."""
+        if not self.ativo:
+            return await carregar()
+        chave = (namespace, str(id_))
+        achou, item = self._consultar(chave)
+        if achou:
+            return item
+        valor = await carregar()
+        return None if valor is None else self._guardar(chave, valor, item)
+
+    def invalidar(self, namespace, ids):
+        with self._lock:
+            self._versao += 1
+            for id_ in ids:
+                if self._dados.pop((namespace, str(id_)), None) is not None:
+                    self._stats['invalidacoes'] += 1
+
+    def invalidar_namespace(self, namespace):
+        with self._lock:
+            self._versao += 1
+            for chave in [c for c in self._dados if c[0] == namespace]:
+                del self._dados[chave]
+                self._stats['invalidacoes'] += 1
+
+    def limpar(self):
+        with self._lock:
+            self._versao += 1
+            self._dados.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['itens'] = len(self._dados)
+        consultas = stats['hits'] + stats['misses']
+        stats['taxa_acerto'] = stats['hits'] / consultas if consultas else 0.0
+        return stats
+
+
+cache_entidades = CacheLRU(
+    max_itens=int(os.getenv('CACHE_MAX_ITENS', 10000)),
+    ttl=float(os.getenv('CACHE_TTL', 60)),
+)
+
+# Com CACHE_NOTIFY=1 as escritas também publicam a invalidação via NOTIFY, e cada
+# processo escuta o canal para descartar o que outro nó alterou
+NOTIFY_ATIVO = os.getenv('CACHE_NOTIFY', '0') == '1'
+
+
+def notificar_invalidacao(cursor, namespace, ids):
+    """Publica a invalidação na transação do cursor; o NOTIFY só é entregue no commit."""
+    if not NOTIFY_ATIVO or not ids:
+        return
+    cursor.execute(
+        "SELECT pg_notify(%s, %s || ':' || id) FROM unnest(%s::text[]) AS id;",
+        (CANAL_INVALIDACAO, namespace, [str(id_) for id_ in ids])
+    )
+
+
+def _ao_notificar(payload):
+    namespace, _, id_ = payload.partition(':')
+    if id_ == '*':
+        cache_entidades.invalidar_namespace(namespace)
+    else:
+        cache_entidades.invalidar(namespace, [id_])
+
+
+_ouvinte_iniciado = False
+_ouvinte_lock = threading.Lock()
+
+
+def iniciar_ouvinte_cache(db):
+    """Escuta o canal de invalidação (uma vez por processo). Após reconectar, limpa
+    o cache inteiro, pois notificações podem ter sido perdidas enquanto estava fora."""
+    global _ouvinte_iniciado
+    with _ouvinte_lock:
+        if _ouvinte_iniciado:
+            return
+        ouvinte = obter_ouvinte(db.params)
+        ouvinte.registrar(CANAL_INVALIDACAO, _ao_notificar)
+        ouvinte.ao_conectar(cache_entidades.limpar)
+        ouvinte.iniciar()
+        _ouvinte_iniciado = True
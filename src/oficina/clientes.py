@@ -1,23 +1,129 @@
+import json
+import re
+from datetime import date
+from decimal import Decimal
+
+from psycopg2 import Error
+
 from .base import BaseCRUD
+from .replicas import rota_leitura
 
 # Métodos para inserir, buscar e listar clientes pessoa física e jurídica
 class ClienteCRUD(BaseCRUD):
+    INSERT_CLIENTE = "INSERT INTO cliente (email, telefone, endereco, id_solicitante) VALUES (%s, %s, %s, %s) RETURNING id_cliente;"
+    INSERT_PF = "INSERT INTO pessoa_fisica (id_cliente, cpf, nome, data_nascimento) VALUES (%s, %s, %s, %s);"
+    INSERT_PJ = "INSERT INTO pessoa_juridica (id_cliente, cnpj, razao_social) VALUES (%s, %s, %s);"
+    QUERY_BUSCAR_POR_ID = """
+        SELECT 
+            c.id_cliente, c.email, c.telefone, c.endereco,
+            COALESCE(pf.nome, pj.razao_social) as nome_razao,
+            CASE WHEN pf.id_cliente IS NOT NULL THEN 'PF' ELSE 'PJ' END as tipo,
+            COALESCE(pf.cpf, pj.cnpj) as documento,
+            pf.data_nascimento
+        FROM cliente c
+        LEFT JOIN pessoa_fisica pf ON c.id_cliente = pf.id_cliente
+        LEFT JOIN pessoa_juridica pj ON c.id_cliente = pj.id_cliente
+        WHERE c.id_cliente = %s;
+        """
+
+    # Ficha completa (cliente, veículos, ordens com execuções e peças, totais) montada
+    # no servidor em um único JSON por cliente; cada nível é agregado num LATERAL que
+    # usa os índices das FKs (as filhas da OS casam pela chave de partição)
+    QUERY_COMPLETO = """
+        SELECT c.id_cliente, json_build_object(
+            'id_cliente', c.id_cliente,
+            'tipo', CASE WHEN pf.id_cliente IS NOT NULL THEN 'PF' ELSE 'PJ' END,
+            'nome_razao', COALESCE(pf.nome, pj.razao_social),
+            'documento', COALESCE(pf.cpf, pj.cnpj),
+            'data_nascimento', pf.data_nascimento,
+            'email', c.email, 'telefone', c.telefone, 'endereco', c.endereco,
+            'veiculos', COALESCE(v.veiculos, '[]'),
+            'ordens_servico', COALESCE(o.ordens, '[]'),
+            'totais', json_build_object(
+                'veiculos', COALESCE(v.total, 0),
+                'ordens_servico', COALESCE(o.total, 0),
+                'ordens_por_status', COALESCE(st.por_status, '{}'),
+                'execucoes', COALESCE(o.execucoes, 0),
+                'tempo_gasto_segundos', COALESCE(o.segundos, 0),
+                'valor_servicos', COALESCE(o.valor_servicos, 0),
+                'pecas_utilizadas', COALESCE(o.itens, 0),
+                'valor_pecas', COALESCE(o.valor_pecas, 0)
+            )
+        )::text
+        FROM cliente c
+        LEFT JOIN pessoa_fisica pf ON c.id_cliente = pf.id_cliente
+        LEFT JOIN pessoa_juridica pj ON c.id_cliente = pj.id_cliente
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) as total, json_agg(json_build_object(
+                'veiculo_id', ve.veiculo_id, 'marca', ve.marca, 'cor', ve.cor, 'modelo', ve.modelo, 'ano', ve.ano,
+                'tipo', CASE WHEN ca.veiculo_id IS NOT NULL THEN 'carro' WHEN mo.veiculo_id IS NOT NULL THEN 'moto' END,
+                'numero_portas', ca.numero_portas, 'tipo_combustivel', ca.tipo_combustivel,
+                'capacidade_passageiros', ca.capacidade_passageiros,
+                'cilindrada', mo.cilindrada, 'tipo_moto', mo.tipo_moto
+            ) ORDER BY ve.veiculo_id) as veiculos
+            FROM veiculo ve
+            LEFT JOIN carro ca ON ca.veiculo_id = ve.veiculo_id
+            LEFT JOIN moto mo ON mo.veiculo_id = ve.veiculo_id
+            WHERE ve.id_cliente = c.id_cliente
+        ) v ON true
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) as total, SUM(e.total) as execucoes, SUM(e.segundos) as segundos,
+                SUM(e.valor) as valor_servicos, SUM(u.itens) as itens, SUM(u.valor) as valor_pecas,
+                json_agg(json_build_object(
+                    'id_os', os.id_os, 'descricao', os.descricao, 'data_abertura', os.data_abertura,
+                    'status', os.status,
+                    'execucoes', COALESCE(e.execucoes, '[]'),
+                    'pecas', COALESCE(u.pecas, '[]'),
+                    'valor_servicos', COALESCE(e.valor, 0),
+                    'valor_pecas', COALESCE(u.valor, 0)
+                ) ORDER BY os.id_os DESC) as ordens
+            FROM ordem_servico os
+            LEFT JOIN LATERAL (
+                SELECT COUNT(*) as total, SUM(EXTRACT(EPOCH FROM ex.tempo_gasto)) as segundos,
+                    SUM(se.valor_padrao) as valor,
+                    json_agg(json_build_object(
+                        'id_execucao', ex.id_execucao, 'id_mecanico', ex.id_mecanico, 'mecanico', me.nome,
+                        'id_servico', ex.id_servico, 'tempo_estimado', se.tempo_estimado,
+                        'valor_padrao', se.valor_padrao,
+                        'tempo_gasto_segundos', EXTRACT(EPOCH FROM ex.tempo_gasto)
+                    ) ORDER BY ex.id_execucao) as execucoes
+                FROM execucao_servico ex
+                LEFT JOIN mecanico me ON me.matricula_mec = ex.id_mecanico
+                LEFT JOIN servico se ON se.id_servico = ex.id_servico
+                WHERE ex.id_os = os.id_os AND ex.data_abertura_os = os.data_abertura
+            ) e ON true
+            LEFT JOIN LATERAL (
+                SELECT SUM(up.quantidade) as itens, SUM(up.quantidade * pe.valor_uni) as valor,
+                    json_agg(json_build_object(
+                        'cod_peca', up.id_peca, 'nome_peca', pe.nome_peca, 'quantidade', up.quantidade,
+                        'valor_uni', pe.valor_uni, 'valor_total', up.quantidade * pe.valor_uni
+                    ) ORDER BY up.id_peca) as pecas
+                FROM utiliza_peca up
+                JOIN peca pe ON pe.cod_peca = up.id_peca
+                WHERE up.id_os = os.id_os AND up.data_abertura_os = os.data_abertura
+            ) u ON true
+            WHERE os.id_solicitante = c.id_solicitante
+        ) o ON true
+        LEFT JOIN LATERAL (
+            SELECT json_object_agg(status, quantidade) as por_status
+            FROM (SELECT COALESCE(status, '') as status, COUNT(*) as quantidade
+                  FROM ordem_servico WHERE id_solicitante = c.id_solicitante GROUP BY 1) s
+        ) st ON true
+        WHERE c.id_cliente = ANY(%s);
+        """
+
     def inserir_cliente_pf(self, nome, cpf, data_nascimento, email, telefone, endereco):
         try:
             with self.db.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("INSERT INTO solicitante DEFAULT VALUES RETURNING id_solicitante;")
+                self._executar(cursor, self.INSERT_SOLICITANTE)
                 id_solicitante = cursor.fetchone()[0]
-                cursor.execute(
-                    "INSERT INTO cliente (email, telefone, endereco, id_solicitante) VALUES (%s, %s, %s, %s) RETURNING id_cliente;",
-                    (email, telefone, endereco, id_solicitante)
-                )
+                self._executar(cursor, self.INSERT_CLIENTE, (email, telefone, endereco, id_solicitante))
                 id_cliente = cursor.fetchone()[0]
-                cursor.execute(
-                    "INSERT INTO pessoa_fisica (id_cliente, cpf, nome, data_nascimento) VALUES (%s, %s, %s, %s);",
-                    (id_cliente, cpf, nome, data_nascimento)
-                )
+                self._executar(cursor, self.INSERT_PF, (id_cliente, cpf, nome, data_nascimento))
+                self._notificar_cache(cursor, 'cliente', [id_cliente])
                 conn.commit()
+                self._invalidar_cache('cliente', [id_cliente])
                 print(f"Cliente PF '{nome}' inserido com sucesso! ID: {id_cliente}")
                 return id_cliente
         except Exception as e:
@@ -28,25 +134,66 @@ class ClienteCRUD(BaseCRUD):
         try:
             with self.db.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("INSERT INTO solicitante DEFAULT VALUES RETURNING id_solicitante;")
+                self._executar(cursor, self.INSERT_SOLICITANTE)
                 id_solicitante = cursor.fetchone()[0]
-                cursor.execute(
-                    "INSERT INTO cliente (email, telefone, endereco, id_solicitante) VALUES (%s, %s, %s, %s) RETURNING id_cliente;",
-                    (email, telefone, endereco, id_solicitante)
-                )
+                self._executar(cursor, self.INSERT_CLIENTE, (email, telefone, endereco, id_solicitante))
                 id_cliente = cursor.fetchone()[0]
-                cursor.execute(
-                    "INSERT INTO pessoa_juridica (id_cliente, cnpj, razao_social) VALUES (%s, %s, %s);",
-                    (id_cliente, cnpj, razao_social)
-                )
+                self._executar(cursor, self.INSERT_PJ, (id_cliente, cnpj, razao_social))
+                self._notificar_cache(cursor, 'cliente', [id_cliente])
                 conn.commit()
+                self._invalidar_cache('cliente', [id_cliente])
                 print(f"Cliente PJ '{razao_social}' inserido com sucesso! ID: {id_cliente}")
                 return id_cliente
         except Exception as e:
             print(f"Erro ao inserir cliente PJ: {e}")
             return None
 
-    def listar_clientes(self):
+    def _inserir_clientes(self, cursor, linhas, inserir_subtipo):
+        # linhas: (email, telefone, endereco, *campos do subtipo)
+        n = len(linhas)
+        ids_solicitante = self._reservar_ids(cursor, 'solicitante', 'id_solicitante', n)
+        ids_cliente = self._reservar_ids(cursor, 'cliente', 'id_cliente', n)
+        self._inserir_multiplos(
+            cursor,
+            "INSERT INTO solicitante (id_solicitante) VALUES %s;",
+            [(id_solicitante,) for id_solicitante in ids_solicitante]
+        )
+        self._inserir_multiplos(
+            cursor,
+            "INSERT INTO cliente (id_cliente, email, telefone, endereco, id_solicitante) VALUES %s;",
+            [(id_cliente,) + linha[:3] + (id_solicitante,)
+             for id_cliente, id_solicitante, linha in zip(ids_cliente, ids_solicitante, linhas)]
+        )
+        inserir_subtipo(cursor, [(id_cliente,) + linha[3:] for id_cliente, linha in zip(ids_cliente, linhas)])
+        return ids_cliente
+
+    def _notificar_lote(self, cursor, linhas, ids):
+        self._notificar_cache(cursor, 'cliente', ids)
+
+    def _invalidar_lote(self, resultado):
+        if resultado is not None:
+            self._invalidar_cache('cliente', [id_ for id_ in resultado['ids'] if id_ is not None])
+        return resultado
+
+    def inserir_cliente_pf_lote(self, clientes):
+        """Insere vários clientes PF (dicts com os argumentos de inserir_cliente_pf) em uma transação."""
+        def inserir(cursor, linhas):
+            return self._inserir_clientes(cursor, linhas, lambda cur, sub: self._inserir_multiplos(
+                cur, "INSERT INTO pessoa_fisica (id_cliente, nome, cpf, data_nascimento) VALUES %s;", sub))
+        campos = ('email', 'telefone', 'endereco', 'nome', 'cpf', 'data_nascimento')
+        return self._invalidar_lote(self._executar_lote(
+            clientes, campos, inserir, "clientes PF", apos_inserir=self._notificar_lote))
+
+    def inserir_cliente_pj_lote(self, clientes):
+        """Insere vários clientes PJ (dicts com os argumentos de inserir_cliente_pj) em uma transação."""
+        def inserir(cursor, linhas):
+            return self._inserir_clientes(cursor, linhas, lambda cur, sub: self._inserir_multiplos(
+                cur, "INSERT INTO pessoa_juridica (id_cliente, razao_social, cnpj) VALUES %s;", sub))
+        campos = ('email', 'telefone', 'endereco', 'razao_social', 'cnpj')
+        return self._invalidar_lote(self._executar_lote(
+            clientes, campos, inserir, "clientes PJ", apos_inserir=self._notificar_lote))
+
+    def _query_listar(self, apos_id=None, limite=None):
         query = """
         SELECT 
             c.id_cliente, c.email, c.telefone, c.endereco,
@@ -56,21 +203,142 @@ class ClienteCRUD(BaseCRUD):
         FROM cliente c
         LEFT JOIN pessoa_fisica pf ON c.id_cliente = pf.id_cliente
         LEFT JOIN pessoa_juridica pj ON c.id_cliente = pj.id_cliente
-        ORDER BY c.id_cliente;
         """
-        return self.execute_query(query)
+        params = []
+        if apos_id is not None:
+            query += " WHERE c.id_cliente > %s"
+            params.append(apos_id)
+        query += " ORDER BY c.id_cliente"
+        if limite:
+            query += " LIMIT %s"
+            params.append(limite)
+        return query + ";", tuple(params) or None
 
-    def buscar_cliente_por_id(self, id_cliente):
-        query = """
-        SELECT 
+    @rota_leitura
+    def listar_clientes(self, limite=None, token=None):
+        """Lista os clientes por id. Com `limite`, retorna uma página e o token `proximo`
+        (None na última página) a ser passado na chamada seguinte."""
+        if limite is None and token is None:
+            query, params = self._query_listar()
+            return self.execute_query(query, params)
+        limite = limite or 50
+        apos_id = self._decodificar_token('clientes', token, 1)[0] if token else None
+        query, params = self._query_listar(apos_id, limite + 1)
+        return self._executar_pagina(query, params, limite, 'clientes', lambda row: (row[0],))
+
+    @rota_leitura
+    def iterar_clientes(self, itersize=2000):
+        # Mesmas linhas de listar_clientes, entregues aos poucos via cursor server-side
+        query, params = self._query_listar()
+        return self.stream_query(query, params, itersize=itersize)
+
+    # Colunas de listar_clientes mais a relevância (1 = documento exato)
+    QUERY_BUSCAR_DETALHES = """
+        SELECT
             c.id_cliente, c.email, c.telefone, c.endereco,
             COALESCE(pf.nome, pj.razao_social) as nome_razao,
             CASE WHEN pf.id_cliente IS NOT NULL THEN 'PF' ELSE 'PJ' END as tipo,
             COALESCE(pf.cpf, pj.cnpj) as documento,
-            pf.data_nascimento
-        FROM cliente c
+            k.relevancia
+        FROM candidatos k
+        JOIN cliente c ON c.id_cliente = k.id_cliente
         LEFT JOIN pessoa_fisica pf ON c.id_cliente = pf.id_cliente
         LEFT JOIN pessoa_juridica pj ON c.id_cliente = pj.id_cliente
-        WHERE c.id_cliente = %s;
+        ORDER BY k.relevancia DESC, c.id_cliente
+        LIMIT %s;
+        """
+
+    # Trecho de nome/razão social: vizinhos mais próximos por trigramas (índices GiST).
+    # <% filtra pelo pg_trgm.word_similarity_threshold e <<-> ordena pela distância.
+    QUERY_BUSCAR_NOME = """
+        WITH candidatos AS (
+            SELECT id_cliente, MAX(relevancia) AS relevancia FROM (
+                (SELECT id_cliente, 1 - (%s <<-> nome) AS relevancia FROM pessoa_fisica
+                 WHERE %s <%% nome ORDER BY %s <<-> nome LIMIT %s)
+                UNION ALL
+                (SELECT id_cliente, 1 - (%s <<-> razao_social) FROM pessoa_juridica
+                 WHERE %s <%% razao_social ORDER BY %s <<-> razao_social LIMIT %s)
+            ) t GROUP BY id_cliente
+        )
+        """ + QUERY_BUSCAR_DETALHES
+
+    # Só dígitos: prefixo de CPF/CNPJ (documento exato primeiro) ou de telefone
+    QUERY_BUSCAR_NUMERO = """
+        WITH candidatos AS (
+            SELECT id_cliente, MAX(relevancia) AS relevancia FROM (
+                (SELECT id_cliente, CASE WHEN cpf = %s THEN 1.0 ELSE 0.9 END AS relevancia
+                 FROM pessoa_fisica WHERE cpf LIKE %s ORDER BY cpf LIMIT %s)
+                UNION ALL
+                (SELECT id_cliente, CASE WHEN cnpj = %s THEN 1.0 ELSE 0.9 END
+                 FROM pessoa_juridica WHERE cnpj LIKE %s ORDER BY cnpj LIMIT %s)
+                UNION ALL
+                (SELECT id_cliente, 0.8 FROM cliente WHERE telefone LIKE %s ORDER BY telefone LIMIT %s)
+            ) t GROUP BY id_cliente
+        )
+        """ + QUERY_BUSCAR_DETALHES
+
+    @rota_leitura
+    def buscar_clientes(self, termo, limite=20):
+        """Busca clientes por trecho do nome/razão social ou prefixo de CPF, CNPJ ou telefone.
+
+        Termos só com dígitos (pontuação é ignorada, ex.: '123.456') são tratados como
+        documento/telefone; os demais, como nome. Resultados vêm da maior para a menor relevância.
+        """
+        termo = (termo or '').strip()
+        if not termo:
+            print("Informe um termo de busca")
+            return None
+        digitos = re.sub(r'[\s.\-/()]', '', termo)
+        if digitos.isascii() and digitos.isdigit():
+            prefixo = digitos + '%'
+            params = (digitos, prefixo, limite, digitos, prefixo, limite, prefixo, limite, limite)
+            return self.execute_query(self.QUERY_BUSCAR_NUMERO, params)
+        params = (termo, termo, termo, limite) * 2 + (limite,)
+        return self.execute_query(self.QUERY_BUSCAR_NOME, params)
+
+    @rota_leitura
+    def buscar_cliente_completo(self, id_cliente):
+        """Ficha completa do cliente numa única consulta: dados cadastrais, veículos (com os
+        campos de carro/moto), ordens de serviço com execuções e peças usadas, e totais.
+
+        Retorna um dict (valores monetários em Decimal, datas em date) ou None se o
+        cliente não existir ou a consulta falhar.
         """
-        return self.execute_query(query, (id_cliente,))
+        clientes = self.buscar_clientes_completos([id_cliente])
+        if clientes is None:
+            return None
+        if id_cliente not in clientes:
+            print(f"Cliente {id_cliente} não encontrado")
+            return None
+        return clientes[id_cliente]
+
+    @rota_leitura
+    def buscar_clientes_completos(self, ids_cliente):
+        """Como buscar_cliente_completo para vários clientes de uma vez: {id_cliente: ficha}.
+
+        Ids inexistentes ficam de fora do resultado.
+        """
+        ids = sorted(set(ids_cliente))
+        if not ids:
+            return {}
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                self._executar(cursor, self.QUERY_COMPLETO, (ids,))
+                return {id_cliente: self._ficha(texto) for id_cliente, texto in cursor.fetchall()}
+        except Error as e:
+            print(f"Erro ao buscar ficha completa de clientes: {e}")
+            return None
+
+    def _ficha(self, texto):
+        # JSON em texto para manter NUMERIC como Decimal; datas voltam de ISO para date
+        ficha = json.loads(texto, parse_float=Decimal)
+        if ficha['data_nascimento'] is not None:
+            ficha['data_nascimento'] = date.fromisoformat(ficha['data_nascimento'])
+        for ordem in ficha['ordens_servico']:
+            ordem['data_abertura'] = date.fromisoformat(ordem['data_abertura'])
+        return ficha
+
+    def buscar_cliente_por_id(self, id_cliente):
+        return self._em_cache('cliente', id_cliente,
+                              lambda: self.execute_query(self.QUERY_BUSCAR_POR_ID, (id_cliente,)))
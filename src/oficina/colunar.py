@@ -0,0 +1,226 @@
+import io
+
+from psycopg2.extensions import encodings
+
+try:
+    import numpy as np
+except ImportError:  # dependência opcional, necessária apenas para o formato colunar
+    np = None
+
+try:
+    import pyarrow
+    import pyarrow.csv as pyarrow_csv
+    import pyarrow.parquet as pyarrow_parquet
+except ImportError:  # opcional: sem ele o resultado é montado a partir das linhas
+    pyarrow = None
+
+# Resultados em formato colunar (um array NumPy por coluna, com dtype nativo)
+# para relatórios analíticos. Com pyarrow instalado o resultado vem do servidor
+# via COPY ... TO STDOUT (CSV) e é convertido direto para Arrow/NumPy, sem criar
+# uma tupla Python por linha; sem pyarrow, as linhas são buscadas normalmente e
+# transpostas.
+#
+# Formato 'numpy': {'columns': [...], 'data': {coluna: ndarray}}
+# Formato 'arrow': pyarrow.Table
+
+# OID do tipo no Postgres -> categoria usada na conversão
+_CATEGORIAS = {
+    16: 'bool',
+    20: 'int', 21: 'int', 23: 'int', 26: 'int',
+    700: 'float', 701: 'float', 1700: 'float', 1186: 'float',
+    1082: 'date',
+    1114: 'timestamp', 1184: 'timestamp',
+    18: 'text', 19: 'text', 25: 'text', 1042: 'text', 1043: 'text',
+}
+
+# Conversões feitas no servidor para que cada coluna chegue num tipo que o NumPy representa:
+# NUMERIC vira float8, INTERVAL vira segundos e TIMESTAMPTZ vira horário UTC
+_CONVERSOES = {
+    1700: "{}::float8",
+    1186: "EXTRACT(EPOCH FROM {})::float8",
+    1184: "({} AT TIME ZONE 'UTC')",
+}
+
+_DTYPES = {
+    'int': 'int64',
+    'float': 'float64',
+    'bool': 'bool',
+    'date': 'datetime64[D]',
+    'timestamp': 'datetime64[us]',
+    'text': 'object',
+}
+
+FREQUENCIAS = ('D', 'W', 'M', 'Y')
+
+
+def _exigir_numpy():
+    if np is None:
+        raise ImportError("O formato colunar requer o pacote numpy (pip install numpy)")
+
+
+def _exigir_pyarrow():
+    if pyarrow is None:
+        raise ImportError("Saída Arrow/Parquet requer o pacote pyarrow (pip install pyarrow)")
+
+
+def _tipos_arrow():
+    return {
+        'int': pyarrow.int64(),
+        'float': pyarrow.float64(),
+        'bool': pyarrow.bool_(),
+        'date': pyarrow.date32(),
+        'timestamp': pyarrow.timestamp('us'),
+        'text': pyarrow.string(),
+    }
+
+
+def _preparar(cursor, query, params):
+    # Descobre os tipos das colunas sem trazer linhas e monta a consulta convertida
+    corpo = query.strip().rstrip(';')
+    cursor.execute(f"SELECT * FROM ({corpo}) AS q LIMIT 0", params)
+    nomes = [desc[0] for desc in cursor.description]
+    tipos = [desc[1] for desc in cursor.description]
+    apelidos = [f"c{i}" for i in range(len(nomes))]
+    expressoes = []
+    for apelido, tipo in zip(apelidos, tipos):
+        if tipo in _CONVERSOES:
+            expressoes.append(_CONVERSOES[tipo].format(apelido))
+        elif tipo in _CATEGORIAS:
+            expressoes.append(apelido)
+        else:
+            expressoes.append(f"{apelido}::text")
+    convertida = f"SELECT {', '.join(expressoes)} FROM ({corpo}) AS q({', '.join(apelidos)})"
+    categorias = [_CATEGORIAS.get(tipo, 'text') for tipo in tipos]
+    return nomes, apelidos, categorias, convertida
+
+
+def _via_copy(cursor, apelidos, categorias, convertida, params):
+    # COPY não aceita parâmetros: a consulta vai com os valores já escapados pelo psycopg2
+    texto = cursor.mogrify(convertida, params).decode(encodings.get(cursor.connection.encoding, 'utf-8'))
+    buffer = io.BytesIO()
+    cursor.copy_expert(f"COPY ({texto}) TO STDOUT WITH (FORMAT csv)", buffer)
+    tipos = _tipos_arrow()
+    if buffer.tell() == 0:
+        return pyarrow.table({a: pyarrow.array([], type=tipos[c]) for a, c in zip(apelidos, categorias)})
+    buffer.seek(0)
+    return pyarrow_csv.read_csv(
+        buffer,
+        read_options=pyarrow_csv.ReadOptions(column_names=apelidos),
+        parse_options=pyarrow_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pyarrow_csv.ConvertOptions(
+            column_types={a: tipos[c] for a, c in zip(apelidos, categorias)},
+            # No CSV do COPY, NULL é o campo vazio sem aspas e '' é "" (string vazia)
+            null_values=[''],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+            true_values=['t'],
+            false_values=['f'],
+        ),
+    )
+
+
+def _array(valores, categoria):
+    # Caminho sem pyarrow: converte a coluna já transposta
+    if categoria in ('int', 'float'):
+        if categoria == 'int' and None not in valores:
+            return np.array(valores, dtype=np.int64)
+        return np.array([np.nan if v is None else v for v in valores], dtype=np.float64)
+    if categoria == 'bool' and None in valores:
+        return np.array(valores, dtype=object)
+    return np.array(valores, dtype=_DTYPES[categoria])
+
+
+def consultar(cursor, query, params=None, formato='numpy'):
+    """Executa `query` e devolve o resultado em formato colunar ('numpy' ou 'arrow')."""
+    if formato not in ('numpy', 'arrow'):
+        raise ValueError(f"Formato colunar inválido: {formato!r}")
+    if formato == 'arrow':
+        _exigir_pyarrow()
+    _exigir_numpy()
+    nomes, apelidos, categorias, convertida = _preparar(cursor, query, params)
+
+    if pyarrow is not None:
+        tabela = _via_copy(cursor, apelidos, categorias, convertida, params).rename_columns(nomes)
+        if formato == 'arrow':
+            return tabela
+        arrays = [tabela.column(i).to_numpy() for i in range(len(nomes))]
+    else:
+        cursor.execute(convertida, params)
+        linhas = cursor.fetchall()
+        colunas = list(zip(*linhas)) if linhas else [()] * len(nomes)
+        arrays = [_array(list(valores), categoria) for valores, categoria in zip(colunas, categorias)]
+    return {'columns': nomes, 'data': dict(zip(nomes, arrays))}
+
+
+def para_colunas(resultado):
+    """Aceita um resultado em linhas ({'columns', 'data': [tuplas]}) ou colunar e devolve {coluna: ndarray}."""
+    _exigir_numpy()
+    if isinstance(resultado['data'], dict):
+        return resultado['data']
+    colunas = list(zip(*resultado['data'])) if resultado['data'] else [()] * len(resultado['columns'])
+    return {nome: np.array(valores, dtype=object) for nome, valores in zip(resultado['columns'], colunas)}
+
+
+def _numerico(array):
+    if array.dtype == object:
+        return np.array([np.nan if v is None else float(v) for v in array], dtype=np.float64)
+    return array.astype(np.float64)
+
+
+def rollup_por_especialidade(resultado):
+    """Totais de servicos_por_mecanico agrupados por especialidade, do maior para o menor."""
+    dados = para_colunas(resultado)
+    especialidades = dados['especialidade']
+    especialidades = np.where(np.equal(especialidades, None), 'Sem especialidade', especialidades).astype(str)
+    chaves, indices = np.unique(especialidades, return_inverse=True)
+    servicos = np.bincount(indices, weights=_numerico(dados['servicos_executados']), minlength=len(chaves))
+    horas = np.bincount(indices, weights=np.nan_to_num(_numerico(dados['horas_trabalhadas'])),
+                        minlength=len(chaves))
+    mecanicos = np.bincount(indices, minlength=len(chaves))
+    horas_por_servico = np.divide(horas, servicos, out=np.zeros_like(horas), where=servicos > 0)
+    ordem = np.argsort(-servicos, kind='stable')
+    colunas = ['especialidade', 'mecanicos', 'servicos_executados', 'horas_trabalhadas', 'horas_por_servico']
+    valores = [chaves, mecanicos, servicos.astype(np.int64), horas, horas_por_servico]
+    return {'columns': colunas, 'data': {nome: array[ordem] for nome, array in zip(colunas, valores)}}
+
+
+def serie_temporal(datas, quantidades=None, frequencia='M'):
+    """Conta ocorrências por período ('D', 'W', 'M' ou 'Y'), incluindo períodos sem nenhuma.
+
+    `quantidades`, se informado, traz o peso de cada data (ex.: contagens já agrupadas por dia).
+    Semanas começam na segunda-feira e são identificadas pela data da segunda.
+    """
+    _exigir_numpy()
+    if frequencia not in FREQUENCIAS:
+        raise ValueError(f"Frequência inválida: {frequencia!r} (use {', '.join(FREQUENCIAS)})")
+    datas = np.asarray(datas, dtype='datetime64[D]')
+    pesos = np.ones(len(datas), dtype=np.int64) if quantidades is None else np.asarray(quantidades)
+    validas = ~np.isnat(datas)
+    datas, pesos = datas[validas], pesos[validas]
+    colunas = ['periodo', 'quantidade']
+    if not len(datas):
+        unidade = 'D' if frequencia == 'W' else frequencia
+        return {'columns': colunas, 'data': {'periodo': np.array([], dtype=f'datetime64[{unidade}]'),
+                                             'quantidade': np.array([], dtype=np.int64)}}
+
+    if frequencia == 'W':
+        # 1970-01-01 foi uma quinta-feira: (dias + 3) % 7 é o dia da semana com segunda = 0
+        dias = datas.astype(np.int64)
+        periodos = (dias - (dias + 3) % 7).astype('datetime64[D]')
+        passo = 7
+    else:
+        periodos = datas.astype(f'datetime64[{frequencia}]')
+        passo = 1
+    inicio, fim = periodos.min(), periodos.max()
+    eixo = np.arange(inicio, fim + passo, passo)
+    indices = (periodos - inicio).astype(np.int64) // passo
+    contagem = np.bincount(indices, weights=pesos, minlength=len(eixo)).astype(np.int64)
+    return {'columns': colunas, 'data': {'periodo': eixo, 'quantidade': contagem}}
+
+
+def salvar_parquet(resultado, caminho, compressao='zstd'):
+    """Grava um resultado colunar ('numpy' ou 'arrow') em Parquet."""
+    _exigir_pyarrow()
+    if not isinstance(resultado, pyarrow.Table):
+        resultado = pyarrow.table({nome: resultado['data'][nome] for nome in resultado['columns']})
+    pyarrow_parquet.write_table(resultado, caminho, compression=compressao)
@@ -1,11 +1,27 @@
 import os
+import threading
 import psycopg2
 from dotenv import load_dotenv
 from contextlib import contextmanager
 
+from . import replicas
+from .pool import ConnectionPool, PoolEsgotadoError
+from .replicas import PRIMARIO
+
 load_dotenv()
 
+# Sessão (unidade de trabalho) ativa em cada thread; ver sessao.py
+_sessoes = threading.local()
+
+
+def sessao_atual():
+    return getattr(_sessoes, 'atual', None)
+
 class Database:
+    # Um pool por conjunto de parâmetros de conexão, compartilhado por todas as instâncias
+    _pools = {}
+    _pools_lock = threading.Lock()
+
     def __init__(self):
         self.params = {
             'host': os.getenv('DB_HOST', 'localhost'),
@@ -16,11 +32,136 @@ class Database:
         }
         if not self.params['password']:
             raise ValueError("DB_PASSWORD não encontrada no .env")
+        # Réplicas de leitura opcionais; ver replicas.py
+        self.replicas = replicas.ler_replicas(self.params)
+        self.atraso_max = float(os.getenv('DB_REPLICA_ATRASO_MAX', 5))
+        self.intervalo_verificacao = float(os.getenv('DB_REPLICA_VERIFICACAO', 2))
+        self.janela_escrita = float(os.getenv('DB_REPLICA_JANELA_ESCRITA', self.atraso_max))
+
+    @property
+    def pool(self):
+        return self._pool_para(self.params)
+
+    def _pool_da_rota(self, rota):
+        return self.pool if rota == PRIMARIO else self._pool_para(self.replicas[rota])
+
+    def _pool_para(self, params):
+        chave = tuple(sorted((k, str(v)) for k, v in params.items()))
+        with Database._pools_lock:
+            pool = Database._pools.get(chave)
+            if pool is None:
+                pool = ConnectionPool(
+                    params,
+                    minconn=int(os.getenv('DB_POOL_MIN', 1)),
+                    maxconn=int(os.getenv('DB_POOL_MAX', 10)),
+                    idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)),
+                    health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK', 30)),
+                    timeout=float(os.getenv('DB_POOL_TIMEOUT', 30)),
+                )
+                Database._pools[chave] = pool
+        return pool
 
     @contextmanager
-    def get_connection(self):
-        conn = psycopg2.connect(**self.params)
+    def get_connection(self, sessao=True, rota=None):
+        """Empresta uma conexão do pool.
+
+        Dentro de uma Sessao da mesma thread (e do mesmo pool), entrega a conexão da
+        sessão, cujo commit() só acontece no fim dela. `sessao=False` força uma conexão
+        própria (DDL em autocommit, transações com outro nível de isolamento).
+        Em métodos @rota_leitura a conexão pode vir de uma réplica; `rota` fixa o
+        servidor de uma leitura já roteada (ver escolher_rota).
+        """
+        pool = self.pool
+        atual = sessao_atual() if sessao else None
+        if atual is not None and atual.pool is pool:
+            if replicas.em_leitura() or rota is not None:
+                replicas.estado.registrar_desvio('sessao')
+            try:
+                yield atual.conexao()
+            except Exception:
+                atual.marcar_falha()
+                raise
+            return
+        leitura = rota is not None or replicas.em_leitura()
+        if rota is None:
+            rota = self.escolher_rota() if leitura else PRIMARIO
+        try:
+            pool = self._pool_da_rota(rota)
+            conn = pool.getconn()
+        except (psycopg2.OperationalError, PoolEsgotadoError):
+            if rota == PRIMARIO:
+                raise
+            # Réplica fora do ar: a leitura segue no primário
+            replicas.estado.marcar_indisponivel(rota)
+            replicas.estado.registrar_desvio('indisponivel')
+            rota, pool = PRIMARIO, self.pool
+            conn = pool.getconn()
+        replicas.estado.registrar(rota, leitura)
+        conn.confirmou = False
+        descartar = False
         try:
             yield conn
+        except psycopg2.OperationalError:
+            descartar = True
+            raise
         finally:
-            conn.close()
+            # Só conta como escrita o que foi confirmado (commit ou autocommit): leituras
+            # fora de @rota_leitura não prendem as próximas leituras da thread no primário
+            escreveu = not leitura and (conn.confirmou or conn.autocommit)
+            # Transações não confirmadas são desfeitas ao devolver, como no close() anterior
+            pool.putconn(conn, descartar=descartar)
+            if escreveu and self.replicas:
+                replicas.registrar_escrita()
+
+    def escolher_rota(self):
+        """Servidor para uma leitura agora: uma réplica em dia ou PRIMARIO."""
+        if not self.replicas:
+            return PRIMARIO
+        motivo = None
+        if sessao_atual() is not None:
+            motivo = 'sessao'
+        elif replicas.escrita_recente(self.janela_escrita):
+            motivo = 'escrita_recente'
+        else:
+            nome, motivo = replicas.estado.escolher(
+                list(self.replicas), self.medir_atraso, self.atraso_max, self.intervalo_verificacao)
+            if nome is not None:
+                return nome
+        replicas.estado.registrar_desvio(motivo)
+        return PRIMARIO
+
+    def medir_atraso(self, rota):
+        """Atraso de replicação da réplica `rota`, em segundos.
+
+        Levanta ReplicaDesconectadaError se a réplica não está recebendo WAL do primário.
+        """
+        pool = self._pool_da_rota(rota)
+        conn = pool.getconn()
+        descartar = False
+        try:
+            cursor = conn.cursor()
+            cursor.execute(replicas.QUERY_ATRASO)
+            atraso = cursor.fetchone()[0]
+            conn.rollback()
+            if atraso is None:
+                raise replicas.ReplicaDesconectadaError("Réplica sem conexão de replicação ativa com o primário")
+            return atraso
+        except psycopg2.OperationalError:
+            descartar = True
+            raise
+        finally:
+            pool.putconn(conn, descartar=descartar)
+
+    def estatisticas_rotas(self):
+        """Conexões por servidor (leituras roteadas x demais), desvios para o primário e saúde das réplicas."""
+        return replicas.estado.estatisticas()
+
+    def estatisticas_pool(self):
+        return self.pool.estatisticas()
+
+    @classmethod
+    def fechar_pools(cls):
+        with cls._pools_lock:
+            for pool in cls._pools.values():
+                pool.closeall()
+            cls._pools.clear()
@@ -0,0 +1,184 @@
+import atexit
+import threading
+import time
+
+from psycopg2 import Error
+from psycopg2.extras import execute_values
+
+from .db import Database
+from .pool import PoolEsgotadoError
+
+# Fila de escrita adiada (write-behind) para mudanças de status de OS, usada por
+# OrdemServicoCRUD.ativar_buffer_status. Só a última mudança de cada id_os é
+# mantida; a fila é gravada num único UPDATE ... FROM (VALUES ...) quando junta
+# `max_itens` ordens ou quando a mais antiga espera `intervalo` segundos, numa
+# thread própria. flush() grava na hora; no encerramento do processo (atexit) o
+# que estiver pendente também é gravado. Cada gravação é informada aos callbacks
+# com as linhas afetadas.
+
+
+class FilaStatus:
+    UPDATE_LOTE = """
+        UPDATE ordem_servico o SET status = v.status
+        FROM (VALUES %s) AS v(id_os, status, data_abertura)
+        WHERE o.id_os = v.id_os AND (v.data_abertura IS NULL OR o.data_abertura = v.data_abertura)
+        RETURNING o.id_os;
+        """
+    TEMPLATE = "(%s::integer, %s, %s::date)"
+
+    def __init__(self, db=None, max_itens=100, intervalo=1.0, ao_gravar=None):
+        if max_itens < 1 or intervalo < 0:
+            raise ValueError("Fila de status inválida: max_itens=%s intervalo=%s" % (max_itens, intervalo))
+        self.db = db or Database()
+        self.max_itens = max_itens
+        self.intervalo = intervalo
+        self._callbacks = [ao_gravar] if ao_gravar is not None else []
+        self._pendentes = {}  # id_os -> (status, data_abertura)
+        self._primeira = None  # quando entrou a mudança pendente mais antiga
+        self._cond = threading.Condition()
+        self._gravando = threading.Lock()  # um lote por vez: mantém a ordem das mudanças de cada OS
+        self._thread = None
+        self._fechada = False
+        self._stats = {
+            'enfileiradas': 0,
+            'coalescidas': 0,
+            'lotes': 0,
+            'enviadas': 0,
+            'afetadas': 0,
+            'rejeitadas': 0,
+            'falhas': 0,
+        }
+
+    def adicionar_callback(self, callback):
+        """`callback(resultado)` é chamado depois de cada gravação (ver flush)."""
+        self._callbacks.append(callback)
+
+    def enfileirar(self, id_os, novo_status, data_abertura=None):
+        with self._cond:
+            if self._fechada:
+                raise RuntimeError("Fila de status encerrada")
+            if not self._pendentes:
+                self._primeira = time.monotonic()
+            if id_os in self._pendentes:
+                self._stats['coalescidas'] += 1
+            self._pendentes[id_os] = (novo_status, data_abertura)
+            self._stats['enfileiradas'] += 1
+            self._iniciar()
+            self._cond.notify()
+
+    def _iniciar(self):
+        # Chamado com o lock adquirido
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._rodar, name="oficina-fila-status", daemon=True)
+            self._thread.start()
+            atexit.register(self.fechar)
+
+    def _rodar(self):
+        while True:
+            with self._cond:
+                while not self._fechada and not self._pendentes:
+                    self._cond.wait()
+                while not self._fechada and len(self._pendentes) < self.max_itens:
+                    restante = self._primeira + self.intervalo - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+                if self._fechada:
+                    return
+            if self.flush() is None:
+                # Banco indisponível: espera antes de tentar de novo
+                with self._cond:
+                    if not self._fechada:
+                        self._cond.wait(max(self.intervalo, 1.0))
+
+    def flush(self):
+        """Grava agora as mudanças pendentes; retorna as linhas afetadas (None se falhou).
+
+        Os callbacks recebem {'enviadas': n, 'afetadas': n, 'ids_afetados': [...],
+        'erros': [(id_os, mensagem), ...], 'erro': None}. Uma linha rejeitada pelo banco
+        (ex.: status inválido) não impede as demais; se a gravação inteira falhar
+        (ex.: conexão perdida), o lote volta para a fila e `erro` traz a mensagem.
+        """
+        with self._gravando:
+            with self._cond:
+                lote, self._pendentes = self._pendentes, {}
+            if not lote:
+                return 0
+            # Em ordem de id_os: gravações concorrentes de lotes que se sobrepõem travam as
+            # mesmas ordens na mesma sequência e não entram em deadlock
+            linhas = [(id_os, status, data_abertura) for id_os, (status, data_abertura) in sorted(lote.items())]
+            erros = []
+            try:
+                with self.db.get_connection(sessao=False) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("SAVEPOINT lote;")
+                    try:
+                        ids = self._atualizar(cursor, linhas)
+                    except Error:
+                        cursor.execute("ROLLBACK TO SAVEPOINT lote;")
+                        ids = []
+                        for linha in linhas:
+                            cursor.execute("SAVEPOINT linha;")
+                            try:
+                                ids.extend(self._atualizar(cursor, [linha]))
+                                cursor.execute("RELEASE SAVEPOINT linha;")
+                            except Error as e:
+                                cursor.execute("ROLLBACK TO SAVEPOINT linha;")
+                                erros.append((linha[0], str(e).strip()))
+                    conn.commit()
+            except (Error, PoolEsgotadoError) as e:
+                with self._cond:
+                    # Mudanças mais novas que chegaram durante a tentativa prevalecem
+                    for id_os, valor in lote.items():
+                        self._pendentes.setdefault(id_os, valor)
+                    self._primeira = time.monotonic()
+                    self._stats['falhas'] += 1
+                print(f"Erro ao gravar fila de status ({len(linhas)} ordens): {e}")
+                self._avisar({'enviadas': len(linhas), 'afetadas': 0, 'ids_afetados': [],
+                              'erros': [], 'erro': str(e).strip()})
+                return None
+
+        with self._cond:
+            self._stats['lotes'] += 1
+            self._stats['enviadas'] += len(linhas)
+            self._stats['afetadas'] += len(ids)
+            self._stats['rejeitadas'] += len(erros)
+        self._avisar({'enviadas': len(linhas), 'afetadas': len(ids), 'ids_afetados': ids,
+                      'erros': erros, 'erro': None})
+        return len(ids)
+
+    def _atualizar(self, cursor, linhas):
+        resultado = execute_values(cursor, self.UPDATE_LOTE, linhas, template=self.TEMPLATE,
+                                   page_size=len(linhas), fetch=True)
+        return [row[0] for row in resultado]
+
+    def _avisar(self, resultado):
+        for callback in list(self._callbacks):
+            try:
+                callback(resultado)
+            except Exception as e:
+                print(f"Erro no callback da fila de status: {e}")
+
+    def fechar(self):
+        """Para a thread de gravação e grava o que estiver pendente."""
+        with self._cond:
+            if self._fechada:
+                return
+            self._fechada = True
+            thread, self._thread = self._thread, None
+            self._cond.notify_all()
+        if thread is not None:
+            atexit.unregister(self.fechar)
+            thread.join()
+        if self.flush() is None:
+            print(f"Fila de status encerrada com {self.pendentes()} mudancas nao gravadas")
+
+    def pendentes(self):
+        with self._cond:
+            return len(self._pendentes)
+
+    def estatisticas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pendentes'] = len(self._pendentes)
+        return stats
@@ -0,0 +1,413 @@
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from functools import lru_cache
+
+from psycopg2 import Error, extensions
+
+# Instrumentação de todas as consultas emitidas pelo pacote.
+# Cada comando é agrupado pela sua "impressão digital" (texto normalizado, sem
+# literais) e acumula um histograma de latência, linhas e erros. Consultas acima
+# de DB_LENTA_MS entram no log de lentas e, com DB_LENTA_EXPLAIN=1, têm o plano
+# capturado (EXPLAIN ANALYZE só para leituras; escritas recebem EXPLAIN simples).
+# DB_INSTRUMENTACAO=0 desliga a coleta.
+config = {
+    'ativo': os.getenv('DB_INSTRUMENTACAO', '1') == '1',
+    'lenta_ms': float(os.getenv('DB_LENTA_MS', 500)),
+    'log_lentas': os.getenv('DB_LENTA_LOG', '1') == '1',
+    'max_lentas': int(os.getenv('DB_LENTA_MAX', 100)),
+    'explain': os.getenv('DB_LENTA_EXPLAIN', '0') == '1',
+    # Segundos até o plano da mesma consulta ser capturado de novo
+    'intervalo_explain': float(os.getenv('DB_LENTA_EXPLAIN_INTERVALO', 600)),
+}
+
+# Limites superiores (segundos) dos baldes dos histogramas, como no Prometheus
+LIMITES = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_PACOTE = os.path.dirname(os.path.abspath(__file__))
+# Módulos de infraestrutura ignorados ao procurar o método que originou a consulta
+_INTERNOS = {'base.py', 'db.py', 'pool.py', 'preparados.py', 'instrumentacao.py', 'assincrono.py'}
+
+
+class Histograma:
+    def __init__(self):
+        self.baldes = [0] * (len(LIMITES) + 1)
+        self.quantidade = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+
+    def observar(self, valor):
+        self.baldes[bisect_left(LIMITES, valor)] += 1
+        self.quantidade += 1
+        self.soma += valor
+        if valor > self.maximo:
+            self.maximo = valor
+
+    def percentil(self, p):
+        # Estimativa pelo limite superior do balde onde o percentil cai
+        if not self.quantidade:
+            return 0.0
+        alvo = p / 100 * self.quantidade
+        acumulado = 0
+        for limite, quantidade in zip(LIMITES, self.baldes):
+            acumulado += quantidade
+            if acumulado >= alvo:
+                return min(limite, self.maximo)
+        return self.maximo
+
+    def resumo(self):
+        return {
+            'quantidade': self.quantidade,
+            'tempo_total_ms': self.soma * 1000,
+            'media_ms': self.soma / self.quantidade * 1000 if self.quantidade else 0.0,
+            'p50_ms': self.percentil(50) * 1000,
+            'p90_ms': self.percentil(90) * 1000,
+            'p99_ms': self.percentil(99) * 1000,
+            'max_ms': self.maximo * 1000,
+        }
+
+
+class _EstatisticaConsulta:
+    def __init__(self, impressao):
+        self.id = hashlib.sha1(impressao.encode()).hexdigest()[:12]
+        self.impressao = impressao
+        self.histograma = Histograma()
+        self.linhas = 0
+        self.erros = 0
+        self.origens = set()
+
+
+_lock = threading.Lock()
+_consultas = {}  # impressão digital -> _EstatisticaConsulta
+_espera = Histograma()
+_lentas = deque(maxlen=config['max_lentas'])
+_total_lentas = 0
+_explicados = {}  # impressão digital -> instante do último EXPLAIN
+_observadores = []
+
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|(?<!\$)\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r"\(\?(?:, ?\?)*\)(?:, ?\(\?(?:, ?\?)*\))+")
+_ESPACOS = re.compile(r"\s+")
+_NOMES_PREPARADOS = re.compile(r"\boficina_\d+")
+_EXECUTE = re.compile(r"^\s*EXECUTE\s+(oficina_\d+)", re.IGNORECASE)
+_ESCRITA = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+# Funções cujo efeito o ROLLBACK do EXPLAIN não desfaz (locks de sessão, sequências,
+# NOTIFY, parâmetros de sessão): consultas que as chamam não são explicadas
+_EFEITOS = re.compile(r"\b(?:pg_(?:try_)?advisory\w*|nextval|setval|pg_notify|set_config)\s*\(", re.IGNORECASE)
+_CHAMADAS = re.compile(r"\b([a-z_][a-z0-9_]*)\s*\(", re.IGNORECASE)
+# Palavras-chave seguidas de parêntese e funções sem efeito colateral; uma leitura que
+# chama qualquer outra (ex.: funções do próprio schema) recebe EXPLAIN sem ANALYZE
+_SEM_EFEITOS = frozenset("""
+    IN EXISTS ANY ALL SOME VALUES AS FROM JOIN ON AND OR NOT WHERE LATERAL OVER FILTER ROW USING
+    WITHIN SELECT WHEN THEN ELSE BY HAVING UNION EXCEPT INTERSECT IS DISTINCT MATERIALIZED ARRAY
+    COUNT SUM AVG MIN MAX BOOL_AND BOOL_OR ARRAY_AGG STRING_AGG JSON_AGG JSONB_AGG JSON_BUILD_OBJECT
+    JSONB_BUILD_OBJECT ROW_NUMBER RANK DENSE_RANK LAG LEAD COALESCE NULLIF GREATEST LEAST CAST
+    EXTRACT DATE_TRUNC DATE_PART TO_CHAR NOW LOWER UPPER LENGTH TRIM SUBSTRING POSITION CONCAT
+    ROUND ABS UNNEST GENERATE_SERIES TO_REGCLASS OBJ_DESCRIPTION CURRENT_SETTING PG_IS_IN_RECOVERY
+    PG_LAST_WAL_RECEIVE_LSN PG_LAST_WAL_REPLAY_LSN PG_LAST_XACT_REPLAY_TIMESTAMP PG_WAL_LSN_DIFF
+    PG_CURRENT_WAL_LSN SIMILARITY WORD_SIMILARITY NUMERIC DECIMAL VARCHAR CHAR TIMESTAMP INTERVAL
+    """.split())
+
+
+def _normalizar(query):
+    texto = _ESPACOS.sub(' ', _LITERAIS.sub('?', query)).strip().rstrip(';').rstrip()
+    # Listas de VALUES geradas por execute_values viram uma só entrada
+    texto = _LISTAS.sub('(...)', texto)
+    return _NOMES_PREPARADOS.sub('oficina_?', texto)[:2000]
+
+
+_normalizar_frequente = lru_cache(maxsize=2048)(_normalizar)
+
+
+def normalizar(query):
+    """Impressão digital da consulta: espaços colapsados e literais trocados por '?'."""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    # Textos longos costumam ser lotes com valores embutidos; não vale a pena guardá-los
+    return _normalizar_frequente(query) if len(query) < 4096 else _normalizar(query)
+
+
+def _origem():
+    # Primeiro método fora da infraestrutura na pilha (ex.: 'clientes.ClienteCRUD.listar_clientes')
+    frame = sys._getframe(1)
+    while frame is not None:
+        codigo = frame.f_code
+        arquivo = codigo.co_filename
+        if os.path.dirname(arquivo) == _PACOTE and os.path.basename(arquivo) not in _INTERNOS:
+            nome = getattr(codigo, 'co_qualname', codigo.co_name)
+            return f"{os.path.basename(arquivo)[:-3]}.{nome}"
+        frame = frame.f_back
+    return None
+
+
+def _somente_leitura(impressao):
+    # True para leituras que podem rodar de novo (EXPLAIN ANALYZE), False para escritas e
+    # leituras que chamam funções (EXPLAIN simples), None para o que não deve ser explicado
+    palavra = impressao.split(' ', 1)[0].upper()
+    if palavra in ('SELECT', 'WITH', 'VALUES', 'TABLE'):
+        if _EFEITOS.search(impressao):
+            return None
+        if _ESCRITA.search(impressao):
+            return False
+        return all(nome.upper() in _SEM_EFEITOS for nome in _CHAMADAS.findall(impressao))
+    if palavra in ('INSERT', 'UPDATE', 'DELETE', 'MERGE'):
+        return False
+    return None
+
+
+def registrar_consulta(impressao, duracao, linhas=None, erro=False, origem=None):
+    """Acumula uma execução; `duracao` em segundos. Retorna True se a consulta foi lenta."""
+    with _lock:
+        estatistica = _consultas.get(impressao)
+        if estatistica is None:
+            estatistica = _consultas[impressao] = _EstatisticaConsulta(impressao)
+        estatistica.histograma.observar(duracao)
+        if linhas is not None and linhas > 0:
+            estatistica.linhas += linhas
+        if erro:
+            estatistica.erros += 1
+        if origem is not None and len(estatistica.origens) < 10:
+            estatistica.origens.add(origem)
+        observadores = list(_observadores)
+    for observador in observadores:
+        try:
+            observador(impressao, duracao, linhas, erro)
+        except Exception as e:
+            print(f"Erro no observador de instrumentacao: {e}")
+    return duracao * 1000 >= config['lenta_ms']
+
+
+def registrar_lenta(impressao, duracao, linhas=None, origem=None, plano=None):
+    global _total_lentas
+    entrada = {
+        'consulta': impressao,
+        'duracao_ms': duracao * 1000,
+        'linhas': linhas,
+        'origem': origem,
+        'quando': time.time(),
+        'plano': plano,
+    }
+    with _lock:
+        _lentas.append(entrada)
+        _total_lentas += 1
+    if config['log_lentas']:
+        print(f"Consulta lenta ({entrada['duracao_ms']:.1f} ms, {origem or 'origem desconhecida'}): {impressao[:300]}")
+
+
+def registrar_espera(duracao):
+    """Tempo (segundos) que um chamador esperou por uma conexão do pool."""
+    if not config['ativo']:
+        return
+    with _lock:
+        _espera.observar(duracao)
+
+
+def registrar_observador(callback):
+    """`callback(impressao, duracao, linhas, erro)` é chamado a cada consulta registrada."""
+    with _lock:
+        _observadores.append(callback)
+
+
+def _explicar(cursor, impressao):
+    agora = time.monotonic()
+    with _lock:
+        ultimo = _explicados.get(impressao)
+        if ultimo is not None and agora - ultimo < config['intervalo_explain']:
+            return None
+        _explicados[impressao] = agora
+
+    conn = cursor.connection
+    executada = cursor.query
+    leitura = _somente_leitura(impressao)
+    status = conn.info.transaction_status
+    if leitura is None or not executada or cursor.name is not None or status == extensions.TRANSACTION_STATUS_INERROR:
+        return None
+
+    # Cursor comum, para que o próprio EXPLAIN não seja instrumentado nem descarte o resultado do chamador
+    explain = extensions.cursor(conn)
+    em_transacao = status != extensions.TRANSACTION_STATUS_IDLE
+    opcoes = b"(ANALYZE, BUFFERS) " if leitura else b""
+    try:
+        if em_transacao:
+            explain.execute("SAVEPOINT oficina_explain;")
+        elif conn.autocommit:
+            # Em autocommit o EXPLAIN ANALYZE seria confirmado sozinho
+            explain.execute("BEGIN;")
+        explain.execute(b"EXPLAIN " + opcoes + executada)
+        return "\n".join(linha[0] for linha in explain.fetchall())
+    except Error as e:
+        return f"EXPLAIN falhou: {str(e).strip()}"
+    finally:
+        # Só o plano interessa: desfaz o que a segunda execução fez (locks de FOR
+        # UPDATE...); o que o ROLLBACK não desfaria já ficou de fora em _somente_leitura
+        try:
+            if em_transacao:
+                explain.execute("ROLLBACK TO SAVEPOINT oficina_explain;")
+                explain.execute("RELEASE SAVEPOINT oficina_explain;")
+            elif conn.autocommit:
+                explain.execute("ROLLBACK;")
+            else:
+                conn.rollback()
+        except Error:
+            # Conexão perdida no meio; a próxima consulta do chamador recebe o erro
+            pass
+        finally:
+            explain.close()
+
+
+def _impressao_cursor(cursor, query):
+    if not isinstance(query, (str, bytes)):
+        query = query.as_string(cursor.connection)  # psycopg2.sql.Composable
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    # EXECUTE de um prepared statement é contabilizado na consulta original
+    preparado = _EXECUTE.match(query)
+    if preparado is not None:
+        estado = getattr(cursor.connection, 'preparados', None)
+        original = estado.consultas.get(preparado.group(1)) if estado is not None else None
+        if original is not None:
+            query = original
+    return normalizar(query)
+
+
+def _medir(cursor, query, executar, explicavel=True):
+    if not config['ativo']:
+        return executar()
+    inicio = time.perf_counter()
+    try:
+        resultado = executar()
+    except Exception:
+        registrar_consulta(_impressao_cursor(cursor, query), time.perf_counter() - inicio,
+                           erro=True, origem=_origem())
+        raise
+    duracao = time.perf_counter() - inicio
+    impressao = _impressao_cursor(cursor, query)
+    linhas = cursor.rowcount if cursor.rowcount >= 0 else None
+    origem = _origem()
+    if registrar_consulta(impressao, duracao, linhas, origem=origem):
+        plano = _explicar(cursor, impressao) if config['explain'] and explicavel else None
+        registrar_lenta(impressao, duracao, linhas, origem, plano)
+    return resultado
+
+
+# Cursor padrão das conexões do pool (ver ConexaoOficina): mede cada comando
+class CursorInstrumentado(extensions.cursor):
+    def execute(self, query, vars=None):
+        return _medir(self, query, lambda: super(CursorInstrumentado, self).execute(query, vars))
+
+    def executemany(self, query, vars_list):
+        return _medir(self, query, lambda: super(CursorInstrumentado, self).executemany(query, vars_list),
+                      explicavel=False)
+
+    def copy_expert(self, sql, file, size=8192):
+        return _medir(self, sql, lambda: super(CursorInstrumentado, self).copy_expert(sql, file, size),
+                      explicavel=False)
+
+
+def registrar_consulta_async(registro):
+    """Logger de consultas do asyncpg (Connection.add_query_logger)."""
+    if not config['ativo']:
+        return
+    impressao = normalizar(registro.query)
+    erro = registro.exception is not None
+    origem = _origem()
+    if registrar_consulta(impressao, registro.elapsed, erro=erro, origem=origem) and not erro:
+        registrar_lenta(impressao, registro.elapsed, origem=origem)
+
+
+def snapshot():
+    """Estatísticas acumuladas, ordenadas pelo tempo total gasto em cada consulta."""
+    with _lock:
+        consultas = []
+        for estatistica in _consultas.values():
+            item = {
+                'id': estatistica.id,
+                'consulta': estatistica.impressao,
+                'origens': sorted(estatistica.origens),
+                'linhas': estatistica.linhas,
+                'erros': estatistica.erros,
+            }
+            item.update(estatistica.histograma.resumo())
+            consultas.append(item)
+        espera = _espera.resumo()
+        lentas = list(_lentas)
+        total_lentas = _total_lentas
+    consultas.sort(key=lambda item: item['tempo_total_ms'], reverse=True)
+    return {
+        'consultas': consultas,
+        'espera_conexao': espera,
+        'lentas': lentas,
+        'total_lentas': total_lentas,
+        'config': dict(config),
+    }
+
+
+def _rotulo(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _linhas_histograma(nome, histograma, rotulos=''):
+    separador = ',' if rotulos else ''
+    acumulado = 0
+    linhas = []
+    for limite, quantidade in zip(LIMITES, histograma.baldes):
+        acumulado += quantidade
+        linhas.append(f'{nome}_bucket{{{rotulos}{separador}le="{limite}"}} {acumulado}')
+    linhas.append(f'{nome}_bucket{{{rotulos}{separador}le="+Inf"}} {histograma.quantidade}')
+    sufixo = f'{{{rotulos}}}' if rotulos else ''
+    linhas.append(f'{nome}_sum{sufixo} {histograma.soma}')
+    linhas.append(f'{nome}_count{sufixo} {histograma.quantidade}')
+    return linhas
+
+
+def exportar_prometheus():
+    """Estatísticas no formato texto de exposição do Prometheus."""
+    linhas = []
+    with _lock:
+        consultas = list(_consultas.values())
+        linhas.append('# HELP oficina_consulta_info Texto normalizado de cada consulta instrumentada')
+        linhas.append('# TYPE oficina_consulta_info gauge')
+        for c in consultas:
+            origem = ','.join(sorted(c.origens))
+            linhas.append(f'oficina_consulta_info{{consulta="{c.id}",sql="{_rotulo(c.impressao[:200])}",'
+                          f'origem="{_rotulo(origem)}"}} 1')
+        linhas.append('# HELP oficina_consulta_duracao_segundos Latência das consultas')
+        linhas.append('# TYPE oficina_consulta_duracao_segundos histogram')
+        for c in consultas:
+            linhas.extend(_linhas_histograma('oficina_consulta_duracao_segundos', c.histograma,
+                                             f'consulta="{c.id}"'))
+        linhas.append('# HELP oficina_consulta_linhas_total Linhas retornadas ou afetadas')
+        linhas.append('# TYPE oficina_consulta_linhas_total counter')
+        for c in consultas:
+            linhas.append(f'oficina_consulta_linhas_total{{consulta="{c.id}"}} {c.linhas}')
+        linhas.append('# HELP oficina_consulta_erros_total Execuções que terminaram em erro')
+        linhas.append('# TYPE oficina_consulta_erros_total counter')
+        for c in consultas:
+            linhas.append(f'oficina_consulta_erros_total{{consulta="{c.id}"}} {c.erros}')
+        linhas.append('# HELP oficina_conexao_espera_segundos Espera por uma conexão do pool')
+        linhas.append('# TYPE oficina_conexao_espera_segundos histogram')
+        linhas.extend(_linhas_histograma('oficina_conexao_espera_segundos', _espera))
+        linhas.append('# HELP oficina_consultas_lentas_total Consultas acima de DB_LENTA_MS')
+        linhas.append('# TYPE oficina_consultas_lentas_total counter')
+        linhas.append(f'oficina_consultas_lentas_total {_total_lentas}')
+    return '\n'.join(linhas) + '\n'
+
+
+def consultas_lentas():
+    with _lock:
+        return list(_lentas)
+
+
+def limpar():
+    global _espera, _total_lentas
+    with _lock:
+        _consultas.clear()
+        _espera = Histograma()
+        _lentas.clear()
+        _total_lentas = 0
+        _explicados.clear()
@@ -1,22 +1,30 @@
 from .base import BaseCRUD
+from .replicas import rota_leitura
 
 # CRUD de mecânicos seja efetivo ou freelancer
 class MecanicoCRUD(BaseCRUD):
+    INSERT_MECANICO = "INSERT INTO mecanico (nome, telefone, especialidade, tipo_mecanico, id_solicitante) VALUES (%s, %s, %s, %s, %s) RETURNING matricula_mec;"
+    INSERT_EFETIVO = "INSERT INTO efetivo (id_mecanico, salario, registro_clt) VALUES (%s, %s, %s);"
+    INSERT_FREELANCER = "INSERT INTO freelancer (id_mecanico, hora_servico) VALUES (%s, %s);"
+    QUERY_LISTAR = """
+        SELECT 
+            m.matricula_mec, m.nome, m.telefone, m.especialidade, m.tipo_mecanico,
+            COALESCE(e.salario, f.hora_servico) as valor, e.registro_clt
+        FROM mecanico m
+        LEFT JOIN efetivo e ON m.matricula_mec = e.id_mecanico
+        LEFT JOIN freelancer f ON m.matricula_mec = f.id_mecanico
+        ORDER BY m.matricula_mec;
+        """
+
     def inserir_efetivo(self, nome, telefone, especialidade, salario, registro_clt):
         try:
             with self.db.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("INSERT INTO solicitante DEFAULT VALUES RETURNING id_solicitante;")
+                self._executar(cursor, self.INSERT_SOLICITANTE)
                 id_solicitante = cursor.fetchone()[0]
-                cursor.execute(
-                    "INSERT INTO mecanico (nome, telefone, especialidade, tipo_mecanico, id_solicitante) VALUES (%s, %s, %s, 'efetivo', %s) RETURNING matricula_mec;",
-                    (nome, telefone, especialidade, id_solicitante)
-                )
+                self._executar(cursor, self.INSERT_MECANICO, (nome, telefone, especialidade, 'efetivo', id_solicitante))
                 matricula = cursor.fetchone()[0]
-                cursor.execute(
-                    "INSERT INTO efetivo (id_mecanico, salario, registro_clt) VALUES (%s, %s, %s);",
-                    (matricula, salario, registro_clt)
-                )
+                self._executar(cursor, self.INSERT_EFETIVO, (matricula, salario, registro_clt))
                 conn.commit()
                 print(f"Mecanico efetivo '{nome}' inserido com sucesso!")
                 return matricula
@@ -28,17 +36,11 @@ class MecanicoCRUD(BaseCRUD):
         try:
             with self.db.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("INSERT INTO solicitante DEFAULT VALUES RETURNING id_solicitante;")
+                self._executar(cursor, self.INSERT_SOLICITANTE)
                 id_solicitante = cursor.fetchone()[0]
-                cursor.execute(
-                    "INSERT INTO mecanico (nome, telefone, especialidade, tipo_mecanico, id_solicitante) VALUES (%s, %s, %s, 'freelancer', %s) RETURNING matricula_mec;",
-                    (nome, telefone, especialidade, id_solicitante)
-                )
+                self._executar(cursor, self.INSERT_MECANICO, (nome, telefone, especialidade, 'freelancer', id_solicitante))
                 matricula = cursor.fetchone()[0]
-                cursor.execute(
-                    "INSERT INTO freelancer (id_mecanico, hora_servico) VALUES (%s, %s);",
-                    (matricula, hora_servico)
-                )
+                self._executar(cursor, self.INSERT_FREELANCER, (matricula, hora_servico))
                 conn.commit()
                 print(f"Mecanico freelancer '{nome}' inserido com sucesso!")
                 return matricula
@@ -46,14 +48,41 @@ class MecanicoCRUD(BaseCRUD):
             print(f"Erro ao inserir freelancer: {e}")
             return None
 
+    def _inserir_mecanicos(self, cursor, linhas, tipo_mecanico, inserir_subtipo):
+        # linhas: (nome, telefone, especialidade, *campos do subtipo)
+        n = len(linhas)
+        ids_solicitante = self._reservar_ids(cursor, 'solicitante', 'id_solicitante', n)
+        matriculas = self._reservar_ids(cursor, 'mecanico', 'matricula_mec', n)
+        self._inserir_multiplos(
+            cursor,
+            "INSERT INTO solicitante (id_solicitante) VALUES %s;",
+            [(id_solicitante,) for id_solicitante in ids_solicitante]
+        )
+        self._inserir_multiplos(
+            cursor,
+            "INSERT INTO mecanico (matricula_mec, nome, telefone, especialidade, tipo_mecanico, id_solicitante) VALUES %s;",
+            [(matricula,) + linha[:3] + (tipo_mecanico, id_solicitante)
+             for matricula, id_solicitante, linha in zip(matriculas, ids_solicitante, linhas)]
+        )
+        inserir_subtipo(cursor, [(matricula,) + linha[3:] for matricula, linha in zip(matriculas, linhas)])
+        return matriculas
+
+    def inserir_efetivo_lote(self, mecanicos):
+        """Insere vários mecânicos efetivos (dicts com os argumentos de inserir_efetivo) em uma transação."""
+        def inserir(cursor, linhas):
+            return self._inserir_mecanicos(cursor, linhas, 'efetivo', lambda cur, sub: self._inserir_multiplos(
+                cur, "INSERT INTO efetivo (id_mecanico, salario, registro_clt) VALUES %s;", sub))
+        campos = ('nome', 'telefone', 'especialidade', 'salario', 'registro_clt')
+        return self._executar_lote(mecanicos, campos, inserir, "mecanicos efetivos")
+
+    def inserir_freelancer_lote(self, mecanicos):
+        """Insere vários mecânicos freelancers (dicts com os argumentos de inserir_freelancer) em uma transação."""
+        def inserir(cursor, linhas):
+            return self._inserir_mecanicos(cursor, linhas, 'freelancer', lambda cur, sub: self._inserir_multiplos(
+                cur, "INSERT INTO freelancer (id_mecanico, hora_servico) VALUES %s;", sub))
+        campos = ('nome', 'telefone', 'especialidade', 'hora_servico')
+        return self._executar_lote(mecanicos, campos, inserir, "mecanicos freelancers")
+
+    @rota_leitura
     def listar_mecanicos(self):
-        query = """
-        SELECT 
-            m.matricula_mec, m.nome, m.telefone, m.especialidade, m.tipo_mecanico,
-            COALESCE(e.salario, f.hora_servico) as valor, e.registro_clt
-        FROM mecanico m
-        LEFT JOIN efetivo e ON m.matricula_mec = e.id_mecanico
-        LEFT JOIN freelancer f ON m.matricula_mec = f.id_mecanico
-        ORDER BY m.matricula_mec;
-        """
-        return self.execute_query(query)
+        return self.execute_query(self.QUERY_LISTAR)
@@ -0,0 +1,479 @@
+# Migrações de schema, aplicadas em ordem pelo SetupDatabase.
+# Cada migração recebe uma versão sequencial e, depois de aplicada, fica
+# registrada em schema_versao. Para alterar o schema, acrescente uma nova
+# Migracao no fim da lista; nunca edite uma migração já publicada.
+class Migracao:
+    def __init__(self, versao, descricao, comandos, transacional=True):
+        self.versao = versao
+        self.descricao = descricao
+        self.comandos = comandos
+        # Comandos como CREATE INDEX CONCURRENTLY não podem rodar dentro de transação
+        self.transacional = transacional
+
+
+TABELAS_INICIAIS = [
+    """CREATE TABLE IF NOT EXISTS solicitante (
+        id_solicitante SERIAL PRIMARY KEY
+    );""",
+    """CREATE TABLE IF NOT EXISTS cliente (
+        id_cliente SERIAL PRIMARY KEY,
+        email VARCHAR(100) NOT NULL,
+        telefone VARCHAR(15) NOT NULL,
+        endereco VARCHAR(255),
+        id_solicitante INTEGER UNIQUE REFERENCES solicitante(id_solicitante)
+    );""",
+    """CREATE TABLE IF NOT EXISTS pessoa_fisica (
+        id_cliente INTEGER PRIMARY KEY REFERENCES cliente(id_cliente),
+        cpf CHAR(11) UNIQUE NOT NULL,
+        nome VARCHAR(100),
+        data_nascimento DATE
+    );""",
+    """CREATE TABLE IF NOT EXISTS pessoa_juridica (
+        id_cliente INTEGER PRIMARY KEY REFERENCES cliente(id_cliente),
+        cnpj CHAR(14) UNIQUE NOT NULL,
+        razao_social VARCHAR(255)
+    );""",
+    """CREATE TABLE IF NOT EXISTS mecanico (
+        matricula_mec SERIAL PRIMARY KEY,
+        nome VARCHAR(100),
+        telefone VARCHAR(15),
+        especialidade VARCHAR(100),
+        tipo_mecanico VARCHAR(20),
+        id_solicitante INTEGER REFERENCES solicitante(id_solicitante)
+    );""",
+    """CREATE TABLE IF NOT EXISTS efetivo (
+        id_mecanico INTEGER PRIMARY KEY REFERENCES mecanico(matricula_mec),
+        salario NUMERIC(10,2),
+        registro_clt VARCHAR(50)
+    );""",
+    """CREATE TABLE IF NOT EXISTS freelancer (
+        id_mecanico INTEGER PRIMARY KEY REFERENCES mecanico(matricula_mec),
+        hora_servico NUMERIC(10,2)
+    );""",
+    """CREATE TABLE IF NOT EXISTS veiculo (
+        veiculo_id SERIAL PRIMARY KEY,
+        marca VARCHAR(50),
+        cor VARCHAR(30),
+        modelo VARCHAR(50),
+        ano INTEGER,
+        id_cliente INTEGER REFERENCES cliente(id_cliente)
+    );""",
+    """CREATE TABLE IF NOT EXISTS carro (
+        veiculo_id INTEGER PRIMARY KEY REFERENCES veiculo(veiculo_id),
+        numero_portas INTEGER,
+        tipo_combustivel VARCHAR(30),
+        capacidade_passageiros INTEGER
+    );""",
+    """CREATE TABLE IF NOT EXISTS moto (
+        veiculo_id INTEGER PRIMARY KEY REFERENCES veiculo(veiculo_id),
+        cilindrada INTEGER,
+        tipo_moto VARCHAR(50)
+    );""",
+    """CREATE TABLE IF NOT EXISTS ordem_servico (
+        id_os SERIAL PRIMARY KEY,
+        descricao TEXT,
+        data_abertura DATE,
+        status VARCHAR(20),
+        id_solicitante INTEGER REFERENCES solicitante(id_solicitante)
+    );""",
+    """CREATE TABLE IF NOT EXISTS servico (
+        id_servico SERIAL PRIMARY KEY,
+        tempo_estimado INTEGER,
+        valor_padrao NUMERIC(10, 2),
+        cod_os INTEGER REFERENCES ordem_servico(id_os)
+    );""",
+    """CREATE TABLE IF NOT EXISTS execucao_servico (
+        id_execucao SERIAL PRIMARY KEY,
+        id_os INTEGER REFERENCES ordem_servico(id_os),
+        id_mecanico INTEGER REFERENCES mecanico(matricula_mec),
+        id_servico INTEGER REFERENCES servico(id_servico),
+        tempo_gasto INTERVAL
+    );""",
+    """CREATE TABLE IF NOT EXISTS peca (
+        cod_peca SERIAL PRIMARY KEY,
+        nome_peca VARCHAR(100),
+        qt_estoque INTEGER,
+        valor_uni NUMERIC(10,2)
+    );""",
+    """CREATE TABLE IF NOT EXISTS utiliza_peca (
+        id_os INTEGER REFERENCES ordem_servico(id_os),
+        id_peca INTEGER REFERENCES peca(cod_peca),
+        quantidade INTEGER NOT NULL,
+        PRIMARY KEY (id_os, id_peca)
+    );"""
+]
+
+# Índices nas FKs e colunas de filtro/ordenação usadas pelos CRUDs e relatórios
+INDICES_FKS = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_veiculo_id_cliente ON veiculo (id_cliente);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_mecanico_id_solicitante ON mecanico (id_solicitante);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_os_id_solicitante ON ordem_servico (id_solicitante);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_os_status ON ordem_servico (status, id_os DESC);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_servico_cod_os ON servico (cod_os);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_execucao_id_os ON execucao_servico (id_os);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_execucao_id_mecanico ON execucao_servico (id_mecanico);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_execucao_id_servico ON execucao_servico (id_servico);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_utiliza_peca_id_peca ON utiliza_peca (id_peca);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_peca_nome ON peca (nome_peca, cod_peca);",
+]
+
+# Tabelas de resumo dos relatórios, mantidas por triggers a cada insert/update/delete
+RESUMOS_RELATORIOS = [
+    """CREATE TABLE IF NOT EXISTS resumo_os_status (
+        status VARCHAR(20) PRIMARY KEY,  -- '' representa status NULL
+        quantidade BIGINT NOT NULL DEFAULT 0
+    );""",
+    """CREATE TABLE IF NOT EXISTS resumo_mecanico (
+        id_mecanico INTEGER PRIMARY KEY,
+        servicos BIGINT NOT NULL DEFAULT 0,
+        execucoes_com_tempo BIGINT NOT NULL DEFAULT 0,
+        segundos NUMERIC NOT NULL DEFAULT 0
+    );""",
+    """CREATE TABLE IF NOT EXISTS resumo_solicitante_os (
+        id_solicitante INTEGER PRIMARY KEY,
+        total_os BIGINT NOT NULL DEFAULT 0,
+        ultima_os DATE
+    );""",
+    "CREATE INDEX IF NOT EXISTS idx_resumo_solicitante_total ON resumo_solicitante_os (total_os DESC);",
+    """CREATE OR REPLACE FUNCTION fn_resumo_ordem_servico() RETURNS trigger AS $$
+    DECLARE
+        muda_status BOOLEAN := TG_OP <> 'UPDATE' OR OLD.status IS DISTINCT FROM NEW.status;
+        muda_solicitante BOOLEAN := TG_OP <> 'UPDATE'
+            OR OLD.id_solicitante IS DISTINCT FROM NEW.id_solicitante
+            OR OLD.data_abertura IS DISTINCT FROM NEW.data_abertura;
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            IF muda_status THEN
+                UPDATE resumo_os_status SET quantidade = quantidade - 1
+                WHERE status = COALESCE(OLD.status, '');
+            END IF;
+            IF muda_solicitante AND OLD.id_solicitante IS NOT NULL THEN
+                -- A última data não pode ser decrementada; recalcula só para esse solicitante
+                UPDATE resumo_solicitante_os SET total_os = total_os - 1,
+                    ultima_os = (SELECT MAX(data_abertura) FROM ordem_servico
+                                 WHERE id_solicitante = OLD.id_solicitante)
+                WHERE id_solicitante = OLD.id_solicitante;
+            END IF;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            IF muda_status THEN
+                INSERT INTO resumo_os_status (status, quantidade) VALUES (COALESCE(NEW.status, ''), 1)
+                ON CONFLICT (status) DO UPDATE SET quantidade = resumo_os_status.quantidade + 1;
+            END IF;
+            IF muda_solicitante AND NEW.id_solicitante IS NOT NULL THEN
+                INSERT INTO resumo_solicitante_os (id_solicitante, total_os, ultima_os)
+                VALUES (NEW.id_solicitante, 1, NEW.data_abertura)
+                ON CONFLICT (id_solicitante) DO UPDATE SET
+                    total_os = resumo_solicitante_os.total_os + 1,
+                    ultima_os = GREATEST(resumo_solicitante_os.ultima_os, EXCLUDED.ultima_os);
+            END IF;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;""",
+    """CREATE OR REPLACE FUNCTION fn_resumo_execucao_servico() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.id_mecanico IS NOT NULL THEN
+            UPDATE resumo_mecanico SET
+                servicos = servicos - (OLD.id_servico IS NOT NULL)::int,
+                execucoes_com_tempo = execucoes_com_tempo - (OLD.tempo_gasto IS NOT NULL)::int,
+                segundos = segundos - COALESCE(EXTRACT(EPOCH FROM OLD.tempo_gasto), 0)
+            WHERE id_mecanico = OLD.id_mecanico;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.id_mecanico IS NOT NULL THEN
+            INSERT INTO resumo_mecanico (id_mecanico, servicos, execucoes_com_tempo, segundos)
+            VALUES (NEW.id_mecanico, (NEW.id_servico IS NOT NULL)::int, (NEW.tempo_gasto IS NOT NULL)::int,
+                    COALESCE(EXTRACT(EPOCH FROM NEW.tempo_gasto), 0))
+            ON CONFLICT (id_mecanico) DO UPDATE SET
+                servicos = resumo_mecanico.servicos + EXCLUDED.servicos,
+                execucoes_com_tempo = resumo_mecanico.execucoes_com_tempo + EXCLUDED.execucoes_com_tempo,
+                segundos = resumo_mecanico.segundos + EXCLUDED.segundos;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;""",
+    "DROP TRIGGER IF EXISTS trg_resumo_ordem_servico ON ordem_servico;",
+    """CREATE TRIGGER trg_resumo_ordem_servico
+    AFTER INSERT OR UPDATE OR DELETE ON ordem_servico
+    FOR EACH ROW EXECUTE FUNCTION fn_resumo_ordem_servico();""",
+    "DROP TRIGGER IF EXISTS trg_resumo_execucao_servico ON execucao_servico;",
+    """CREATE TRIGGER trg_resumo_execucao_servico
+    AFTER INSERT OR UPDATE OR DELETE ON execucao_servico
+    FOR EACH ROW EXECUTE FUNCTION fn_resumo_execucao_servico();""",
+]
+
+# Recalcula os resumos a partir dos dados brutos; os locks impedem escritas
+# concorrentes de se perderem entre o cálculo e a troca do conteúdo
+RECONSTRUIR_RESUMOS = [
+    "LOCK TABLE ordem_servico, execucao_servico IN SHARE ROW EXCLUSIVE MODE;",
+    "DELETE FROM resumo_os_status;",
+    """INSERT INTO resumo_os_status (status, quantidade)
+    SELECT COALESCE(status, ''), COUNT(*) FROM ordem_servico GROUP BY 1;""",
+    "DELETE FROM resumo_mecanico;",
+    """INSERT INTO resumo_mecanico (id_mecanico, servicos, execucoes_com_tempo, segundos)
+    SELECT id_mecanico, COUNT(id_servico), COUNT(tempo_gasto), COALESCE(SUM(EXTRACT(EPOCH FROM tempo_gasto)), 0)
+    FROM execucao_servico WHERE id_mecanico IS NOT NULL GROUP BY id_mecanico;""",
+    "DELETE FROM resumo_solicitante_os;",
+    """INSERT INTO resumo_solicitante_os (id_solicitante, total_os, ultima_os)
+    SELECT id_solicitante, COUNT(*), MAX(data_abertura)
+    FROM ordem_servico WHERE id_solicitante IS NOT NULL GROUP BY id_solicitante;""",
+]
+
+# Busca por trecho de nome (trigramas, GiST para ordenar por distância com LIMIT)
+# e por prefixo de documento/telefone (pattern_ops, usados por LIKE 'prefixo%')
+INDICES_BUSCA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pf_nome_trgm ON pessoa_fisica USING gist (nome gist_trgm_ops);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pj_razao_social_trgm ON pessoa_juridica USING gist (razao_social gist_trgm_ops);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_peca_nome_trgm ON peca USING gist (nome_peca gist_trgm_ops);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pf_cpf_prefixo ON pessoa_fisica (cpf bpchar_pattern_ops);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pj_cnpj_prefixo ON pessoa_juridica (cnpj bpchar_pattern_ops);",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_cliente_telefone_prefixo ON cliente (telefone varchar_pattern_ops);",
+]
+
+# Cria as partições mensais de ordem_servico e das tabelas filhas (mesmo mês nas três)
+# entre `inicio` e `fim`; devolve os nomes criados. Meses que já têm linhas na partição
+# padrão são pulados (criar a partição exigiria mover essas linhas).
+FUNCAO_CRIAR_PARTICOES = """CREATE OR REPLACE FUNCTION fn_criar_particoes_os(inicio DATE, fim DATE)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    mes DATE := date_trunc('month', inicio)::date;
+    tabela TEXT;
+    nome TEXT;
+BEGIN
+    WHILE mes < fim LOOP
+        IF EXISTS (SELECT 1 FROM ordem_servico_padrao
+                   WHERE data_abertura >= mes AND data_abertura < (mes + interval '1 month')::date) THEN
+            RAISE NOTICE 'Particao de % nao criada: ha ordens desse mes na particao padrao', to_char(mes, 'YYYY-MM');
+        ELSE
+            FOREACH tabela IN ARRAY ARRAY['ordem_servico', 'execucao_servico', 'utiliza_peca'] LOOP
+                nome := tabela || '_p' || to_char(mes, 'YYYYMM');
+                IF to_regclass(nome) IS NULL THEN
+                    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                                   nome, tabela, mes, (mes + interval '1 month')::date);
+                    RETURN NEXT nome;
+                END IF;
+            END LOOP;
+        END IF;
+        mes := (mes + interval '1 month')::date;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;"""
+
+# ordem_servico, execucao_servico e utiliza_peca passam a ser particionadas por mês
+# de abertura da OS. A chave de partição precisa fazer parte das chaves primárias,
+# então as filhas ganham data_abertura_os e FKs compostas (id_os, data_abertura_os);
+# servico não é particionada, mas também referencia a OS pela chave composta.
+# Ordens sem data_abertura recebem a data da migração.
+PARTICIONAR_ORDENS = [
+    "ALTER TABLE servico DROP CONSTRAINT IF EXISTS servico_cod_os_fkey;",
+    "ALTER TABLE execucao_servico DROP CONSTRAINT IF EXISTS execucao_servico_id_os_fkey;",
+    "ALTER TABLE utiliza_peca DROP CONSTRAINT IF EXISTS utiliza_peca_id_os_fkey;",
+    "ALTER TABLE ordem_servico RENAME TO ordem_servico_antiga;",
+    "ALTER TABLE execucao_servico RENAME TO execucao_servico_antiga;",
+    "ALTER TABLE utiliza_peca RENAME TO utiliza_peca_antiga;",
+    "ALTER INDEX ordem_servico_pkey RENAME TO ordem_servico_antiga_pkey;",
+    "ALTER INDEX execucao_servico_pkey RENAME TO execucao_servico_antiga_pkey;",
+    "ALTER INDEX utiliza_peca_pkey RENAME TO utiliza_peca_antiga_pkey;",
+    """CREATE TABLE ordem_servico (
+        id_os INTEGER NOT NULL DEFAULT nextval('ordem_servico_id_os_seq'),
+        descricao TEXT,
+        data_abertura DATE NOT NULL DEFAULT CURRENT_DATE,
+        status VARCHAR(20),
+        id_solicitante INTEGER REFERENCES solicitante(id_solicitante),
+        PRIMARY KEY (id_os, data_abertura)
+    ) PARTITION BY RANGE (data_abertura);""",
+    "ALTER SEQUENCE ordem_servico_id_os_seq OWNED BY ordem_servico.id_os;",
+    """CREATE TABLE execucao_servico (
+        id_execucao INTEGER NOT NULL DEFAULT nextval('execucao_servico_id_execucao_seq'),
+        id_os INTEGER,
+        data_abertura_os DATE NOT NULL,
+        id_mecanico INTEGER REFERENCES mecanico(matricula_mec),
+        id_servico INTEGER REFERENCES servico(id_servico),
+        tempo_gasto INTERVAL,
+        PRIMARY KEY (id_execucao, data_abertura_os),
+        FOREIGN KEY (id_os, data_abertura_os) REFERENCES ordem_servico (id_os, data_abertura) ON UPDATE CASCADE
+    ) PARTITION BY RANGE (data_abertura_os);""",
+    "ALTER SEQUENCE execucao_servico_id_execucao_seq OWNED BY execucao_servico.id_execucao;",
+    """CREATE TABLE utiliza_peca (
+        id_os INTEGER NOT NULL,
+        data_abertura_os DATE NOT NULL,
+        id_peca INTEGER REFERENCES peca(cod_peca),
+        quantidade INTEGER NOT NULL,
+        PRIMARY KEY (id_os, data_abertura_os, id_peca),
+        FOREIGN KEY (id_os, data_abertura_os) REFERENCES ordem_servico (id_os, data_abertura) ON UPDATE CASCADE
+    ) PARTITION BY RANGE (data_abertura_os);""",
+    "CREATE TABLE ordem_servico_padrao PARTITION OF ordem_servico DEFAULT;",
+    "CREATE TABLE execucao_servico_padrao PARTITION OF execucao_servico DEFAULT;",
+    "CREATE TABLE utiliza_peca_padrao PARTITION OF utiliza_peca DEFAULT;",
+    FUNCAO_CRIAR_PARTICOES,
+    # Do mês da ordem mais antiga até três meses à frente
+    """SELECT COUNT(*) FROM fn_criar_particoes_os(
+        (SELECT COALESCE(MIN(data_abertura), CURRENT_DATE) FROM ordem_servico_antiga),
+        (date_trunc('month', CURRENT_DATE) + interval '3 months')::date);""",
+    """INSERT INTO ordem_servico (id_os, descricao, data_abertura, status, id_solicitante)
+    SELECT id_os, descricao, COALESCE(data_abertura, CURRENT_DATE), status, id_solicitante
+    FROM ordem_servico_antiga;""",
+    """INSERT INTO execucao_servico (id_execucao, id_os, data_abertura_os, id_mecanico, id_servico, tempo_gasto)
+    SELECT e.id_execucao, e.id_os, COALESCE(o.data_abertura, CURRENT_DATE), e.id_mecanico, e.id_servico, e.tempo_gasto
+    FROM execucao_servico_antiga e LEFT JOIN ordem_servico o ON o.id_os = e.id_os;""",
+    """INSERT INTO utiliza_peca (id_os, data_abertura_os, id_peca, quantidade)
+    SELECT u.id_os, o.data_abertura, u.id_peca, u.quantidade
+    FROM utiliza_peca_antiga u JOIN ordem_servico o ON o.id_os = u.id_os;""",
+    "ALTER TABLE servico ADD COLUMN IF NOT EXISTS data_abertura_os DATE;",
+    "UPDATE servico s SET data_abertura_os = o.data_abertura FROM ordem_servico o WHERE o.id_os = s.cod_os;",
+    """ALTER TABLE servico ADD CONSTRAINT servico_os_fkey FOREIGN KEY (cod_os, data_abertura_os)
+    REFERENCES ordem_servico (id_os, data_abertura) ON UPDATE CASCADE;""",
+    "DROP TABLE execucao_servico_antiga, utiliza_peca_antiga, ordem_servico_antiga;",
+    # Índices e triggers das tabelas antigas, agora nas particionadas (propagados às partições)
+    "CREATE INDEX idx_os_id_solicitante ON ordem_servico (id_solicitante);",
+    "CREATE INDEX idx_os_status ON ordem_servico (status, id_os DESC);",
+    "DROP INDEX IF EXISTS idx_servico_cod_os;",
+    "CREATE INDEX idx_servico_cod_os ON servico (cod_os, data_abertura_os);",
+    "CREATE INDEX idx_execucao_id_os ON execucao_servico (id_os);",
+    "CREATE INDEX idx_execucao_id_mecanico ON execucao_servico (id_mecanico);",
+    "CREATE INDEX idx_execucao_id_servico ON execucao_servico (id_servico);",
+    "CREATE INDEX idx_utiliza_peca_id_peca ON utiliza_peca (id_peca);",
+    """CREATE TRIGGER trg_resumo_ordem_servico
+    AFTER INSERT OR UPDATE OR DELETE ON ordem_servico
+    FOR EACH ROW EXECUTE FUNCTION fn_resumo_ordem_servico();""",
+    """CREATE TRIGGER trg_resumo_execucao_servico
+    AFTER INSERT OR UPDATE OR DELETE ON execucao_servico
+    FOR EACH ROW EXECUTE FUNCTION fn_resumo_execucao_servico();""",
+]
+
+# Alertas de estoque: cada peça pode ter um estoque mínimo (NULL = sem alerta). Quando
+# qt_estoque cruza esse limite o trigger grava o evento em alerta_estoque e avisa
+# no canal estoque_baixo (entregue no commit; ver alertas.py). O registro permite
+# recuperar o que foi perdido enquanto o ouvinte estava desconectado.
+ALERTAS_ESTOQUE = [
+    "ALTER TABLE peca ADD COLUMN IF NOT EXISTS estoque_minimo INTEGER CHECK (estoque_minimo >= 0);",
+    """CREATE TABLE IF NOT EXISTS alerta_estoque (
+        id_alerta BIGSERIAL PRIMARY KEY,
+        cod_peca INTEGER NOT NULL REFERENCES peca(cod_peca),
+        tipo VARCHAR(10) NOT NULL CHECK (tipo IN ('baixo', 'reposto')),
+        qt_estoque INTEGER,
+        estoque_minimo INTEGER,
+        criado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+    );""",
+    "CREATE INDEX IF NOT EXISTS idx_alerta_estoque_criado_em ON alerta_estoque (criado_em);",
+    """CREATE OR REPLACE FUNCTION fn_alerta_estoque() RETURNS trigger AS $$
+    DECLARE
+        estava_baixo BOOLEAN := TG_OP = 'UPDATE' AND COALESCE(OLD.qt_estoque <= OLD.estoque_minimo, false);
+        esta_baixo BOOLEAN := COALESCE(NEW.qt_estoque <= NEW.estoque_minimo, false);
+        alerta alerta_estoque%ROWTYPE;
+    BEGIN
+        IF esta_baixo = estava_baixo THEN
+            RETURN NULL;
+        END IF;
+        INSERT INTO alerta_estoque (cod_peca, tipo, qt_estoque, estoque_minimo)
+        VALUES (NEW.cod_peca, CASE WHEN esta_baixo THEN 'baixo' ELSE 'reposto' END,
+                NEW.qt_estoque, NEW.estoque_minimo)
+        RETURNING * INTO alerta;
+        PERFORM pg_notify('estoque_baixo', json_build_object(
+            'id_alerta', alerta.id_alerta, 'cod_peca', alerta.cod_peca, 'nome_peca', NEW.nome_peca,
+            'tipo', alerta.tipo, 'qt_estoque', alerta.qt_estoque, 'estoque_minimo', alerta.estoque_minimo,
+            'criado_em', alerta.criado_em)::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;""",
+    "DROP TRIGGER IF EXISTS trg_alerta_estoque ON peca;",
+    """CREATE TRIGGER trg_alerta_estoque
+    AFTER INSERT OR UPDATE OF qt_estoque, estoque_minimo ON peca
+    FOR EACH ROW EXECUTE FUNCTION fn_alerta_estoque();""",
+]
+
+# Nova versão de fn_criar_particoes_os: em vez de pular os meses que já têm linhas
+# nas partições padrão (o que deixava o mês sem partição para sempre), retira essas
+# linhas, cria as partições e as devolve, tudo na transação de quem chama. Como as
+# filhas referenciam a OS, quando a OS do mês está na padrão as três tabelas saem
+# e voltam juntas; os serviços do mês ficam com data_abertura_os nula no meio do
+# caminho (FK composta MATCH SIMPLE não é verificada com coluna nula). Os triggers
+# de resumo veem a saída e a volta, então os resumos terminam iguais.
+FUNCAO_CRIAR_PARTICOES_MOVENDO_PADRAO = """CREATE OR REPLACE FUNCTION fn_criar_particoes_os(inicio DATE, fim DATE)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    mes DATE := date_trunc('month', inicio)::date;
+    proximo DATE;
+    tabela TEXT;
+    coluna TEXT;
+    nome TEXT;
+    existe BOOLEAN;
+    mover TEXT[];
+BEGIN
+    WHILE mes < fim LOOP
+        proximo := (mes + interval '1 month')::date;
+        mover := ARRAY[]::TEXT[];
+        IF to_regclass('ordem_servico_p' || to_char(mes, 'YYYYMM')) IS NULL
+           AND EXISTS (SELECT 1 FROM ordem_servico_padrao WHERE data_abertura >= mes AND data_abertura < proximo) THEN
+            mover := ARRAY['ordem_servico', 'execucao_servico', 'utiliza_peca'];
+        ELSE
+            FOREACH tabela IN ARRAY ARRAY['execucao_servico', 'utiliza_peca'] LOOP
+                IF to_regclass(tabela || '_p' || to_char(mes, 'YYYYMM')) IS NULL THEN
+                    EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE data_abertura_os >= %L AND data_abertura_os < %L)',
+                                   tabela || '_padrao', mes, proximo) INTO existe;
+                    IF existe THEN
+                        mover := mover || tabela;
+                    END IF;
+                END IF;
+            END LOOP;
+        END IF;
+
+        IF 'ordem_servico' = ANY(mover) THEN
+            DROP TABLE IF EXISTS pg_temp._servico_mes;
+            EXECUTE format('CREATE TEMP TABLE _servico_mes AS SELECT id_servico, data_abertura_os FROM servico
+                            WHERE data_abertura_os >= %L AND data_abertura_os < %L', mes, proximo);
+            EXECUTE 'UPDATE servico s SET data_abertura_os = NULL FROM _servico_mes m WHERE s.id_servico = m.id_servico';
+        END IF;
+        -- Filhas saem antes da OS
+        FOREACH tabela IN ARRAY ARRAY['utiliza_peca', 'execucao_servico', 'ordem_servico'] LOOP
+            CONTINUE WHEN NOT tabela = ANY(mover);
+            coluna := CASE WHEN tabela = 'ordem_servico' THEN 'data_abertura' ELSE 'data_abertura_os' END;
+            EXECUTE format('DROP TABLE IF EXISTS pg_temp.%I', '_mover_' || tabela);
+            EXECUTE format('CREATE TEMP TABLE %I AS SELECT * FROM %I WHERE %I >= %L AND %I < %L',
+                           '_mover_' || tabela, tabela, coluna, mes, coluna, proximo);
+            EXECUTE format('DELETE FROM %I WHERE %I >= %L AND %I < %L', tabela, coluna, mes, coluna, proximo);
+        END LOOP;
+
+        FOREACH tabela IN ARRAY ARRAY['ordem_servico', 'execucao_servico', 'utiliza_peca'] LOOP
+            nome := tabela || '_p' || to_char(mes, 'YYYYMM');
+            IF to_regclass(nome) IS NULL THEN
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               nome, tabela, mes, proximo);
+                RETURN NEXT nome;
+            END IF;
+        END LOOP;
+
+        -- OS volta antes das filhas
+        FOREACH tabela IN ARRAY ARRAY['ordem_servico', 'execucao_servico', 'utiliza_peca'] LOOP
+            CONTINUE WHEN NOT tabela = ANY(mover);
+            EXECUTE format('INSERT INTO %I SELECT * FROM %I', tabela, '_mover_' || tabela);
+            EXECUTE format('DROP TABLE %I', '_mover_' || tabela);
+        END LOOP;
+        IF 'ordem_servico' = ANY(mover) THEN
+            EXECUTE 'UPDATE servico s SET data_abertura_os = m.data_abertura_os
+                     FROM _servico_mes m WHERE s.id_servico = m.id_servico';
+            DROP TABLE _servico_mes;
+        END IF;
+        IF cardinality(mover) > 0 THEN
+            RAISE NOTICE 'Linhas de % movidas da particao padrao para as particoes do mes (%)',
+                         to_char(mes, 'YYYY-MM'), array_to_string(mover, ', ');
+        END IF;
+        mes := proximo;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;"""
+
+MIGRACOES = [
+    Migracao(1, "Tabelas iniciais", TABELAS_INICIAIS),
+    Migracao(2, "Indices em FKs e colunas de filtro", INDICES_FKS, transacional=False),
+    Migracao(3, "Resumos incrementais dos relatorios", RESUMOS_RELATORIOS + RECONSTRUIR_RESUMOS),
+    Migracao(4, "Busca por trecho de nome, documento e telefone", INDICES_BUSCA, transacional=False),
+    Migracao(5, "Ordens de servico particionadas por mes de abertura", PARTICIONAR_ORDENS + RECONSTRUIR_RESUMOS),
+    Migracao(6, "Estoque minimo por peca e alertas via NOTIFY", ALERTAS_ESTOQUE),
+    Migracao(7, "Particoes criadas tambem para meses com linhas na particao padrao",
+             [FUNCAO_CRIAR_PARTICOES_MOVENDO_PADRAO]),
+    # Recuperação e listagem dos alertas leem por id_alerta; o índice só encarecia os INSERTs
+    Migracao(8, "Remove o indice sem uso de alerta_estoque.criado_em",
+             ["DROP INDEX IF EXISTS idx_alerta_estoque_criado_em;"]),
+]
@@ -1,19 +1,34 @@
 from .base import BaseCRUD
+from .fila_status import FilaStatus
+from .particoes import GerenciadorParticoes
+from .replicas import rota_leitura
 from datetime import date
 
 # Faz a criação, listagem e atualização das ordens de serviço
 class OrdemServicoCRUD(BaseCRUD):
-    def criar_ordem_servico(self, descricao, id_solicitante, data_abertura=None, status='Aberta'):
-        if data_abertura is None:
-            data_abertura = date.today()
-        query = """
+    INSERT_OS = """
         INSERT INTO ordem_servico (descricao, data_abertura, status, id_solicitante) 
         VALUES (%s, %s, %s, %s) RETURNING id_os;
         """
+    UPDATE_STATUS = "UPDATE ordem_servico SET status = %s WHERE id_os = %s;"
+    # Com a data de abertura, o UPDATE vai direto à partição do mês
+    UPDATE_STATUS_DATA = "UPDATE ordem_servico SET status = %s WHERE id_os = %s AND data_abertura = %s;"
+    # Fila de escrita adiada dos status (ver ativar_buffer_status); None = UPDATE imediato
+    fila_status = None
+    # Gerenciador de partições compartilhado, criado na primeira OS do processo
+    _particoes = None
+
+    def criar_ordem_servico(self, descricao, id_solicitante, data_abertura=None, status='Aberta'):
+        if data_abertura is None:
+            data_abertura = date.today()
         try:
+            # Primeira OS do mês neste processo: garante a partição antes de gravar
+            if OrdemServicoCRUD._particoes is None:
+                OrdemServicoCRUD._particoes = GerenciadorParticoes()
+            OrdemServicoCRUD._particoes.garantir_mes(data_abertura)
             with self.db.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(query, (descricao, data_abertura, status, id_solicitante))
+                self._executar(cursor, self.INSERT_OS, (descricao, data_abertura, status, id_solicitante))
                 id_os = cursor.fetchone()[0]
                 conn.commit()
                 print(f"Ordem de serviço criada com sucesso! ID: {id_os}")
@@ -22,7 +37,7 @@ class OrdemServicoCRUD(BaseCRUD):
             print(f"Erro ao criar OS: {e}")
             return None
 
-    def listar_ordens_servico(self, status=None):
+    def _query_listar(self, status=None, apos_id=None, limite=None, data_inicio=None, data_fim=None):
         query = """
         SELECT 
             os.id_os, os.descricao, os.data_abertura, os.status,
@@ -33,16 +48,70 @@ class OrdemServicoCRUD(BaseCRUD):
         LEFT JOIN pessoa_fisica pf ON c.id_cliente = pf.id_cliente
         LEFT JOIN pessoa_juridica pj ON c.id_cliente = pj.id_cliente
         """
-        params = None
+        condicoes, params = self._filtro_periodo("os.data_abertura", data_inicio, data_fim)
         if status:
-            query += " WHERE os.status = %s"
-            params = (status,)
-        query += " ORDER BY os.id_os DESC;"
-        return self.execute_query(query, params)
-
-    def atualizar_status_os(self, id_os, novo_status):
-        query = "UPDATE ordem_servico SET status = %s WHERE id_os = %s;"
-        result = self.execute_query(query, (novo_status, id_os), fetch=False)
+            condicoes.append("os.status = %s")
+            params.append(status)
+        if apos_id is not None:
+            condicoes.append("os.id_os < %s")
+            params.append(apos_id)
+        if condicoes:
+            query += " WHERE " + " AND ".join(condicoes)
+        query += " ORDER BY os.id_os DESC"
+        if limite:
+            query += " LIMIT %s"
+            params.append(limite)
+        return query + ";", tuple(params) or None
+
+    @rota_leitura
+    def listar_ordens_servico(self, status=None, limite=None, token=None, data_inicio=None, data_fim=None):
+        """Lista as OS da mais recente para a mais antiga. Com `limite`, retorna uma
+        página e o token `proximo` (None na última página) para a chamada seguinte.
+        `data_inicio` (inclusivo) e `data_fim` (exclusivo) restringem a data de abertura
+        e limitam a leitura às partições desses meses."""
+        if limite is None and token is None:
+            query, params = self._query_listar(status, data_inicio=data_inicio, data_fim=data_fim)
+            return self.execute_query(query, params)
+        limite = limite or 50
+        apos_id = self._decodificar_token('ordens', token, 1)[0] if token else None
+        query, params = self._query_listar(status, apos_id, limite + 1, data_inicio, data_fim)
+        return self._executar_pagina(query, params, limite, 'ordens', lambda row: (row[0],))
+
+    @rota_leitura
+    def iterar_ordens_servico(self, status=None, itersize=2000, data_inicio=None, data_fim=None):
+        # Mesmas linhas de listar_ordens_servico, entregues aos poucos via cursor server-side
+        query, params = self._query_listar(status, data_inicio=data_inicio, data_fim=data_fim)
+        return self.stream_query(query, params, itersize=itersize)
+
+    def ativar_buffer_status(self, max_itens=100, intervalo=1.0, ao_gravar=None):
+        """Passa atualizar_status_os a enfileirar as mudanças em vez de gravá-las na hora.
+
+        Só a última mudança de cada OS é gravada, em lotes de até `max_itens` ordens ou
+        a cada `intervalo` segundos; `ao_gravar(resultado)` recebe as linhas afetadas de
+        cada lote. Retorna a FilaStatus (flush() grava o pendente imediatamente).
+        As gravações usam conexão própria, fora de uma Sessao em andamento.
+        """
+        if self.fila_status is None:
+            self.fila_status = FilaStatus(self.db, max_itens, intervalo, ao_gravar)
+        elif ao_gravar is not None:
+            self.fila_status.adicionar_callback(ao_gravar)
+        return self.fila_status
+
+    def desativar_buffer_status(self):
+        """Grava o que estiver pendente e volta ao UPDATE imediato."""
+        fila, self.fila_status = self.fila_status, None
+        if fila is not None:
+            fila.fechar()
+
+    def atualizar_status_os(self, id_os, novo_status, data_abertura=None):
+        # Com o buffer ativo, retorna True ao enfileirar; as linhas afetadas chegam aos callbacks
+        if self.fila_status is not None:
+            self.fila_status.enfileirar(id_os, novo_status, data_abertura)
+            return True
+        if data_abertura is None:
+            result = self.execute_query(self.UPDATE_STATUS, (novo_status, id_os), fetch=False)
+        else:
+            result = self.execute_query(self.UPDATE_STATUS_DATA, (novo_status, id_os, data_abertura), fetch=False)
         if result:
             print(f"Status da OS {id_os} atualizado para '{novo_status}'")
         return result
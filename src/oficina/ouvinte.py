@@ -0,0 +1,135 @@
+import select
+import socket
+import threading
+
+import psycopg2
+from psycopg2 import extensions, sql
+
+# Escuta canais LISTEN/NOTIFY numa conexão dedicada (fora do pool) e repassa as
+# notificações para os callbacks registrados, reconectando se a conexão cair
+class OuvinteNotify:
+    def __init__(self, params, intervalo_reconexao=5):
+        self.params = params
+        self.intervalo_reconexao = intervalo_reconexao
+        self._callbacks = {}  # canal -> [callback(payload)]
+        self._ao_conectar = []  # chamados após cada (re)conexão, para recuperar o que se perdeu
+        # Registrados com a conexão já aberta: rodam uma vez, logo após o LISTEN dos canais novos
+        self._ao_conectar_pendentes = []
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        # Acorda a thread no select quando há canal ou recuperação nova para tratar
+        self._acordar_leitura, self._acordar_escrita = socket.socketpair()
+        self._acordar_leitura.setblocking(False)
+        self._acordar_escrita.setblocking(False)
+
+    def registrar(self, canal, callback):
+        with self._lock:
+            self._callbacks.setdefault(canal, []).append(callback)
+        self._acordar()
+
+    def ao_conectar(self, callback):
+        with self._lock:
+            self._ao_conectar.append(callback)
+            self._ao_conectar_pendentes.append(callback)
+        self._acordar()
+
+    def remover(self, canal, callback):
+        # O LISTEN do canal continua ativo; só deixa de repassar para esse callback
+        with self._lock:
+            if callback in self._callbacks.get(canal, []):
+                self._callbacks[canal].remove(callback)
+
+    def remover_ao_conectar(self, callback):
+        with self._lock:
+            if callback in self._ao_conectar:
+                self._ao_conectar.remove(callback)
+            if callback in self._ao_conectar_pendentes:
+                self._ao_conectar_pendentes.remove(callback)
+
+    def iniciar(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name="oficina-ouvinte", daemon=True)
+            self._thread.start()
+
+    def parar(self, timeout=5):
+        self._parar.set()
+        self._acordar()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _acordar(self):
+        try:
+            self._acordar_escrita.send(b'\0')
+        except BlockingIOError:
+            pass  # buffer cheio: a thread já tem o que ler
+
+    def _esvaziar_despertador(self):
+        try:
+            while self._acordar_leitura.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _despachar(self, callbacks, *args):
+        for callback in callbacks:
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Erro no callback de notificacao: {e}")
+
+    def _executar(self):
+        while not self._parar.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.params)
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                escutando = set()
+                primeira_volta = True
+                while not self._parar.is_set():
+                    with self._lock:
+                        canais = set(self._callbacks)
+                        # Numa conexão nova rodam todos; depois, só os registrados desde a última volta
+                        ao_conectar = list(self._ao_conectar if primeira_volta else self._ao_conectar_pendentes)
+                        del self._ao_conectar_pendentes[:]
+                    for canal in canais - escutando:
+                        cursor.execute(sql.SQL("LISTEN {};").format(sql.Identifier(canal)))
+                        escutando.add(canal)
+                    # Só depois do LISTEN, para não perder o que chegar durante a recuperação
+                    self._despachar(ao_conectar)
+                    primeira_volta = False
+                    prontos = select.select([conn, self._acordar_leitura], [], [], 1.0)[0]
+                    if self._acordar_leitura in prontos:
+                        self._esvaziar_despertador()
+                    if conn not in prontos:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notificacao = conn.notifies.pop(0)
+                        with self._lock:
+                            callbacks = list(self._callbacks.get(notificacao.channel, []))
+                        self._despachar(callbacks, notificacao.payload)
+            except (psycopg2.Error, OSError) as e:
+                print(f"Ouvinte de notificacoes desconectado: {e}")
+                self._parar.wait(self.intervalo_reconexao)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+
+_ouvintes = {}
+_ouvintes_lock = threading.Lock()
+
+
+def obter_ouvinte(params):
+    """Retorna o ouvinte compartilhado do processo para esses parâmetros de conexão."""
+    chave = tuple(sorted((k, str(v)) for k, v in params.items()))
+    with _ouvintes_lock:
+        ouvinte = _ouvintes.get(chave)
+        if ouvinte is None:
+            ouvinte = _ouvintes[chave] = OuvinteNotify(params)
+        return ouvinte
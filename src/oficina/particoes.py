@@ -0,0 +1,274 @@
+import re
+import threading
+from datetime import date
+
+from psycopg2 import Error, sql
+
+from .base import BaseCRUD
+
+# Manutenção das partições mensais de ordem_servico, execucao_servico e
+# utiliza_peca (ver migração 5). Cada mês tem uma partição por tabela, com o
+# mesmo sufixo: ordem_servico_p202601, execucao_servico_p202601, ...
+#
+#   criar_particoes_futuras: cria com antecedência os próximos meses, para que
+#       ordens novas não caiam na partição padrão (roda no setup; rode também
+#       periodicamente, ex.: cron). Como rede de segurança, a primeira OS de cada
+#       mês criada pelo processo garante a partição do mês (garantir_mes), e meses
+#       que já tinham linhas na partição padrão têm essas linhas movidas para a
+#       partição nova (migração 7)
+#   arquivar: trata meses antigos em que todas as ordens estão fechadas:
+#       modo 'desanexar' tira as partições do mês das tabelas ativas e as move
+#       para o schema `arquivo` (continuam consultáveis, mas fora das listagens);
+#       modo 'compactar' mantém o mês anexado e reescreve as partições com
+#       VACUUM FULL/FREEZE, que não precisam mais ser revisitadas pelo autovacuum
+
+TABELAS_PARTICIONADAS = ('ordem_servico', 'execucao_servico', 'utiliza_peca')
+SCHEMA_ARQUIVO = 'arquivo'
+MODOS_ARQUIVAMENTO = ('desanexar', 'compactar')
+MARCA_COMPACTADA = 'compactada'
+
+
+# Meses cuja partição este processo já garantiu (ver mes_a_garantir)
+_meses_garantidos = set()
+_meses_lock = threading.Lock()
+
+
+def _somar_meses(dia, meses):
+    indice = dia.year * 12 + dia.month - 1 + meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def mes_a_garantir(data_abertura):
+    """Primeiro dia do mês de `data_abertura`, ou None se a partição dele já foi garantida neste processo."""
+    if isinstance(data_abertura, str):
+        data_abertura = date.fromisoformat(data_abertura[:10])
+    mes = date(data_abertura.year, data_abertura.month, 1)
+    with _meses_lock:
+        return None if mes in _meses_garantidos else mes
+
+
+def marcar_mes_garantido(mes):
+    with _meses_lock:
+        _meses_garantidos.add(mes)
+
+
+class GerenciadorParticoes(BaseCRUD):
+    QUERY_PARTICOES = """
+        SELECT c.relname, c.reltuples::bigint, obj_description(c.oid, 'pg_class')
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'ordem_servico'::regclass
+        ORDER BY c.relname;
+        """
+
+    # Espera curta pelos locks: quem chama pode estar numa sessão que já leu a
+    # partição padrão, e esperar por ela aqui seria esperar por si mesmo
+    GARANTIR_MES = [
+        "SET LOCAL lock_timeout = '2s';",
+        "SELECT fn_criar_particoes_os(%s::date, (%s::date + interval '1 month')::date);",
+    ]
+
+    QUERY_MES_FECHADO = """
+        SELECT NOT EXISTS (SELECT 1 FROM {} WHERE status IS NULL OR status NOT IN %s);
+        """
+
+    # Os resumos dos relatórios contam só o que está nas tabelas ativas
+    DESCONTAR_RESUMOS = [
+        """UPDATE resumo_os_status r SET quantidade = r.quantidade - b.quantidade
+        FROM (SELECT COALESCE(status, '') as status, COUNT(*) as quantidade FROM {os} GROUP BY 1) b
+        WHERE r.status = b.status;""",
+        """UPDATE resumo_mecanico r SET
+            servicos = r.servicos - b.servicos,
+            execucoes_com_tempo = r.execucoes_com_tempo - b.execucoes_com_tempo,
+            segundos = r.segundos - b.segundos
+        FROM (SELECT id_mecanico, COUNT(id_servico) as servicos, COUNT(tempo_gasto) as execucoes_com_tempo,
+                     COALESCE(SUM(EXTRACT(EPOCH FROM tempo_gasto)), 0) as segundos
+              FROM {execucao} WHERE id_mecanico IS NOT NULL GROUP BY id_mecanico) b
+        WHERE r.id_mecanico = b.id_mecanico;""",
+    ]
+
+    # Depois de desanexar: última OS recalculada com o que ficou nas tabelas ativas
+    DESCONTAR_SOLICITANTES = """
+        UPDATE resumo_solicitante_os r SET total_os = r.total_os - b.total_os,
+            ultima_os = (SELECT MAX(data_abertura) FROM ordem_servico o WHERE o.id_solicitante = r.id_solicitante)
+        FROM (SELECT id_solicitante, COUNT(*) as total_os FROM {os}
+              WHERE id_solicitante IS NOT NULL GROUP BY id_solicitante) b
+        WHERE r.id_solicitante = b.id_solicitante;
+        """
+
+    def criar_particoes(self, inicio, fim):
+        """Cria as partições mensais que faltam entre `inicio` e `fim` (exclusivo); retorna os nomes criados."""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT fn_criar_particoes_os(%s, %s);", (inicio, fim))
+                criadas = [row[0] for row in cursor.fetchall()]
+                for aviso in conn.notices:
+                    print(aviso.strip())
+                del conn.notices[:]
+                conn.commit()
+        except Error as e:
+            print(f"Erro ao criar particoes: {e}")
+            return None
+        print(f"Particoes criadas: {len(criadas)}")
+        return criadas
+
+    def criar_particoes_futuras(self, meses=3):
+        """Garante partições do mês atual até `meses` meses à frente."""
+        inicio = date.today().replace(day=1)
+        return self.criar_particoes(inicio, _somar_meses(inicio, meses + 1))
+
+    def garantir_mes(self, data_abertura):
+        """Cria as partições do mês de `data_abertura` se faltarem (uma vez por mês e processo).
+
+        Roda numa conexão própria, antes da OS ser gravada; se falhar, a OS cai na
+        partição padrão e a próxima chamada tenta de novo.
+        """
+        mes = mes_a_garantir(data_abertura)
+        if mes is None:
+            return
+        try:
+            with self.db.get_connection(sessao=False) as conn:
+                cursor = conn.cursor()
+                cursor.execute(self.GARANTIR_MES[0])
+                cursor.execute(self.GARANTIR_MES[1], (mes, mes))
+                for aviso in conn.notices:
+                    print(aviso.strip())
+                del conn.notices[:]
+                conn.commit()
+        except Error as e:
+            print(f"Erro ao garantir particoes de {mes:%Y-%m}: {e}")
+            return
+        marcar_mes_garantido(mes)
+
+    def listar_particoes(self):
+        """Partições ativas de ordem_servico: (nome, mês, linhas estimadas, compactada)."""
+        resultado = self.execute_query(self.QUERY_PARTICOES)
+        if resultado is None:
+            return None
+        linhas = []
+        for nome, estimadas, comentario in resultado['data']:
+            mes = self._mes(nome)
+            linhas.append((nome, mes, max(estimadas, 0), (comentario or '').startswith(MARCA_COMPACTADA)))
+        return {'columns': ['particao', 'mes', 'linhas_estimadas', 'compactada'], 'data': linhas}
+
+    def _mes(self, nome):
+        # Sufixo _pAAAAMM; a partição padrão não tem mês
+        encontrado = re.fullmatch(r'ordem_servico_p(\d{4})(\d{2})', nome)
+        if encontrado is None:
+            return None
+        return date(int(encontrado.group(1)), int(encontrado.group(2)), 1)
+
+    def arquivar(self, meses=24, modo='desanexar', status_fechados=('Concluida', 'Cancelada')):
+        """Arquiva os meses abertos há mais de `meses` meses cujas ordens estão todas fechadas.
+
+        Uma ordem está fechada quando seu status está em `status_fechados`.
+        Retorna {'arquivadas': [mês, ...], 'ignoradas': [(mês, motivo), ...]}.
+        """
+        if modo not in MODOS_ARQUIVAMENTO:
+            raise ValueError(f"Modo de arquivamento inválido: {modo!r} (use {', '.join(MODOS_ARQUIVAMENTO)})")
+        status_fechados = tuple(status_fechados)
+        if not status_fechados:
+            raise ValueError("Informe ao menos um status de ordem fechada")
+        particoes = self.listar_particoes()
+        if particoes is None:
+            return None
+        limite = _somar_meses(date.today().replace(day=1), -meses)
+        resultado = {'arquivadas': [], 'ignoradas': []}
+        for nome, mes, _, compactada in particoes['data']:
+            if mes is None or mes >= limite or (modo == 'compactar' and compactada):
+                continue
+            sufixo = nome[len('ordem_servico'):]
+            try:
+                with self.db.get_connection() as conn:
+                    fechado = self._mes_fechado(conn.cursor(), nome, status_fechados)
+            except Error as e:
+                print(f"Erro ao verificar ordens de {mes:%Y-%m}: {e}")
+                return None
+            if not fechado:
+                resultado['ignoradas'].append((mes, "ha ordens nao fechadas"))
+                continue
+            if modo == 'desanexar':
+                erro = self._desanexar(sufixo, mes, status_fechados)
+            else:
+                erro = self._compactar(sufixo, mes)
+            if erro:
+                resultado['ignoradas'].append((mes, erro))
+            else:
+                resultado['arquivadas'].append(mes)
+        print(f"Arquivamento ({modo}): {len(resultado['arquivadas'])} meses arquivados, "
+              f"{len(resultado['ignoradas'])} ignorados")
+        return resultado
+
+    def _mes_fechado(self, cursor, particao, status_fechados):
+        cursor.execute(sql.SQL(self.QUERY_MES_FECHADO).format(sql.Identifier(particao)), (status_fechados,))
+        return cursor.fetchone()[0]
+
+    def _desanexar(self, sufixo, mes, status_fechados):
+        os_, execucao, uso = (sql.Identifier(tabela + sufixo) for tabela in TABELAS_PARTICIONADAS)
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                # A verificação de arquivar() foi em outra transação: com o mês travado
+                # contra escritas, confere de novo antes de descontar os resumos
+                cursor.execute(sql.SQL("LOCK TABLE {}, {}, {} IN SHARE MODE;").format(os_, execucao, uso))
+                if not self._mes_fechado(cursor, 'ordem_servico' + sufixo, status_fechados):
+                    conn.rollback()
+                    return "ha ordens nao fechadas"
+                cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {};").format(sql.Identifier(SCHEMA_ARQUIVO)))
+                for comando in self.DESCONTAR_RESUMOS:
+                    cursor.execute(sql.SQL(comando).format(os=os_, execucao=execucao))
+                # As filhas saem primeiro; sem as FKs para as tabelas ativas, os serviços
+                # do mês e por fim a própria partição de ordens podem sair também
+                for tabela, particao in (('execucao_servico', execucao), ('utiliza_peca', uso)):
+                    cursor.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {};").format(
+                        sql.Identifier(tabela), particao))
+                    self._remover_fks_ativas(cursor, particao)
+                servicos = sql.Identifier(SCHEMA_ARQUIVO, 'servico' + sufixo)
+                fim = _somar_meses(mes, 1)
+                do_mes = sql.SQL(
+                    "cod_os IN (SELECT id_os FROM {}) AND data_abertura_os >= %s AND data_abertura_os < %s"
+                ).format(os_)
+                cursor.execute(sql.SQL("CREATE TABLE {} AS SELECT * FROM servico WHERE {};").format(
+                    servicos, do_mes), (mes, fim))
+                cursor.execute(sql.SQL("DELETE FROM servico WHERE {};").format(do_mes), (mes, fim))
+                cursor.execute(sql.SQL("ALTER TABLE ordem_servico DETACH PARTITION {};").format(os_))
+                cursor.execute(sql.SQL(self.DESCONTAR_SOLICITANTES).format(os=os_))
+                for particao in (os_, execucao, uso):
+                    cursor.execute(sql.SQL("ALTER TABLE {} SET SCHEMA {};").format(
+                        particao, sql.Identifier(SCHEMA_ARQUIVO)))
+                conn.commit()
+        except Error as e:
+            print(f"Erro ao desanexar particoes de {mes:%Y-%m}: {e}")
+            return str(e).strip()
+        print(f"Particoes de {mes:%Y-%m} movidas para o schema {SCHEMA_ARQUIVO}")
+        return None
+
+    def _remover_fks_ativas(self, cursor, particao):
+        # A partição desanexada mantém cópias das FKs; as que apontam para as tabelas
+        # ativas impediriam tirar as ordens e serviços do mês
+        cursor.execute(sql.SQL("""
+            SELECT conname FROM pg_constraint
+            WHERE conrelid = {}::regclass AND contype = 'f'
+              AND confrelid IN ('ordem_servico'::regclass, 'servico'::regclass);
+        """).format(sql.Literal(particao.string)))
+        for (restricao,) in cursor.fetchall():
+            cursor.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {};").format(
+                particao, sql.Identifier(restricao)))
+
+    def _compactar(self, sufixo, mes):
+        # VACUUM não roda dentro de transação
+        try:
+            with self.db.get_connection(sessao=False) as conn:
+                conn.autocommit = True
+                cursor = conn.cursor()
+                for tabela in TABELAS_PARTICIONADAS:
+                    particao = sql.Identifier(tabela + sufixo)
+                    cursor.execute(sql.SQL("VACUUM (FULL, FREEZE, ANALYZE) {};").format(particao))
+                    cursor.execute(sql.SQL("COMMENT ON TABLE {} IS {};").format(
+                        particao, sql.Literal(f"{MARCA_COMPACTADA} em {date.today():%Y-%m-%d}")))
+        except Error as e:
+            print(f"Erro ao compactar particoes de {mes:%Y-%m}: {e}")
+            return str(e).strip()
+        print(f"Particoes de {mes:%Y-%m} compactadas")
+        return None
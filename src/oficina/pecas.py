@@ -1,13 +1,74 @@
 from .base import BaseCRUD
+from .replicas import rota_leitura
 
 # Realiza o cadastro de peças e controle de estoque
 class PecaCRUD(BaseCRUD):
+    INSERT_PECA = "INSERT INTO peca (nome_peca, qt_estoque, valor_uni) VALUES (%s, %s, %s) RETURNING cod_peca;"
+    UPDATE_ESTOQUE = "UPDATE peca SET qt_estoque = %s WHERE cod_peca = %s;"
+    UPDATE_ESTOQUE_MINIMO = "UPDATE peca SET estoque_minimo = %s WHERE cod_peca = %s;"
+    # Eventos de alerta_estoque (migração 6) a partir de um id, para recuperar o que não foi ouvido
+    QUERY_ALERTAS = """
+        SELECT a.id_alerta, a.cod_peca, p.nome_peca, a.tipo, a.qt_estoque, a.estoque_minimo, a.criado_em
+        FROM alerta_estoque a
+        JOIN peca p ON p.cod_peca = a.cod_peca
+        WHERE a.id_alerta > %s
+        ORDER BY a.id_alerta
+        LIMIT %s;
+        """
+
+    # Baixa atômica de várias peças para uma OS num único comando: trava as linhas
+    # em ordem de cod_peca (evita deadlock entre baixas concorrentes), decrementa o
+    # estoque relativo ao valor atual e acumula em utiliza_peca. Se faltar qualquer
+    # peça, nada é alterado e o resultado traz o disponível de cada uma.
+    CONSUMIR_PECAS = """
+        WITH pedido AS (
+            SELECT id_peca, SUM(quantidade)::int AS quantidade
+            FROM unnest(%s::int[], %s::int[]) AS t(id_peca, quantidade)
+            GROUP BY id_peca
+        ),
+        travadas AS (
+            SELECT p.cod_peca, COALESCE(p.qt_estoque, 0) AS qt_estoque
+            FROM peca p JOIN pedido pd ON pd.id_peca = p.cod_peca
+            ORDER BY p.cod_peca
+            FOR UPDATE OF p
+        ),
+        suficiente AS (
+            SELECT NOT EXISTS (
+                SELECT 1 FROM pedido pd LEFT JOIN travadas t ON t.cod_peca = pd.id_peca
+                WHERE t.cod_peca IS NULL OR t.qt_estoque < pd.quantidade
+            ) AS ok
+        ),
+        baixa AS (
+            -- Só linhas vindas de travadas: cada peça é atualizada depois de travada
+            -- lá, na ordem de cod_peca, e nunca por um caminho próprio do UPDATE
+            UPDATE peca p SET qt_estoque = COALESCE(p.qt_estoque, 0) - pd.quantidade
+            FROM travadas t JOIN pedido pd ON pd.id_peca = t.cod_peca, suficiente s
+            WHERE p.cod_peca = t.cod_peca AND s.ok
+            RETURNING p.cod_peca, p.qt_estoque
+        ),
+        uso AS (
+            INSERT INTO utiliza_peca (id_os, data_abertura_os, id_peca, quantidade)
+            SELECT o.id_os, o.data_abertura, pd.id_peca, pd.quantidade
+            FROM pedido pd, suficiente s, (
+                -- Sem a OS, a data fica nula e o INSERT falha, desfazendo a baixa
+                SELECT %s::int AS id_os, (SELECT data_abertura FROM ordem_servico WHERE id_os = %s::int) AS data_abertura
+            ) o
+            WHERE s.ok
+            ON CONFLICT (id_os, data_abertura_os, id_peca)
+            DO UPDATE SET quantidade = utiliza_peca.quantidade + EXCLUDED.quantidade
+        )
+        SELECT pd.id_peca, pd.quantidade, t.qt_estoque AS disponivel, b.qt_estoque AS restante
+        FROM pedido pd
+        LEFT JOIN travadas t ON t.cod_peca = pd.id_peca
+        LEFT JOIN baixa b ON b.cod_peca = pd.id_peca
+        ORDER BY pd.id_peca;
+        """
+
     def inserir_peca(self, nome_peca, qt_estoque, valor_uni):
-        query = "INSERT INTO peca (nome_peca, qt_estoque, valor_uni) VALUES (%s, %s, %s) RETURNING cod_peca;"
         try:
             with self.db.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(query, (nome_peca, qt_estoque, valor_uni))
+                self._executar(cursor, self.INSERT_PECA, (nome_peca, qt_estoque, valor_uni))
                 cod_peca = cursor.fetchone()[0]
                 conn.commit()
                 print(f"Peca '{nome_peca}' inserida com sucesso!")
@@ -16,18 +77,148 @@ class PecaCRUD(BaseCRUD):
             print(f"Erro ao inserir peca: {e}")
             return None
 
-    def listar_estoque(self, estoque_baixo=None):
+    def _query_estoque(self, estoque_baixo=None):
         query = "SELECT cod_peca, nome_peca, qt_estoque, valor_uni FROM peca"
         params = None
         if estoque_baixo:
             query += " WHERE qt_estoque <= %s"
             params = (estoque_baixo,)
-        query += " ORDER BY nome_peca;"
-        return self.execute_query(query, params)
+        query += " ORDER BY nome_peca, cod_peca;"
+        return query, params
+
+    def _query_pagina_estoque(self, estoque_baixo, apos, limite):
+        # Keyset em (nome_peca, cod_peca). Peças sem nome vêm por último (NULLS LAST),
+        # então a página é a união de dois trechos que usam índice, cada um com LIMIT.
+        colunas = "SELECT cod_peca, nome_peca, qt_estoque, valor_uni FROM peca"
+        filtro, filtro_params = "", []
+        if estoque_baixo:
+            filtro = " AND qt_estoque <= %s"
+            filtro_params = [estoque_baixo]
+        trechos, params = [], []
+        if apos is None or apos[0] is not None:
+            keyset, keyset_params = "", []
+            if apos is not None:
+                keyset = " AND (nome_peca, cod_peca) > (%s, %s)"
+                keyset_params = list(apos)
+            trechos.append(f"({colunas} WHERE nome_peca IS NOT NULL{keyset}{filtro}"
+                           " ORDER BY nome_peca, cod_peca LIMIT %s)")
+            params += keyset_params + filtro_params + [limite]
+        keyset, keyset_params = "", []
+        if apos is not None and apos[0] is None:
+            keyset = " AND cod_peca > %s"
+            keyset_params = [apos[1]]
+        trechos.append(f"({colunas} WHERE nome_peca IS NULL{keyset}{filtro}"
+                       " ORDER BY cod_peca LIMIT %s)")
+        params += keyset_params + filtro_params + [limite]
+        query = " UNION ALL ".join(trechos) + " ORDER BY nome_peca NULLS LAST, cod_peca LIMIT %s;"
+        return query, tuple(params) + (limite,)
+
+    @rota_leitura
+    def listar_estoque(self, estoque_baixo=None, limite=None, token=None):
+        """Lista as peças por nome. Com `limite`, retorna uma página e o token `proximo`
+        (None na última página) para a chamada seguinte."""
+        if limite is None and token is None:
+            query, params = self._query_estoque(estoque_baixo)
+            return self.execute_query(query, params)
+        limite = limite or 50
+        apos = self._decodificar_token('estoque', token, 2) if token else None
+        query, params = self._query_pagina_estoque(estoque_baixo, apos, limite + 1)
+        return self._executar_pagina(query, params, limite, 'estoque', lambda row: (row[1], row[0]))
+
+    @rota_leitura
+    def iterar_estoque(self, estoque_baixo=None, itersize=2000):
+        # Mesmas linhas de listar_estoque, entregues aos poucos via cursor server-side
+        query, params = self._query_estoque(estoque_baixo)
+        return self.stream_query(query, params, itersize=itersize)
+
+    # Trecho do nome por trigramas (índice GiST em nome_peca); um código numérico
+    # exato entra com relevância máxima
+    QUERY_BUSCAR_NOME = """
+        (SELECT cod_peca, nome_peca, qt_estoque, valor_uni, 1 - (%s <<-> nome_peca) AS relevancia
+         FROM peca WHERE %s <%% nome_peca ORDER BY %s <<-> nome_peca LIMIT %s)
+        """
+    QUERY_BUSCAR_CODIGO = """
+        (SELECT cod_peca, nome_peca, qt_estoque, valor_uni, 1.0 FROM peca WHERE cod_peca = %s)
+        """
+
+    @rota_leitura
+    def buscar_pecas(self, termo, limite=20):
+        """Busca peças por trecho do nome (ou pelo código), da mais para a menos relevante."""
+        termo = (termo or '').strip()
+        if not termo:
+            print("Informe um termo de busca")
+            return None
+        trechos = [self.QUERY_BUSCAR_NOME]
+        params = [termo, termo, termo, limite]
+        if termo.isascii() and termo.isdigit() and int(termo) <= 2**31 - 1:
+            trechos.append(self.QUERY_BUSCAR_CODIGO)
+            params.append(int(termo))
+        query = ("SELECT cod_peca, nome_peca, qt_estoque, valor_uni, MAX(relevancia) AS relevancia FROM ("
+                 + " UNION ALL ".join(trechos)
+                 + ") t GROUP BY cod_peca, nome_peca, qt_estoque, valor_uni"
+                 " ORDER BY relevancia DESC, cod_peca LIMIT %s;")
+        return self.execute_query(query, tuple(params) + (limite,))
 
     def atualizar_estoque(self, cod_peca, nova_quantidade):
-        query = "UPDATE peca SET qt_estoque = %s WHERE cod_peca = %s;"
-        result = self.execute_query(query, (nova_quantidade, cod_peca), fetch=False)
+        result = self.execute_query(self.UPDATE_ESTOQUE, (nova_quantidade, cod_peca), fetch=False)
         if result:
             print(f"Estoque da peca {cod_peca} atualizado para {nova_quantidade}")
         return result
+
+    def definir_estoque_minimo(self, cod_peca, estoque_minimo):
+        """Define o estoque mínimo da peça (None desliga o alerta).
+
+        Se o estoque já estiver no mínimo ou abaixo, o alerta 'baixo' sai no commit.
+        """
+        result = self.execute_query(self.UPDATE_ESTOQUE_MINIMO, (estoque_minimo, cod_peca), fetch=False)
+        if result:
+            print(f"Estoque minimo da peca {cod_peca} definido para {estoque_minimo}")
+        return result
+
+    def listar_alertas_estoque(self, apos_id=0, limite=1000):
+        """Alertas de estoque registrados depois de `apos_id`, do mais antigo ao mais novo."""
+        return self.execute_query(self.QUERY_ALERTAS, (apos_id, limite))
+
+    def consumir_pecas(self, id_os, itens):
+        """Baixa do estoque as peças usadas numa OS e registra em utiliza_peca.
+
+        `itens` é uma lista de (cod_peca, quantidade). Tudo acontece numa única
+        transação e ida ao banco: ou todas as peças são baixadas, ou nenhuma.
+        Retorna {'ok', 'itens', 'faltas'}; cada falta traz cod_peca, solicitado e
+        disponivel (None quando a peça não existe).
+        """
+        itens = list(itens)
+        if not itens or any(quantidade is None or quantidade <= 0 for _, quantidade in itens):
+            print("Erro ao consumir pecas: informe ao menos uma peca com quantidade positiva")
+            return None
+        params = ([cod_peca for cod_peca, _ in itens], [quantidade for _, quantidade in itens], id_os, id_os)
+        try:
+            with self.db.get_connection() as conn:
+                # Um único comando já é atômico; em autocommit não há ida extra para o COMMIT
+                # (numa Sessao o autocommit é ignorado e a baixa entra na transação dela)
+                conn.autocommit = True
+                cursor = conn.cursor()
+                self._executar(cursor, self.CONSUMIR_PECAS, params)
+                linhas = cursor.fetchall()
+        except Exception as e:
+            print(f"Erro ao consumir pecas da OS {id_os}: {e}")
+            return None
+
+        resultado = {'ok': True, 'itens': [], 'faltas': []}
+        for cod_peca, solicitado, disponivel, restante in linhas:
+            resultado['itens'].append({'cod_peca': cod_peca, 'solicitado': solicitado,
+                                       'disponivel': disponivel, 'restante': restante})
+            if disponivel is None or disponivel < solicitado:
+                resultado['ok'] = False
+                resultado['faltas'].append({'cod_peca': cod_peca, 'solicitado': solicitado,
+                                            'disponivel': disponivel})
+        if resultado['ok']:
+            print(f"Pecas da OS {id_os} baixadas do estoque: {len(linhas)} itens")
+        else:
+            for falta in resultado['faltas']:
+                if falta['disponivel'] is None:
+                    print(f"Peca {falta['cod_peca']} nao encontrada")
+                else:
+                    print(f"Estoque insuficiente da peca {falta['cod_peca']}: "
+                          f"solicitado {falta['solicitado']}, disponivel {falta['disponivel']}")
+        return resultado
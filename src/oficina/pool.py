@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+from .instrumentacao import CursorInstrumentado, registrar_espera
+from .preparados import EstadoPreparados
+
+
+class PoolEsgotadoError(Exception):
+    pass
+
+
+# Conexão do pool; guarda o estado dos prepared statements criados nela, usa
+# cursores instrumentados (latência por consulta, ver instrumentacao.py) e anota
+# se houve commit desde o empréstimo (ler as próprias escritas, ver replicas.py)
+class ConexaoOficina(extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preparados = EstadoPreparados()
+        self.cursor_factory = CursorInstrumentado
+        self.confirmou = False
+
+    def commit(self):
+        super().commit()
+        self.confirmou = True
+
+
+# Pool de conexões thread-safe compartilhado por todos os CRUDs do processo
+class ConnectionPool:
+    def __init__(self, params, minconn=1, maxconn=10, idle_timeout=300,
+                 health_check_interval=30, timeout=30):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Tamanho de pool inválido: min=%s max=%s" % (minconn, maxconn))
+        self.params = params
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self._livres = deque()  # (conexão, instante em que foi devolvida)
+        self._em_uso = set()
+        self._reservadas = 0
+        self._cond = threading.Condition()
+        self._fechado = False
+        self._stats = {
+            'criadas': 0,
+            'descartadas': 0,
+            'expiradas': 0,
+            'falhas_health_check': 0,
+            'checkouts': 0,
+            'esperas': 0,
+            'tempo_espera_total': 0.0,
+        }
+        for _ in range(minconn):
+            self._livres.append((self._conectar(), time.monotonic()))
+
+    def _conectar(self):
+        conn = psycopg2.connect(connection_factory=ConexaoOficina, **self.params)
+        with self._cond:
+            self._stats['criadas'] += 1
+        return conn
+
+    def _saudavel(self, conn, ocioso_desde):
+        if conn.closed:
+            return False
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - ocioso_desde < self.health_check_interval:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1;")
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _fechar(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _expirar_ociosas(self):
+        # Chamado com o lock adquirido; remove do início da fila (mais antigas)
+        agora = time.monotonic()
+        total = len(self._livres) + len(self._em_uso)
+        while self._livres and total > self.minconn:
+            conn, ocioso_desde = self._livres[0]
+            if agora - ocioso_desde < self.idle_timeout:
+                break
+            self._livres.popleft()
+            self._fechar(conn)
+            self._stats['expiradas'] += 1
+            total -= 1
+
+    def getconn(self):
+        inicio = time.monotonic()
+        esperou = False
+        while True:
+            with self._cond:
+                while True:
+                    if self._fechado:
+                        raise PoolEsgotadoError("Pool de conexões fechado")
+                    self._expirar_ociosas()
+                    if self._livres:
+                        # LIFO: reaproveita a conexão mais recente (mais provável de estar viva)
+                        conn, ocioso_desde = self._livres.pop()
+                        break
+                    if len(self._em_uso) + self._reservadas < self.maxconn:
+                        # Reserva a vaga antes de conectar para não ultrapassar o máximo
+                        conn, ocioso_desde = None, None
+                        self._reservadas += 1
+                        break
+                    esperou = True
+                    restante = self.timeout - (time.monotonic() - inicio)
+                    if restante <= 0:
+                        raise PoolEsgotadoError(
+                            "Nenhuma conexão livre após %ss (max=%s)" % (self.timeout, self.maxconn))
+                    self._cond.wait(restante)
+
+            # Conexão e health check acontecem fora do lock
+            if conn is None:
+                try:
+                    conn = self._conectar()
+                finally:
+                    with self._cond:
+                        self._reservadas -= 1
+                        self._cond.notify()
+            elif not self._saudavel(conn, ocioso_desde):
+                self._fechar(conn)
+                with self._cond:
+                    self._stats['falhas_health_check'] += 1
+                continue
+
+            espera = time.monotonic() - inicio
+            with self._cond:
+                self._em_uso.add(conn)
+                self._stats['checkouts'] += 1
+                if esperou:
+                    self._stats['esperas'] += 1
+                self._stats['tempo_espera_total'] += espera
+            registrar_espera(espera)
+            return conn
+
+    def putconn(self, conn, descartar=False):
+        if not conn.closed and not descartar:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                descartar = True
+        with self._cond:
+            self._em_uso.discard(conn)
+            if self._fechado or descartar or conn.closed:
+                self._fechar(conn)
+                self._stats['descartadas'] += 1
+            else:
+                self._livres.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._fechado = True
+            while self._livres:
+                self._fechar(self._livres.pop()[0])
+            for conn in list(self._em_uso):
+                self._fechar(conn)
+            self._em_uso.clear()
+            self._cond.notify_all()
+
+    def estatisticas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'minconn': self.minconn,
+                'maxconn': self.maxconn,
+                'livres': len(self._livres),
+                'em_uso': len(self._em_uso),
+            })
+        return stats
@@ -0,0 +1,115 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from psycopg2 import Error, extensions
+
+# Cache de prepared statements por conexão do pool.
+# Consultas repetidas numa conexão são preparadas uma vez (PREPARE) e depois
+# executadas com EXECUTE, evitando parse/planejamento a cada chamada.
+# DB_PREPARED=0 desliga; DB_PREPARED_MAX limita os statements por conexão e
+# DB_PREPARED_LIMIAR define em qual uso da consulta ela passa a ser preparada.
+config = {
+    'ativo': os.getenv('DB_PREPARED', '1') == '1',
+    'max_por_conexao': int(os.getenv('DB_PREPARED_MAX', 100)),
+    'limiar': int(os.getenv('DB_PREPARED_LIMIAR', 2)),
+}
+
+_stats = {'preparados': 0, 'execucoes_preparadas': 0, 'execucoes_diretas': 0, 'descartados': 0, 'falhas': 0}
+_stats_lock = threading.Lock()
+# Consultas que o servidor não conseguiu preparar (ex.: tipo de parâmetro indeterminado)
+_nao_preparaveis = set()
+
+
+@lru_cache(maxsize=512)
+def converter_placeholders(query):
+    """Troca os placeholders %s do psycopg2 por $1, $2, ... (e %% por %)."""
+    contador = iter(range(1, 10000))
+    return re.sub(r'%%|%s', lambda m: '%' if m.group() == '%%' else f'${next(contador)}', query)
+
+
+def _contar(chave, n=1):
+    with _stats_lock:
+        _stats[chave] += n
+
+
+# Estado guardado em cada conexão do pool (ver ConexaoOficina)
+class EstadoPreparados:
+    def __init__(self):
+        self.nomes = OrderedDict()  # consulta -> nome do statement, em ordem de uso (LRU)
+        self.consultas = {}         # nome do statement -> consulta (usado na instrumentação)
+        self.usos = OrderedDict()   # consulta -> execuções ainda não preparadas
+        self.sequencia = 0
+
+
+def _preparar(cursor, estado, query):
+    estado.sequencia += 1
+    nome = f"oficina_{estado.sequencia}"
+    corpo = converter_placeholders(query).strip().rstrip(';')
+    # Em transação aberta, um PREPARE com erro abortaria a transação do chamador
+    em_transacao = cursor.connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE
+    try:
+        if em_transacao:
+            cursor.execute("SAVEPOINT oficina_prepare;")
+        cursor.execute(f"PREPARE {nome} AS {corpo};")
+        if em_transacao:
+            cursor.execute("RELEASE SAVEPOINT oficina_prepare;")
+    except Error:
+        if em_transacao:
+            cursor.execute("ROLLBACK TO SAVEPOINT oficina_prepare;")
+        else:
+            cursor.connection.rollback()
+        _nao_preparaveis.add(query)
+        _contar('falhas')
+        return None
+
+    estado.nomes[query] = nome
+    estado.consultas[nome] = query
+    _contar('preparados')
+    while len(estado.nomes) > config['max_por_conexao']:
+        _, antigo = estado.nomes.popitem(last=False)
+        del estado.consultas[antigo]
+        cursor.execute(f"DEALLOCATE {antigo};")
+        _contar('descartados')
+    return nome
+
+
+def executar(cursor, query, params=None):
+    """Executa `query` no cursor, usando um prepared statement quando a consulta é frequente."""
+    estado = getattr(cursor.connection, 'preparados', None)
+    if (not config['ativo'] or estado is None or isinstance(params, dict)
+            or query in _nao_preparaveis):
+        _contar('execucoes_diretas')
+        return cursor.execute(query, params)
+
+    nome = estado.nomes.get(query)
+    if nome is None:
+        usos = estado.usos.pop(query, 0) + 1
+        if usos < config['limiar']:
+            estado.usos[query] = usos
+            while len(estado.usos) > 4 * config['max_por_conexao']:
+                estado.usos.popitem(last=False)
+            _contar('execucoes_diretas')
+            return cursor.execute(query, params)
+        nome = _preparar(cursor, estado, query)
+        if nome is None:
+            _contar('execucoes_diretas')
+            return cursor.execute(query, params)
+    else:
+        estado.nomes.move_to_end(query)
+
+    params = tuple(params or ())
+    argumentos = f" ({', '.join(['%s'] * len(params))})" if params else ""
+    _contar('execucoes_preparadas')
+    return cursor.execute(f"EXECUTE {nome}{argumentos};", params or None)
+
+
+def estatisticas():
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats['execucoes_preparadas'] + stats['execucoes_diretas']
+    stats['taxa_acerto'] = stats['execucoes_preparadas'] / total if total else 0.0
+    stats['ativo'] = config['ativo']
+    return stats
@@ -1,39 +1,320 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from psycopg2 import Error
+
+from . import colunar
 from .base import BaseCRUD
+from .migracoes import RECONSTRUIR_RESUMOS
+from .pecas import PecaCRUD
+from .replicas import rota_leitura
 
+# Os relatórios leem as tabelas resumo_*, mantidas por triggers (ver migracoes.py),
+# em vez de agregar todo o histórico de ordens e execuções a cada chamada; com
+# data_inicio/data_fim agregam só as partições do período
 class RelatorioCRUD(BaseCRUD):
-    def os_por_status(self):
-        query = """
+    QUERY_OS_POR_STATUS = """
+        SELECT NULLIF(status, '') as status, quantidade,
+        ROUND(quantidade * 100.0 / SUM(quantidade) OVER (), 2) as percentual
+        FROM resumo_os_status
+        WHERE quantidade > 0
+        ORDER BY quantidade DESC;
+        """
+
+    QUERY_SERVICOS_POR_MECANICO = """
+        SELECT m.nome, m.especialidade,
+        COALESCE(r.servicos, 0) as servicos_executados,
+        CASE WHEN r.execucoes_com_tempo > 0 THEN r.segundos / 3600 END as horas_trabalhadas
+        FROM mecanico m
+        LEFT JOIN resumo_mecanico r ON m.matricula_mec = r.id_mecanico
+        ORDER BY servicos_executados DESC;
+        """
+
+    QUERY_CLIENTES_MAIS_ATIVOS = """
+        SELECT COALESCE(pf.nome, pj.razao_social) as cliente, c.email, c.telefone,
+        r.total_os, r.ultima_os
+        FROM resumo_solicitante_os r
+        JOIN cliente c ON c.id_solicitante = r.id_solicitante
+        LEFT JOIN pessoa_fisica pf ON c.id_cliente = pf.id_cliente
+        LEFT JOIN pessoa_juridica pj ON c.id_cliente = pj.id_cliente
+        WHERE r.total_os > 0
+        ORDER BY r.total_os DESC
+        LIMIT %s;
+        """
+
+    # Com período, os relatórios agregam direto as partições dos meses pedidos
+    # (os resumos cobrem todo o histórico)
+    QUERY_OS_POR_STATUS_PERIODO = """
         SELECT status, COUNT(*) as quantidade,
-        ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM ordem_servico), 2) as percentual
-        FROM ordem_servico 
-        GROUP BY status 
+        ROUND(COUNT(*) * 100.0 / SUM(COUNT(*)) OVER (), 2) as percentual
+        FROM ordem_servico
+        WHERE {condicoes}
+        GROUP BY status
         ORDER BY quantidade DESC;
         """
-        return self.execute_query(query)
 
-    def servicos_por_mecanico(self):
-        query = """
+    QUERY_SERVICOS_POR_MECANICO_PERIODO = """
         SELECT m.nome, m.especialidade,
-        COUNT(es.id_servico) as servicos_executados,
-        SUM(EXTRACT(EPOCH FROM es.tempo_gasto)/3600) as horas_trabalhadas
+        COALESCE(e.servicos, 0) as servicos_executados,
+        e.segundos / 3600 as horas_trabalhadas
         FROM mecanico m
-        LEFT JOIN execucao_servico es ON m.matricula_mec = es.id_mecanico
-        GROUP BY m.matricula_mec, m.nome, m.especialidade
+        LEFT JOIN (
+            SELECT id_mecanico, COUNT(id_servico) as servicos, SUM(EXTRACT(EPOCH FROM tempo_gasto)) as segundos
+            FROM execucao_servico
+            WHERE {condicoes}
+            GROUP BY id_mecanico
+        ) e ON m.matricula_mec = e.id_mecanico
         ORDER BY servicos_executados DESC;
         """
-        return self.execute_query(query)
 
-    def clientes_mais_ativos(self, limite=10):
-        query = """
+    QUERY_CLIENTES_MAIS_ATIVOS_PERIODO = """
         SELECT COALESCE(pf.nome, pj.razao_social) as cliente, c.email, c.telefone,
-        COUNT(os.id_os) as total_os, MAX(os.data_abertura) as ultima_os
-        FROM cliente c
+        r.total_os, r.ultima_os
+        FROM (
+            SELECT id_solicitante, COUNT(*) as total_os, MAX(data_abertura) as ultima_os
+            FROM ordem_servico
+            WHERE {condicoes} AND id_solicitante IS NOT NULL
+            GROUP BY id_solicitante
+        ) r
+        JOIN cliente c ON c.id_solicitante = r.id_solicitante
         LEFT JOIN pessoa_fisica pf ON c.id_cliente = pf.id_cliente
         LEFT JOIN pessoa_juridica pj ON c.id_cliente = pj.id_cliente
-        LEFT JOIN ordem_servico os ON c.id_solicitante = os.id_solicitante
-        GROUP BY c.id_cliente, COALESCE(pf.nome, pj.razao_social), c.email, c.telefone
-        HAVING COUNT(os.id_os) > 0
-        ORDER BY total_os DESC
+        ORDER BY r.total_os DESC
         LIMIT %s;
         """
-        return self.execute_query(query, (limite,))
+
+    # Ordens abertas por dia; a série por semana/mês é montada em colunar.serie_temporal
+    QUERY_VOLUME_OS = """
+        SELECT data_abertura, COUNT(*) as quantidade
+        FROM ordem_servico
+        WHERE {condicoes}
+        GROUP BY data_abertura
+        ORDER BY data_abertura;
+        """
+
+    # formato=None devolve linhas ({'columns', 'data': [tuplas]}); 'numpy' ou 'arrow'
+    # devolvem o resultado em colunas (ver colunar.py)
+    def _relatorio(self, query, params=None, formato=None):
+        if formato is None:
+            return self.execute_query(query, params)
+        return self.execute_query_colunar(query, params, formato)
+
+    # `data_inicio` (inclusivo) e `data_fim` (exclusivo) restringem a data de abertura da OS
+    def _query_periodo(self, query_resumo, query_periodo, coluna, data_inicio, data_fim, params=()):
+        if data_inicio is None and data_fim is None:
+            return query_resumo, tuple(params) or None
+        condicoes, params_periodo = self._filtro_periodo(coluna, data_inicio, data_fim)
+        return query_periodo.format(condicoes=" AND ".join(condicoes)), tuple(params_periodo) + tuple(params)
+
+    def _query_os_por_status(self, data_inicio=None, data_fim=None):
+        return self._query_periodo(self.QUERY_OS_POR_STATUS, self.QUERY_OS_POR_STATUS_PERIODO,
+                                   "data_abertura", data_inicio, data_fim)
+
+    def _query_servicos_por_mecanico(self, data_inicio=None, data_fim=None):
+        return self._query_periodo(self.QUERY_SERVICOS_POR_MECANICO, self.QUERY_SERVICOS_POR_MECANICO_PERIODO,
+                                   "data_abertura_os", data_inicio, data_fim)
+
+    def _query_clientes_mais_ativos(self, limite, data_inicio=None, data_fim=None):
+        return self._query_periodo(self.QUERY_CLIENTES_MAIS_ATIVOS, self.QUERY_CLIENTES_MAIS_ATIVOS_PERIODO,
+                                   "data_abertura", data_inicio, data_fim, (limite,))
+
+    @rota_leitura
+    def os_por_status(self, formato=None, data_inicio=None, data_fim=None):
+        return self._relatorio(*self._query_os_por_status(data_inicio, data_fim), formato)
+
+    @rota_leitura
+    def servicos_por_mecanico(self, formato=None, data_inicio=None, data_fim=None):
+        return self._relatorio(*self._query_servicos_por_mecanico(data_inicio, data_fim), formato)
+
+    @rota_leitura
+    def clientes_mais_ativos(self, limite=10, formato=None, data_inicio=None, data_fim=None):
+        return self._relatorio(*self._query_clientes_mais_ativos(limite, data_inicio, data_fim), formato)
+
+    @rota_leitura
+    def rollup_por_especialidade(self, data_inicio=None, data_fim=None):
+        """Serviços, mecânicos e horas por especialidade, a partir de servicos_por_mecanico."""
+        resultado = self.servicos_por_mecanico('numpy', data_inicio, data_fim)
+        if resultado is None:
+            return None
+        return colunar.rollup_por_especialidade(resultado)
+
+    @rota_leitura
+    def volume_os(self, frequencia='M', data_inicio=None, data_fim=None):
+        """Quantidade de ordens abertas por período ('D', 'W', 'M' ou 'Y'), sem lacunas.
+
+        `data_inicio` é inclusivo e `data_fim` exclusivo.
+        """
+        condicoes, params = self._filtro_periodo("data_abertura", data_inicio, data_fim)
+        condicoes.insert(0, "data_abertura IS NOT NULL")
+        query = self.QUERY_VOLUME_OS.format(condicoes=" AND ".join(condicoes))
+        resultado = self.execute_query_colunar(query, params)
+        if resultado is None:
+            return None
+        return colunar.serie_temporal(resultado['data']['data_abertura'], resultado['data']['quantidade'],
+                                      frequencia)
+
+    def _consultas_dashboard(self, limite_clientes, estoque_baixo, limite_estoque, data_inicio, data_fim):
+        return {
+            'os_por_status': self._query_os_por_status(data_inicio, data_fim),
+            'servicos_por_mecanico': self._query_servicos_por_mecanico(data_inicio, data_fim),
+            'clientes_mais_ativos': self._query_clientes_mais_ativos(limite_clientes, data_inicio, data_fim),
+            'estoque_baixo': PecaCRUD()._query_pagina_estoque(estoque_baixo, None, limite_estoque),
+        }
+
+    def _executar_no_snapshot(self, nome, query, params, snapshot, rota, prazo, em_execucao, lock):
+        # Roda um relatório numa conexão própria, no mesmo servidor e dentro do snapshot
+        # exportado pelo coordenador
+        if time.monotonic() >= prazo:
+            raise TimeoutError
+        with self.db.get_connection(rota=rota) as conn:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY;")
+            try:
+                cursor.execute("SET TRANSACTION SNAPSHOT %s;", (snapshot,))
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    raise TimeoutError
+                # O servidor também interrompe a consulta no prazo, mesmo que o cancel() se perca
+                cursor.execute("SELECT set_config('statement_timeout', %s, true);", (f"{int(restante * 1000)}ms",))
+                with lock:
+                    em_execucao[nome] = conn
+                inicio = time.perf_counter()
+                try:
+                    dados = self._consultar(cursor, query, params)
+                finally:
+                    with lock:
+                        em_execucao.pop(nome, None)
+                return dados, time.perf_counter() - inicio
+            finally:
+                try:
+                    cursor.execute("ROLLBACK;")
+                except Error:
+                    pass
+
+    def dashboard(self, limite_clientes=10, estoque_baixo=10, limite_estoque=50, timeout=10.0, max_workers=4,
+                  data_inicio=None, data_fim=None):
+        """Roda os relatórios do painel em paralelo, todos vendo o mesmo instante do banco.
+
+        Uma conexão coordenadora abre uma transação REPEATABLE READ e exporta o snapshot
+        (pg_export_snapshot); cada relatório roda em outra conexão do pool, num pool de
+        até `max_workers` threads, importando esse snapshot. Relatórios que não terminam
+        em `timeout` segundos são cancelados no servidor. `data_inicio`/`data_fim` valem
+        para os relatórios de ordens, como em os_por_status. Com réplicas configuradas,
+        o painel inteiro roda numa única réplica em dia (o snapshot só vale no servidor
+        que o exportou).
+        Retorna {'relatorios': {nome: resultado}, 'tempos_ms': {nome: ms}, 'erros': {nome: msg},
+        'completo': bool, 'tempo_total_ms': ms}; relatórios com erro ficam com resultado None.
+        """
+        inicio = time.monotonic()
+        prazo = inicio + timeout
+        consultas = self._consultas_dashboard(limite_clientes, estoque_baixo, limite_estoque, data_inicio, data_fim)
+        resultado = {'relatorios': dict.fromkeys(consultas), 'tempos_ms': {}, 'erros': {}}
+        em_execucao = {}  # nome -> conexão com consulta em andamento (para cancelar)
+        lock = threading.Lock()
+        rota = self.db.escolher_rota()
+        try:
+            with self.db.get_connection(sessao=False, rota=rota) as coordenador:
+                coordenador.autocommit = True
+                cursor = coordenador.cursor()
+                cursor.execute("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY;")
+                try:
+                    cursor.execute("SELECT pg_export_snapshot();")
+                    snapshot = cursor.fetchone()[0]
+                    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(consultas))),
+                                                  thread_name_prefix="oficina-dashboard")
+                    futuros = {
+                        executor.submit(self._executar_no_snapshot, nome, query, params,
+                                        snapshot, rota, prazo, em_execucao, lock): nome
+                        for nome, (query, params) in consultas.items()
+                    }
+                    feitos, pendentes = wait(futuros, timeout=max(0.0, prazo - time.monotonic()))
+                    if pendentes:
+                        for futuro in pendentes:
+                            futuro.cancel()
+                        with lock:
+                            for conn in em_execucao.values():
+                                conn.cancel()
+                        wait(pendentes, timeout=1.0)
+                    executor.shutdown(wait=False)
+                finally:
+                    cursor.execute("ROLLBACK;")
+        except Error as e:
+            print(f"Erro ao montar o dashboard: {e}")
+            return None
+
+        for futuro, nome in futuros.items():
+            if futuro not in feitos:
+                resultado['erros'][nome] = f"Tempo esgotado ({timeout}s)"
+                continue
+            try:
+                dados, duracao = futuro.result()
+                resultado['relatorios'][nome] = dados
+                resultado['tempos_ms'][nome] = duracao * 1000
+            except TimeoutError:
+                resultado['erros'][nome] = f"Tempo esgotado ({timeout}s)"
+            except Exception as e:
+                resultado['erros'][nome] = str(e).strip()
+        for nome, erro in resultado['erros'].items():
+            print(f"Erro no relatorio '{nome}' do dashboard: {erro}")
+        resultado['completo'] = not resultado['erros']
+        resultado['tempo_total_ms'] = (time.monotonic() - inicio) * 1000
+        return resultado
+
+    # Cada consulta devolve (chave, valor no resumo, valor recalculado) das divergências
+    VERIFICACOES = {
+        'os_por_status': """
+        SELECT COALESCE(r.status, b.status), r.quantidade, b.quantidade
+        FROM (SELECT status, quantidade FROM resumo_os_status WHERE quantidade <> 0) r
+        FULL JOIN (SELECT COALESCE(status, '') as status, COUNT(*) as quantidade
+                   FROM ordem_servico GROUP BY 1) b ON r.status = b.status
+        WHERE r.quantidade IS DISTINCT FROM b.quantidade;
+        """,
+        'servicos_por_mecanico': """
+        SELECT COALESCE(r.id_mecanico, b.id_mecanico),
+            ROW(r.servicos, r.execucoes_com_tempo, ROUND(r.segundos, 3))::text,
+            ROW(b.servicos, b.execucoes_com_tempo, ROUND(b.segundos, 3))::text
+        FROM (SELECT * FROM resumo_mecanico WHERE servicos <> 0 OR execucoes_com_tempo <> 0) r
+        FULL JOIN (SELECT id_mecanico, COUNT(id_servico) as servicos, COUNT(tempo_gasto) as execucoes_com_tempo,
+                          COALESCE(SUM(EXTRACT(EPOCH FROM tempo_gasto)), 0) as segundos
+                   FROM execucao_servico WHERE id_mecanico IS NOT NULL GROUP BY id_mecanico) b
+            ON r.id_mecanico = b.id_mecanico
+        WHERE (r.servicos, r.execucoes_com_tempo, ROUND(r.segundos, 3))
+            IS DISTINCT FROM (b.servicos, b.execucoes_com_tempo, ROUND(b.segundos, 3));
+        """,
+        'clientes_mais_ativos': """
+        SELECT COALESCE(r.id_solicitante, b.id_solicitante),
+            ROW(r.total_os, r.ultima_os)::text, ROW(b.total_os, b.ultima_os)::text
+        FROM (SELECT * FROM resumo_solicitante_os WHERE total_os <> 0) r
+        FULL JOIN (SELECT id_solicitante, COUNT(*) as total_os, MAX(data_abertura) as ultima_os
+                   FROM ordem_servico WHERE id_solicitante IS NOT NULL GROUP BY id_solicitante) b
+            ON r.id_solicitante = b.id_solicitante
+        WHERE (r.total_os, r.ultima_os) IS DISTINCT FROM (b.total_os, b.ultima_os);
+        """,
+    }
+
+    def verificar_resumos(self):
+        """Compara as tabelas de resumo com os dados brutos e retorna as divergências por relatório."""
+        divergencias = {}
+        for relatorio, query in self.VERIFICACOES.items():
+            resultado = self.execute_query(query)
+            if resultado is None:
+                return None
+            divergencias[relatorio] = resultado['data']
+            print(f"Resumo {relatorio}: {len(resultado['data'])} divergencias")
+        return divergencias
+
+    def reconstruir_resumos(self):
+        """Recalcula todas as tabelas de resumo a partir dos dados brutos."""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                for comando in RECONSTRUIR_RESUMOS:
+                    cursor.execute(comando)
+                conn.commit()
+                print("Resumos dos relatorios reconstruidos com sucesso.")
+                return True
+        except Exception as e:
+            print(f"Erro ao reconstruir resumos: {e}")
+            return False
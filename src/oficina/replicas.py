@@ -0,0 +1,175 @@
+import itertools
+import os
+import threading
+import time
+from functools import wraps
+
+from psycopg2.extensions import parse_dsn
+
+# Leituras em réplicas (hot standby). Métodos de CRUD somente leitura são
+# decorados com @rota_leitura; enquanto rodam, Database.get_connection entrega
+# uma conexão de uma réplica (round-robin) cujo atraso de replicação esteja
+# dentro do limite. Ficam no primário:
+#   - tudo que não é decorado (escritas e leituras via cache de entidades, que
+#     poderiam guardar um valor desatualizado depois de uma invalidação);
+#   - leituras dentro de uma Sessao;
+#   - leituras da mesma thread logo após uma escrita confirmada (ler as próprias escritas);
+#   - leituras quando nenhuma réplica está disponível ou em dia.
+#
+# Configuração (.env):
+#   DB_REPLICAS                lista separada por vírgula de host[:porta] ou DSNs/URIs
+#                              (campos ausentes vêm de DB_NAME, DB_USER, DB_PASSWORD...)
+#   DB_REPLICA_ATRASO_MAX      atraso máximo aceito, em segundos (padrão 5)
+#   DB_REPLICA_VERIFICACAO     intervalo entre medições do atraso de cada réplica (padrão 2)
+#   DB_REPLICA_JANELA_ESCRITA  segundos após uma escrita em que a thread lê do primário
+#                              (padrão: DB_REPLICA_ATRASO_MAX)
+
+PRIMARIO = 'primario'
+
+# Atraso em segundos; zero quando a réplica já aplicou tudo que recebeu (um primário
+# ocioso não gera transações e o replay_timestamp envelheceria sem haver atraso real).
+# Isso só vale com o walreceiver conectado: uma réplica isolada do primário também
+# aplica tudo que recebeu e para, então sem receptor em streaming (ou sem mensagem do
+# primário no último minuto) o resultado é NULL e a réplica fica indisponível.
+# Sem pg_read_all_stats o usuário não vê status/last_msg_receipt_time, e vale só a
+# existência do receptor.
+QUERY_ATRASO = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver
+                         WHERE COALESCE(status, 'streaming') = 'streaming'
+                           AND COALESCE(last_msg_receipt_time, now()) > now() - interval '1 minute') THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::float8;
+"""
+
+_local = threading.local()
+
+
+class ReplicaDesconectadaError(Exception):
+    pass
+
+
+def ler_replicas(params):
+    """Réplicas de DB_REPLICAS como {nome: parâmetros de conexão}, herdando os do primário."""
+    replicas = {}
+    for entrada in os.getenv('DB_REPLICAS', '').split(','):
+        entrada = entrada.strip()
+        if not entrada:
+            continue
+        config = dict(params)
+        if '=' in entrada or '://' in entrada:
+            config.update(parse_dsn(entrada))
+        else:
+            host, _, porta = entrada.partition(':')
+            config['host'] = host
+            config['port'] = porta or params['port']
+        replicas[f"{config['host']}:{config['port']}"] = config
+    return replicas
+
+
+def rota_leitura(func):
+    """Marca um método como somente leitura: suas consultas podem ir para uma réplica."""
+    @wraps(func)
+    def envolvida(*args, **kwargs):
+        _local.leituras = getattr(_local, 'leituras', 0) + 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.leituras -= 1
+    return envolvida
+
+
+def em_leitura():
+    return getattr(_local, 'leituras', 0) > 0
+
+
+def registrar_escrita():
+    _local.ultima_escrita = time.monotonic()
+
+
+def escrita_recente(janela):
+    ultima = getattr(_local, 'ultima_escrita', None)
+    return ultima is not None and time.monotonic() - ultima < janela
+
+
+# Saúde das réplicas e métricas por rota, compartilhadas pelo processo
+class EstadoReplicas:
+    MOTIVOS = ('sessao', 'escrita_recente', 'atraso', 'indisponivel')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._proxima = itertools.count()
+        self._saude = {}  # nome -> {'verificado_em', 'atraso', 'disponivel'}
+        self._rotas = {}  # rota -> {'leituras', 'outras'}
+        self._desvios = dict.fromkeys(self.MOTIVOS, 0)  # leituras que ficaram no primário
+
+    def escolher(self, nomes, medir, atraso_max, intervalo):
+        """Próxima réplica em dia, em round-robin: (nome, None) ou (None, motivo)."""
+        inicio = next(self._proxima)
+        motivo = 'indisponivel'
+        for i in range(len(nomes)):
+            nome = nomes[(inicio + i) % len(nomes)]
+            disponivel, atraso = self._verificar(nome, medir, intervalo)
+            if not disponivel:
+                continue
+            if atraso <= atraso_max:
+                return nome, None
+            motivo = 'atraso'
+        return None, motivo
+
+    def _verificar(self, nome, medir, intervalo):
+        agora = time.monotonic()
+        with self._lock:
+            saude = self._saude.setdefault(nome, {'verificado_em': None, 'atraso': None, 'disponivel': False})
+            vencida = saude['verificado_em'] is None or agora - saude['verificado_em'] >= intervalo
+            if vencida:
+                # Marca antes de medir: as outras threads seguem com a medição anterior
+                saude['verificado_em'] = agora
+        if vencida:
+            try:
+                atraso, disponivel = medir(nome), True
+            except Exception:
+                atraso, disponivel = None, False
+            with self._lock:
+                saude['atraso'], saude['disponivel'] = atraso, disponivel
+        with self._lock:
+            return saude['disponivel'], saude['atraso']
+
+    def marcar_indisponivel(self, nome):
+        with self._lock:
+            self._saude[nome] = {'verificado_em': time.monotonic(), 'atraso': None, 'disponivel': False}
+
+    def registrar(self, rota, leitura):
+        with self._lock:
+            contadores = self._rotas.setdefault(rota, {'leituras': 0, 'outras': 0})
+            contadores['leituras' if leitura else 'outras'] += 1
+
+    def registrar_desvio(self, motivo):
+        with self._lock:
+            self._desvios[motivo] += 1
+
+    def estatisticas(self):
+        agora = time.monotonic()
+        with self._lock:
+            return {
+                'rotas': {rota: dict(contadores) for rota, contadores in self._rotas.items()},
+                'desvios_para_primario': dict(self._desvios),
+                'replicas': {
+                    nome: {
+                        'disponivel': saude['disponivel'],
+                        'atraso_s': saude['atraso'],
+                        'verificado_ha_s': None if saude['verificado_em'] is None else agora - saude['verificado_em'],
+                    }
+                    for nome, saude in self._saude.items()
+                },
+            }
+
+    def limpar(self):
+        with self._lock:
+            self._rotas.clear()
+            self._desvios = dict.fromkeys(self.MOTIVOS, 0)
+
+
+estado = EstadoReplicas()
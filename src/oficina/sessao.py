@@ -0,0 +1,176 @@
+import itertools
+from contextlib import contextmanager
+
+from psycopg2.extensions import encodings
+
+from . import db as _db
+from . import replicas
+from .db import Database
+
+
+# Conexão entregue aos CRUDs dentro de uma sessão: o commit() de cada operação
+# vira no-op (a sessão confirma tudo no fim) e o autocommit não pode ser ligado
+class ConexaoDaSessao:
+    def __init__(self, conn, sessao):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_sessao', sessao)
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+    def __setattr__(self, nome, valor):
+        if nome == 'autocommit':
+            return  # a sessão é uma transação só
+        setattr(self._conn, nome, valor)
+
+    @property
+    def autocommit(self):
+        return False
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self._sessao.marcar_falha()
+        self._conn.rollback()
+
+
+# Ponto de salvamento dentro de uma sessão (ver Sessao.savepoint)
+class Savepoint:
+    def __init__(self, nome):
+        self.nome = nome
+        self.desfeito = False
+
+
+# Unidade de trabalho: agrupa chamadas de vários CRUDs numa conexão e transação.
+#
+#     with Sessao() as sessao:
+#         id_cliente = ClienteCRUD().inserir_cliente_pf(...)
+#         VeiculoCRUD().inserir_carro(..., id_cliente=id_cliente, ...)
+#         id_os = OrdemServicoCRUD().criar_ordem_servico(...)
+#         PecaCRUD().consumir_pecas(id_os, [(cod_peca, 2)])
+#
+# Se alguma operação falhar (ou o bloco levantar exceção), tudo é desfeito no fim;
+# senão há um único COMMIT. Invalidações do cache local só rodam após o COMMIT.
+class Sessao:
+    def __init__(self, db=None):
+        self.db = db or Database()
+        self.pool = None
+        self.falhou = False
+        self.confirmada = None  # True/False depois que a sessão termina
+        self._conn = None
+        self._proxy = None
+        self._pendentes = []
+        self._apos_commit = []
+        self._contador = itertools.count(1)
+
+    def __enter__(self):
+        if _db.sessao_atual() is not None:
+            raise RuntimeError("Já existe uma sessão ativa nesta thread; use savepoint() para aninhar")
+        self.pool = self.db.pool
+        self._conn = self.pool.getconn()
+        self._proxy = ConexaoDaSessao(self._conn, self)
+        _db._sessoes.atual = self
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        _db._sessoes.atual = None
+        descartar = False
+        try:
+            if tipo is None and not self.falhou:
+                self.enviar()
+                self._conn.commit()
+                self.confirmada = True
+            else:
+                self._pendentes.clear()
+                self._conn.rollback()
+                self.confirmada = False
+                if tipo is None:
+                    print("Sessao desfeita: uma das operacoes falhou")
+        except Exception as e:
+            self.confirmada = False
+            descartar = self._conn.closed != 0
+            print(f"Erro ao confirmar sessao: {e}")
+            try:
+                self._conn.rollback()
+            except Exception:
+                descartar = True
+        finally:
+            self.pool.putconn(self._conn, descartar=descartar)
+            self._conn = self._proxy = None
+        if self.confirmada:
+            # As próximas leituras da thread ficam no primário até as réplicas alcançarem
+            replicas.registrar_escrita()
+            for callback in self._apos_commit:
+                callback()
+        self._apos_commit.clear()
+        return False
+
+    def conexao(self):
+        """Conexão da sessão; antes envia os comandos enfileirados, que podem ser lidos a seguir."""
+        if self._conn is None:
+            raise RuntimeError("Sessão encerrada")
+        self.enviar()
+        return self._proxy
+
+    def marcar_falha(self):
+        self.falhou = True
+
+    def apos_commit(self, callback):
+        """Agenda `callback()` para depois do COMMIT; descartado se a sessão for desfeita."""
+        self._apos_commit.append(callback)
+
+    @contextmanager
+    def savepoint(self):
+        """Trecho que pode ser desfeito sozinho sem derrubar a sessão.
+
+        Se uma operação falhar (ou o bloco levantar exceção), volta ao savepoint e a
+        sessão segue válida; exceções são repassadas, falhas de CRUD ficam em `desfeito`.
+        """
+        conn = self.conexao()
+        ponto = Savepoint(f"sessao_{next(self._contador)}")
+        falhou_antes = self.falhou
+        cursor = conn.cursor()
+        cursor.execute(f"SAVEPOINT {ponto.nome};")
+        self.falhou = False
+        try:
+            yield ponto
+            self.enviar()
+        except BaseException:
+            ponto.desfeito = True
+            raise
+        finally:
+            if ponto.desfeito or self.falhou:
+                ponto.desfeito = True
+                self._pendentes.clear()
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {ponto.nome};")
+            else:
+                cursor.execute(f"RELEASE SAVEPOINT {ponto.nome};")
+            self.falhou = falhou_antes
+
+    def enfileirar(self, query, params=None):
+        """Guarda um comando sem retorno para ser enviado junto com os próximos.
+
+        O psycopg2 não tem modo pipeline; os comandos enfileirados vão num único
+        execute (uma ida ao banco) na próxima vez que a conexão for usada ou no COMMIT.
+        """
+        if self._conn is None:
+            raise RuntimeError("Sessão encerrada")
+        comando = self._conn.cursor().mogrify(query, params)
+        self._pendentes.append(comando.decode(encodings.get(self._conn.encoding, 'utf-8')).strip().rstrip(';'))
+
+    def executar_em_lote(self, comandos):
+        """Envia vários (query, params) independentes numa única ida ao banco."""
+        for query, params in comandos:
+            self.enfileirar(query, params)
+        self.enviar()
+
+    def enviar(self):
+        if not self._pendentes:
+            return
+        comandos, self._pendentes = self._pendentes, []
+        try:
+            self._conn.cursor().execute(";\n".join(comandos) + ";")
+        except Exception:
+            self.marcar_falha()
+            raise
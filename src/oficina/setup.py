@@ -1,109 +1,109 @@
+import re
+
+import psycopg2
+from psycopg2 import errors
+
 from .db import Database
+from .migracoes import MIGRACOES
+from .particoes import GerenciadorParticoes
 
-# Faz a criação do database a partir das querys existentes
+# Faz a criação do database aplicando as migrações pendentes
 class SetupDatabase:
+    # Chave do advisory lock que impede dois processos de migrarem ao mesmo tempo
+    LOCK_MIGRACAO = 727001
+    # Nome do índice criado por um CREATE INDEX CONCURRENTLY das migrações
+    INDICE_CONCORRENTE = re.compile(
+        r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE)
+
     def __init__(self):
         self.db = Database()
 
+    def versao_atual(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_versao;")
+            versao = cursor.fetchone()[0]
+        except errors.UndefinedTable:
+            versao = 0
+        conn.rollback()
+        return versao
+
     def criar_tabelas(self):
-        comandos = [
-            """CREATE TABLE IF NOT EXISTS solicitante (
-                id_solicitante SERIAL PRIMARY KEY
-            );""",
-            """CREATE TABLE IF NOT EXISTS cliente (
-                id_cliente SERIAL PRIMARY KEY,
-                email VARCHAR(100) NOT NULL,
-                telefone VARCHAR(15) NOT NULL,
-                endereco VARCHAR(255),
-                id_solicitante INTEGER UNIQUE REFERENCES solicitante(id_solicitante)
-            );""",
-            """CREATE TABLE IF NOT EXISTS pessoa_fisica (
-                id_cliente INTEGER PRIMARY KEY REFERENCES cliente(id_cliente),
-                cpf CHAR(11) UNIQUE NOT NULL,
-                nome VARCHAR(100),
-                data_nascimento DATE
-            );""",
-            """CREATE TABLE IF NOT EXISTS pessoa_juridica (
-                id_cliente INTEGER PRIMARY KEY REFERENCES cliente(id_cliente),
-                cnpj CHAR(14) UNIQUE NOT NULL,
-                razao_social VARCHAR(255)
-            );""",
-            """CREATE TABLE IF NOT EXISTS mecanico (
-                matricula_mec SERIAL PRIMARY KEY,
-                nome VARCHAR(100),
-                telefone VARCHAR(15),
-                especialidade VARCHAR(100),
-                tipo_mecanico VARCHAR(20),
-                id_solicitante INTEGER REFERENCES solicitante(id_solicitante)
-            );""",
-            """CREATE TABLE IF NOT EXISTS efetivo (
-                id_mecanico INTEGER PRIMARY KEY REFERENCES mecanico(matricula_mec),
-                salario NUMERIC(10,2),
-                registro_clt VARCHAR(50)
-            );""",
-            """CREATE TABLE IF NOT EXISTS freelancer (
-                id_mecanico INTEGER PRIMARY KEY REFERENCES mecanico(matricula_mec),
-                hora_servico NUMERIC(10,2)
-            );""",
-            """CREATE TABLE IF NOT EXISTS veiculo (
-                veiculo_id SERIAL PRIMARY KEY,
-                marca VARCHAR(50),
-                cor VARCHAR(30),
-                modelo VARCHAR(50),
-                ano INTEGER,
-                id_cliente INTEGER REFERENCES cliente(id_cliente)
-            );""",
-            """CREATE TABLE IF NOT EXISTS carro (
-                veiculo_id INTEGER PRIMARY KEY REFERENCES veiculo(veiculo_id),
-                numero_portas INTEGER,
-                tipo_combustivel VARCHAR(30),
-                capacidade_passageiros INTEGER
-            );""",
-            """CREATE TABLE IF NOT EXISTS moto (
-                veiculo_id INTEGER PRIMARY KEY REFERENCES veiculo(veiculo_id),
-                cilindrada INTEGER,
-                tipo_moto VARCHAR(50)
-            );""",
-            """CREATE TABLE IF NOT EXISTS ordem_servico (
-                id_os SERIAL PRIMARY KEY,
-                descricao TEXT,
-                data_abertura DATE,
-                status VARCHAR(20),
-                id_solicitante INTEGER REFERENCES solicitante(id_solicitante)
-            );""",
-            """CREATE TABLE IF NOT EXISTS servico (
-                id_servico SERIAL PRIMARY KEY,
-                tempo_estimado INTEGER,
-                valor_padrao NUMERIC(10, 2),
-                cod_os INTEGER REFERENCES ordem_servico(id_os)
-            );""",
-            """CREATE TABLE IF NOT EXISTS execucao_servico (
-                id_execucao SERIAL PRIMARY KEY,
-                id_os INTEGER REFERENCES ordem_servico(id_os),
-                id_mecanico INTEGER REFERENCES mecanico(matricula_mec),
-                id_servico INTEGER REFERENCES servico(id_servico),
-                tempo_gasto INTERVAL
-            );""",
-            """CREATE TABLE IF NOT EXISTS peca (
-                cod_peca SERIAL PRIMARY KEY,
-                nome_peca VARCHAR(100),
-                qt_estoque INTEGER,
-                valor_uni NUMERIC(10,2)
-            );""",
-            """CREATE TABLE IF NOT EXISTS utiliza_peca (
-                id_os INTEGER REFERENCES ordem_servico(id_os),
-                id_peca INTEGER REFERENCES peca(cod_peca),
-                quantidade INTEGER NOT NULL,
-                PRIMARY KEY (id_os, id_peca)
-            );"""
-        ]
+        # Caminho rápido: uma única consulta de versão quando o schema está em dia
+        if self.migrar():
+            # Schema novo ou atualizado: já cria as partições dos próximos meses; depois
+            # disso ficam com o cron (cli.py particoes criar) e a primeira OS de cada mês
+            GerenciadorParticoes().criar_particoes_futuras()
 
+    def migrar(self, ate_versao=None):
+        """Aplica as migrações pendentes; retorna quantas foram aplicadas (None se falhou)."""
+        alvo = ate_versao if ate_versao is not None else MIGRACOES[-1].versao
         try:
-            with self.db.get_connection() as conn:
+            with self.db.get_connection(sessao=False) as conn:
+                if self.versao_atual(conn) >= alvo:
+                    return 0
+                conn.autocommit = True
                 cursor = conn.cursor()
-                for comando in comandos:
-                    cursor.execute(comando)
-                conn.commit()
+                cursor.execute("SELECT pg_advisory_lock(%s);", (self.LOCK_MIGRACAO,))
+                try:
+                    cursor.execute("""CREATE TABLE IF NOT EXISTS schema_versao (
+                        versao INTEGER PRIMARY KEY,
+                        descricao VARCHAR(255),
+                        aplicada_em TIMESTAMP NOT NULL DEFAULT now()
+                    );""")
+                    # Outro processo pode ter migrado enquanto esperávamos o lock
+                    cursor.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_versao;")
+                    versao = cursor.fetchone()[0]
+                    aplicadas = 0
+                    for migracao in MIGRACOES:
+                        if versao < migracao.versao <= alvo:
+                            self._aplicar(conn, migracao)
+                            aplicadas += 1
+                            print(f" Migracao {migracao.versao} aplicada: {migracao.descricao}")
+                finally:
+                    cursor.execute("SELECT pg_advisory_unlock(%s);", (self.LOCK_MIGRACAO,))
                 print(" Tabelas criadas com sucesso.")
+                return aplicadas
         except Exception as e:
             print(f"Erro ao criar tabelas: {e}")
+            return None
+
+    def _aplicar(self, conn, migracao):
+        cursor = conn.cursor()
+        registro = ("INSERT INTO schema_versao (versao, descricao) VALUES (%s, %s);",
+                    (migracao.versao, migracao.descricao))
+        if migracao.transacional:
+            cursor.execute("BEGIN;")
+            try:
+                for comando in migracao.comandos:
+                    cursor.execute(comando)
+                cursor.execute(*registro)
+                cursor.execute("COMMIT;")
+            except psycopg2.Error:
+                cursor.execute("ROLLBACK;")
+                raise
+        else:
+            self._remover_indices_invalidos(cursor, migracao)
+            for comando in migracao.comandos:
+                cursor.execute(comando)
+            cursor.execute(*registro)
+
+    def _remover_indices_invalidos(self, cursor, migracao):
+        # Um CREATE INDEX CONCURRENTLY interrompido deixa um índice inválido que o
+        # IF NOT EXISTS não recriaria; remove antes de tentar de novo só os que esta
+        # migração vai criar (outros inválidos podem estar sendo construídos agora ou
+        # não ser das migrações). Índices pais de tabelas particionadas ficam de fora:
+        # não aceitam DROP INDEX CONCURRENTLY
+        nomes = [nome for comando in migracao.comandos for nome in self.INDICE_CONCORRENTE.findall(comando)]
+        if not nomes:
+            return
+        cursor.execute("""
+            SELECT quote_ident(n.nspname) || '.' || quote_ident(c.relname)
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE NOT i.indisvalid AND n.nspname = current_schema()
+              AND c.relkind = 'i' AND c.relname = ANY(%s);
+        """, (nomes,))
+        for (indice,) in cursor.fetchall():
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {indice};")
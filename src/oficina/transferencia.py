@@ -0,0 +1,282 @@
+import csv
+from contextlib import contextmanager
+
+from .base import BaseCRUD
+from .replicas import rota_leitura
+
+# Importação e exportação em massa via COPY, lendo/escrevendo CSV em streaming.
+# Os dados passam por uma tabela temporária (staging) e as FKs e a divisão em
+# subtipos (carro/moto) são resolvidas no próprio servidor.
+class TransferenciaCSV(BaseCRUD):
+    TAMANHO_BLOCO = 64 * 1024
+    LIMITE_LINHAS_REJEITADAS = 100
+
+    # Numa Sessao o commit, e com ele o ON COMMIT DROP, só acontece no fim dela: uma
+    # segunda importação na mesma sessão encontraria a staging da anterior
+    STAGING_PECA = """
+    DROP TABLE IF EXISTS pg_temp.stg_peca;
+    CREATE TEMP TABLE stg_peca (
+        linha BIGSERIAL,
+        cod_peca INTEGER,
+        nome_peca VARCHAR(100),
+        qt_estoque INTEGER,
+        valor_uni NUMERIC(10,2)
+    ) ON COMMIT DROP;
+    """
+
+    STAGING_VEICULO = """
+    DROP TABLE IF EXISTS pg_temp.stg_veiculo;
+    CREATE TEMP TABLE stg_veiculo (
+        linha BIGSERIAL,
+        veiculo_id INTEGER,
+        id_cliente INTEGER,
+        documento VARCHAR(14),
+        marca VARCHAR(50),
+        cor VARCHAR(30),
+        modelo VARCHAR(50),
+        ano INTEGER,
+        tipo VARCHAR(10),
+        numero_portas INTEGER,
+        tipo_combustivel VARCHAR(30),
+        capacidade_passageiros INTEGER,
+        cilindrada INTEGER,
+        tipo_moto VARCHAR(50)
+    ) ON COMMIT DROP;
+    """
+
+    STAGING_OS = """
+    DROP TABLE IF EXISTS pg_temp.stg_os;
+    CREATE TEMP TABLE stg_os (
+        linha BIGSERIAL,
+        id_os INTEGER,
+        descricao TEXT,
+        data_abertura DATE,
+        status VARCHAR(20),
+        id_solicitante INTEGER,
+        documento VARCHAR(14)
+    ) ON COMMIT DROP;
+    """
+
+    EXPORT_PECAS = """
+    SELECT cod_peca, nome_peca, qt_estoque, valor_uni FROM peca ORDER BY cod_peca
+    """
+
+    EXPORT_VEICULOS = """
+    SELECT v.veiculo_id, v.id_cliente, v.marca, v.cor, v.modelo, v.ano,
+        CASE WHEN c.veiculo_id IS NOT NULL THEN 'carro' ELSE 'moto' END as tipo,
+        c.numero_portas, c.tipo_combustivel, c.capacidade_passageiros,
+        m.cilindrada, m.tipo_moto
+    FROM veiculo v
+    LEFT JOIN carro c ON v.veiculo_id = c.veiculo_id
+    LEFT JOIN moto m ON v.veiculo_id = m.veiculo_id
+    ORDER BY v.veiculo_id
+    """
+
+    EXPORT_OS = """
+    SELECT id_os, descricao, data_abertura, status, id_solicitante
+    FROM ordem_servico ORDER BY id_os
+    """
+
+    # Resolve CPF/CNPJ para o cliente correspondente
+    DOCUMENTOS = """
+    (SELECT pf.id_cliente, pf.cpf::varchar AS documento FROM pessoa_fisica pf
+     UNION ALL
+     SELECT pj.id_cliente, pj.cnpj::varchar FROM pessoa_juridica pj)
+    """
+
+    @contextmanager
+    def _abrir(self, arquivo, modo):
+        if hasattr(arquivo, 'read') or hasattr(arquivo, 'write'):
+            yield arquivo
+        else:
+            with open(arquivo, modo, newline='', encoding='utf-8') as f:
+                yield f
+
+    def _copiar_para_staging(self, cursor, f, tabela):
+        # O cabeçalho define quais colunas do staging o arquivo preenche
+        cabecalho = next(csv.reader([f.readline()]), [])
+        colunas = [c.strip().lower() for c in cabecalho if c.strip()]
+        cursor.execute(f"SELECT * FROM {tabela} LIMIT 0;")
+        permitidas = {desc[0] for desc in cursor.description} - {'linha'}
+        invalidas = [c for c in colunas if c not in permitidas]
+        if not colunas or invalidas:
+            raise ValueError(f"Colunas inválidas no CSV: {invalidas or cabecalho}. "
+                             f"Permitidas: {sorted(permitidas)}")
+        cursor.copy_expert(
+            f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv);",
+            f, size=self.TAMANHO_BLOCO
+        )
+        cursor.execute(f"ANALYZE {tabela};")
+
+    def _rejeitar(self, cursor, tabela, condicao):
+        cursor.execute(
+            f"DELETE FROM {tabela} WHERE {condicao} RETURNING linha;"
+        )
+        linhas = sorted(row[0] for row in cursor.fetchall())
+        return len(linhas), linhas[:self.LIMITE_LINHAS_REJEITADAS]
+
+    def importar_pecas(self, arquivo, chave='cod_peca'):
+        """Sincroniza o catálogo de peças a partir de um CSV.
+
+        Linhas cuja `chave` (cod_peca ou nome_peca) já existe atualizam a peça;
+        as demais são inseridas. Com chave='cod_peca', códigos inexistentes são rejeitados.
+        """
+        if chave not in ('cod_peca', 'nome_peca'):
+            raise ValueError("chave deve ser 'cod_peca' ou 'nome_peca'")
+        try:
+            with self.db.get_connection() as conn, self._abrir(arquivo, 'r') as f:
+                cursor = conn.cursor()
+                cursor.execute(self.STAGING_PECA)
+                self._copiar_para_staging(cursor, f, 'stg_peca')
+                if chave == 'cod_peca':
+                    rejeitadas, linhas = self._rejeitar(
+                        cursor, 'stg_peca',
+                        "cod_peca IS NOT NULL AND NOT EXISTS (SELECT 1 FROM peca p WHERE p.cod_peca = stg_peca.cod_peca)"
+                    )
+                else:
+                    rejeitadas, linhas = self._rejeitar(cursor, 'stg_peca', "nome_peca IS NULL")
+                # Em caso de chave repetida no arquivo vale a última linha
+                cursor.execute(f"""
+                    UPDATE peca p SET
+                        nome_peca = COALESCE(s.nome_peca, p.nome_peca),
+                        qt_estoque = COALESCE(s.qt_estoque, p.qt_estoque),
+                        valor_uni = COALESCE(s.valor_uni, p.valor_uni)
+                    FROM (SELECT DISTINCT ON ({chave}) * FROM stg_peca
+                          WHERE {chave} IS NOT NULL ORDER BY {chave}, linha DESC) s
+                    WHERE p.{chave} = s.{chave};
+                """)
+                atualizadas = cursor.rowcount
+                cursor.execute(f"""
+                    INSERT INTO peca (nome_peca, qt_estoque, valor_uni)
+                    SELECT nome_peca, COALESCE(qt_estoque, 0), valor_uni FROM (
+                        SELECT DISTINCT ON (COALESCE({chave}::text, linha::text)) *
+                        FROM stg_peca s
+                        WHERE NOT EXISTS (SELECT 1 FROM peca p WHERE p.{chave} = s.{chave})
+                        ORDER BY COALESCE({chave}::text, linha::text), linha DESC
+                    ) novas ORDER BY linha;
+                """)
+                inseridas = cursor.rowcount
+                conn.commit()
+        except Exception as e:
+            print(f"Erro ao importar pecas: {e}")
+            return None
+        print(f"Pecas importadas: {atualizadas} atualizadas, {inseridas} inseridas, {rejeitadas} rejeitadas")
+        return {'atualizadas': atualizadas, 'inseridas': inseridas,
+                'rejeitadas': rejeitadas, 'linhas_rejeitadas': linhas}
+
+    def importar_veiculos(self, arquivo):
+        """Importa veículos de um CSV com a coluna `tipo` ('carro' ou 'moto').
+
+        O dono é indicado por `id_cliente` ou por `documento` (CPF/CNPJ); o
+        `veiculo_id` do arquivo é ignorado e novos ids são gerados.
+        """
+        try:
+            with self.db.get_connection() as conn, self._abrir(arquivo, 'r') as f:
+                cursor = conn.cursor()
+                cursor.execute(self.STAGING_VEICULO)
+                self._copiar_para_staging(cursor, f, 'stg_veiculo')
+                cursor.execute(f"""
+                    UPDATE stg_veiculo s SET id_cliente = d.id_cliente
+                    FROM {self.DOCUMENTOS} d
+                    WHERE s.id_cliente IS NULL AND s.documento = d.documento;
+                """)
+                rejeitadas, linhas = self._rejeitar(
+                    cursor, 'stg_veiculo',
+                    "lower(tipo) NOT IN ('carro', 'moto') OR tipo IS NULL OR id_cliente IS NULL "
+                    "OR NOT EXISTS (SELECT 1 FROM cliente c WHERE c.id_cliente = stg_veiculo.id_cliente)"
+                )
+                cursor.execute(
+                    "UPDATE stg_veiculo SET veiculo_id = nextval(pg_get_serial_sequence('veiculo', 'veiculo_id'));"
+                )
+                cursor.execute("""
+                    INSERT INTO veiculo (veiculo_id, marca, cor, modelo, ano, id_cliente)
+                    SELECT veiculo_id, marca, cor, modelo, ano, id_cliente FROM stg_veiculo ORDER BY linha;
+                """)
+                inseridos = cursor.rowcount
+                cursor.execute("""
+                    INSERT INTO carro (veiculo_id, numero_portas, tipo_combustivel, capacidade_passageiros)
+                    SELECT veiculo_id, numero_portas, tipo_combustivel, capacidade_passageiros
+                    FROM stg_veiculo WHERE lower(tipo) = 'carro';
+                """)
+                carros = cursor.rowcount
+                cursor.execute("""
+                    INSERT INTO moto (veiculo_id, cilindrada, tipo_moto)
+                    SELECT veiculo_id, cilindrada, tipo_moto FROM stg_veiculo WHERE lower(tipo) = 'moto';
+                """)
+                motos = cursor.rowcount
+                cursor.execute("SELECT DISTINCT id_cliente FROM stg_veiculo;")
+                clientes = [row[0] for row in cursor.fetchall()]
+                self._notificar_cache(cursor, 'veiculos_cliente', clientes)
+                conn.commit()
+                self._invalidar_cache('veiculos_cliente', clientes)
+        except Exception as e:
+            print(f"Erro ao importar veiculos: {e}")
+            return None
+        print(f"Veiculos importados: {inseridos} ({carros} carros, {motos} motos), {rejeitadas} rejeitados")
+        return {'inseridos': inseridos, 'carros': carros, 'motos': motos,
+                'rejeitadas': rejeitadas, 'linhas_rejeitadas': linhas}
+
+    def importar_ordens_servico(self, arquivo):
+        """Importa ordens de serviço de um CSV.
+
+        O solicitante é indicado por `id_solicitante` ou pelo `documento` (CPF/CNPJ)
+        do cliente; `data_abertura` e `status` vazios assumem hoje e 'Aberta'.
+        """
+        try:
+            with self.db.get_connection() as conn, self._abrir(arquivo, 'r') as f:
+                cursor = conn.cursor()
+                cursor.execute(self.STAGING_OS)
+                self._copiar_para_staging(cursor, f, 'stg_os')
+                cursor.execute(f"""
+                    UPDATE stg_os s SET id_solicitante = c.id_solicitante
+                    FROM {self.DOCUMENTOS} d
+                    JOIN cliente c ON c.id_cliente = d.id_cliente
+                    WHERE s.id_solicitante IS NULL AND s.documento = d.documento;
+                """)
+                rejeitadas, linhas = self._rejeitar(
+                    cursor, 'stg_os',
+                    "id_solicitante IS NULL OR NOT EXISTS "
+                    "(SELECT 1 FROM solicitante so WHERE so.id_solicitante = stg_os.id_solicitante)"
+                )
+                # Meses do arquivo ainda sem partição iriam para a partição padrão
+                cursor.execute("""
+                    SELECT COUNT(*) FROM fn_criar_particoes_os(
+                        (SELECT MIN(COALESCE(data_abertura, CURRENT_DATE)) FROM stg_os),
+                        (SELECT MAX(COALESCE(data_abertura, CURRENT_DATE)) + 1 FROM stg_os));
+                """)
+                cursor.execute("""
+                    INSERT INTO ordem_servico (descricao, data_abertura, status, id_solicitante)
+                    SELECT descricao, COALESCE(data_abertura, CURRENT_DATE), COALESCE(status, 'Aberta'), id_solicitante
+                    FROM stg_os ORDER BY linha;
+                """)
+                inseridas = cursor.rowcount
+                conn.commit()
+        except Exception as e:
+            print(f"Erro ao importar ordens de servico: {e}")
+            return None
+        print(f"Ordens de servico importadas: {inseridas} inseridas, {rejeitadas} rejeitadas")
+        return {'inseridas': inseridas, 'rejeitadas': rejeitadas, 'linhas_rejeitadas': linhas}
+
+    def _exportar(self, query, arquivo, descricao):
+        try:
+            with self.db.get_connection() as conn, self._abrir(arquivo, 'w') as f:
+                cursor = conn.cursor()
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true);", f,
+                                   size=self.TAMANHO_BLOCO)
+                print(f"Exportacao de {descricao}: {cursor.rowcount} linhas")
+                return cursor.rowcount
+        except Exception as e:
+            print(f"Erro ao exportar {descricao}: {e}")
+            return None
+
+    @rota_leitura
+    def exportar_pecas(self, arquivo):
+        return self._exportar(self.EXPORT_PECAS, arquivo, "pecas")
+
+    @rota_leitura
+    def exportar_veiculos(self, arquivo):
+        return self._exportar(self.EXPORT_VEICULOS, arquivo, "veiculos")
+
+    @rota_leitura
+    def exportar_ordens_servico(self, arquivo):
+        return self._exportar(self.EXPORT_OS, arquivo, "ordens de servico")
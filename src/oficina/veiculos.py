@@ -2,20 +2,34 @@ from .base import BaseCRUD
 
 # Faz os inserts e listagem dos veículos associados aos clientes
 class VeiculoCRUD(BaseCRUD):
+    INSERT_VEICULO = "INSERT INTO veiculo (marca, cor, modelo, ano, id_cliente) VALUES (%s, %s, %s, %s, %s) RETURNING veiculo_id;"
+    INSERT_CARRO = "INSERT INTO carro (veiculo_id, numero_portas, tipo_combustivel, capacidade_passageiros) VALUES (%s, %s, %s, %s);"
+    INSERT_MOTO = "INSERT INTO moto (veiculo_id, cilindrada, tipo_moto) VALUES (%s, %s, %s);"
+    QUERY_LISTAR_CLIENTE = """
+        SELECT 
+            v.veiculo_id, v.marca, v.cor, v.modelo, v.ano,
+            CASE WHEN c.veiculo_id IS NOT NULL THEN 'Carro' ELSE 'Moto' END as tipo_veiculo,
+            COALESCE(
+                CONCAT(c.numero_portas, ' portas, ', c.tipo_combustivel, ', ', c.capacidade_passageiros, ' passageiros'),
+                CONCAT(m.cilindrada, 'cc, ', m.tipo_moto)
+            ) as detalhes
+        FROM veiculo v
+        LEFT JOIN carro c ON v.veiculo_id = c.veiculo_id
+        LEFT JOIN moto m ON v.veiculo_id = m.veiculo_id
+        WHERE v.id_cliente = %s
+        ORDER BY v.veiculo_id;
+        """
+
     def inserir_carro(self, marca, cor, modelo, ano, id_cliente, numero_portas, tipo_combustivel, capacidade_passageiros):
         try:
             with self.db.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO veiculo (marca, cor, modelo, ano, id_cliente) VALUES (%s, %s, %s, %s, %s) RETURNING veiculo_id;",
-                    (marca, cor, modelo, ano, id_cliente)
-                )
+                self._executar(cursor, self.INSERT_VEICULO, (marca, cor, modelo, ano, id_cliente))
                 veiculo_id = cursor.fetchone()[0]
-                cursor.execute(
-                    "INSERT INTO carro (veiculo_id, numero_portas, tipo_combustivel, capacidade_passageiros) VALUES (%s, %s, %s, %s);",
-                    (veiculo_id, numero_portas, tipo_combustivel, capacidade_passageiros)
-                )
+                self._executar(cursor, self.INSERT_CARRO, (veiculo_id, numero_portas, tipo_combustivel, capacidade_passageiros))
+                self._notificar_cache(cursor, 'veiculos_cliente', [id_cliente])
                 conn.commit()
+                self._invalidar_cache('veiculos_cliente', [id_cliente])
                 return veiculo_id
         except Exception as e:
             print(f"Erro ao inserir carro: {e}")
@@ -25,34 +39,56 @@ class VeiculoCRUD(BaseCRUD):
         try:
             with self.db.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO veiculo (marca, cor, modelo, ano, id_cliente) VALUES (%s, %s, %s, %s, %s) RETURNING veiculo_id;",
-                    (marca, cor, modelo, ano, id_cliente)
-                )
+                self._executar(cursor, self.INSERT_VEICULO, (marca, cor, modelo, ano, id_cliente))
                 veiculo_id = cursor.fetchone()[0]
-                cursor.execute(
-                    "INSERT INTO moto (veiculo_id, cilindrada, tipo_moto) VALUES (%s, %s, %s);",
-                    (veiculo_id, cilindrada, tipo_moto)
-                )
+                self._executar(cursor, self.INSERT_MOTO, (veiculo_id, cilindrada, tipo_moto))
+                self._notificar_cache(cursor, 'veiculos_cliente', [id_cliente])
                 conn.commit()
+                self._invalidar_cache('veiculos_cliente', [id_cliente])
                 return veiculo_id
         except Exception as e:
             print(f"Erro ao inserir moto: {e}")
             return None
 
+    def _inserir_veiculos(self, cursor, linhas, inserir_subtipo):
+        # linhas: (marca, cor, modelo, ano, id_cliente, *campos do subtipo)
+        ids = self._reservar_ids(cursor, 'veiculo', 'veiculo_id', len(linhas))
+        self._inserir_multiplos(
+            cursor,
+            "INSERT INTO veiculo (veiculo_id, marca, cor, modelo, ano, id_cliente) VALUES %s;",
+            [(veiculo_id,) + linha[:5] for veiculo_id, linha in zip(ids, linhas)]
+        )
+        inserir_subtipo(cursor, [(veiculo_id,) + linha[5:] for veiculo_id, linha in zip(ids, linhas)])
+        return ids
+
+    def _notificar_lote(self, cursor, linhas, ids):
+        # id_cliente é o 5º campo de cada linha
+        self._notificar_cache(cursor, 'veiculos_cliente', sorted({linha[4] for linha in linhas}))
+
+    def _executar_lote_veiculos(self, registros, campos, inserir, descricao):
+        resultado = self._executar_lote(registros, campos, inserir, descricao, apos_inserir=self._notificar_lote)
+        if resultado is not None:
+            registros_inseridos = [r for r, id_ in zip(registros, resultado['ids']) if id_ is not None]
+            self._invalidar_cache('veiculos_cliente', {r['id_cliente'] for r in registros_inseridos})
+        return resultado
+
+    def inserir_carro_lote(self, carros):
+        """Insere vários carros (dicts com os argumentos de inserir_carro) em uma transação."""
+        def inserir(cursor, linhas):
+            return self._inserir_veiculos(cursor, linhas, lambda cur, sub: self._inserir_multiplos(
+                cur, "INSERT INTO carro (veiculo_id, numero_portas, tipo_combustivel, capacidade_passageiros) VALUES %s;", sub))
+        campos = ('marca', 'cor', 'modelo', 'ano', 'id_cliente',
+                  'numero_portas', 'tipo_combustivel', 'capacidade_passageiros')
+        return self._executar_lote_veiculos(list(carros), campos, inserir, "carros")
+
+    def inserir_moto_lote(self, motos):
+        """Insere várias motos (dicts com os argumentos de inserir_moto) em uma transação."""
+        def inserir(cursor, linhas):
+            return self._inserir_veiculos(cursor, linhas, lambda cur, sub: self._inserir_multiplos(
+                cur, "INSERT INTO moto (veiculo_id, cilindrada, tipo_moto) VALUES %s;", sub))
+        campos = ('marca', 'cor', 'modelo', 'ano', 'id_cliente', 'cilindrada', 'tipo_moto')
+        return self._executar_lote_veiculos(list(motos), campos, inserir, "motos")
+
     def listar_veiculos_cliente(self, id_cliente):
-        query = """
-        SELECT 
-            v.veiculo_id, v.marca, v.cor, v.modelo, v.ano,
-            CASE WHEN c.veiculo_id IS NOT NULL THEN 'Carro' ELSE 'Moto' END as tipo_veiculo,
-            COALESCE(
-                CONCAT(c.numero_portas, ' portas, ', c.tipo_combustivel, ', ', c.capacidade_passageiros, ' passageiros'),
-                CONCAT(m.cilindrada, 'cc, ', m.tipo_moto)
-            ) as detalhes
-        FROM veiculo v
-        LEFT JOIN carro c ON v.veiculo_id = c.veiculo_id
-        LEFT JOIN moto m ON v.veiculo_id = m.veiculo_id
-        WHERE v.id_cliente = %s
-        ORDER BY v.veiculo_id;
-        """
-        return self.execute_query(query, (id_cliente,))
+        return self._em_cache('veiculos_cliente', id_cliente,
+                              lambda: self.execute_query(self.QUERY_LISTAR_CLIENTE, (id_cliente,)))